@@ -53,4 +53,6 @@ setup(
     url='http://github.com/dvklopfenstein/enrichmentanalysis',
     description='Perform enrichment analysis on any IDs and associations',
     install_requires=get_install_requires(),
+    # Optional: Write results into Parquet files
+    extras_require={'parquet': ['pyarrow']},
 )
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Compile an association file into arrays which run_enrichment.py loads memory-mapped.
+
+Usage:
+    compile_associations.py <associations> [options]
+
+    run_enrichment.py uses the compiled association while the association
+    file's size and modification time are unchanged. If only the modification
+    time changed, the file's hash is compared.
+
+Options:
+  -h --help       Show usage
+  -o --dir=DIR    Directory for the compiled association (default: <associations>.cache)
+"""
+
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+from docopt import docopt
+from enrichmentanalysis.file_utils import clean_args
+from enrichmentanalysis.file_utils import compile_associations
+
+
+def main():
+    """Compile an association file into arrays which run_enrichment.py loads memory-mapped."""
+    docargs = docopt(__doc__)
+    args = clean_args(docargs)
+    compile_associations(args['associations'], args.get('dir'))
+
+
+if __name__ == '__main__':
+    main()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
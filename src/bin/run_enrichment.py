@@ -4,13 +4,26 @@
 Usage:
     run_enrichment.py <study_ids> <population_ids> <associations> [options]
 
+    <study_ids> may be a comma-separated list of study files. Each study's output
+    files are then prefixed with the study file's name.
+
+    If a tsv or csv table is written to stdout ('-'), all messages are written to stderr.
+
 Options:
   -h --help       Show usage
   -a --alpha=A    Alpha for multiple-test correction [default: 0.05]
   -m --methods=M1,M2  Methods for multiple-test correction [default: fdr_bh]
+  --pvalcalc=FNC  Uncorrected p-value function [default: fisher_scipy_stats]
+  --permutations=N    Random study gene sets drawn for method wy_minp [default: 1000]
+  --permutation_seed=S  Seed of the random study gene sets [default: 0]
+  --terms=TERMS   Report 'all' terms or only 'study_hit' terms [default: all]
+  -j --jobs=N     Number of processes used to run many studies [default: 1]
+  --columnar      Store results in columns; create result records only when reporting
+  --result_cache=DIR  Save results in DIR; identical runs of a study load the saved results
   --xlsx=XLSX     Write enrichment analysis into a xlsx file [default: enrichment.xlsx]
-  --tsv=TSV       Write enrichment analysis into a tsv file
-  --csv=CSV       Write enrichment analysis into a csv file
+  --tsv=TSV       Write enrichment analysis into a tsv file ('-' for stdout, *.gz to compress)
+  --csv=CSV       Write enrichment analysis into a csv file ('-' for stdout, *.gz to compress)
+  --parquet=PQ    Write enrichment analysis of all studies into one Parquet file (needs pyarrow)
   --ids0=NF       Write list of identifiers that were not found [default: ids_found.csv]
   --ids1=F        Write list of identifiers that were found [default: ids_notfound.csv]
   --prefix=PREFIX  Add a prefix to all output files
@@ -22,44 +35,115 @@ Options:
 __copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
 __author__ = "DV Klopfenstein"
 
-# import os
-# import sys
+import os
+import sys
+import contextlib
+import collections as cx
 from docopt import docopt
 from enrichmentanalysis.file_utils import read_ids
 from enrichmentanalysis.file_utils import prepend
 from enrichmentanalysis.file_utils import clean_args
 from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_results import wr_results_tsv
+from enrichmentanalysis.wr_results import wr_results_csv
+from enrichmentanalysis.wr_results import wr_results_xlsx
+from enrichmentanalysis.wr_parquet import WrParquet
 from enrichmentanalysis.cli import get_enrichment_run
+from enrichmentanalysis.enrich_parallel import run_studies_parallel
 
 
 def main():
     """Enrichment analysis with user-provided population and associations."""
     docargs = docopt(__doc__)
     args = clean_args(docargs)
+    # A table written to stdout ('-') is the only output on stdout; messages go to stderr
+    if '-' in (args.get('tsv'), args.get('csv')):
+        with _stdout_to_stderr() as stdout:
+            _run(args, stdout)
+    else:
+        _run(args, sys.stdout)
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """Send everything written to stdout to stderr. Yield a stream to the original stdout."""
+    sys.stdout.flush()
+    fd_stdout = os.dup(1)
+    os.dup2(2, 1)
+    stdout = os.fdopen(fd_stdout, 'w')
+    try:
+        yield stdout
+    finally:
+        sys.stdout.flush()
+        stdout.flush()
+        os.dup2(fd_stdout, 1)
+        stdout.close()
+
+def _run(args, stdout):
+    """Run enrichments on all studies and write the results. Tables for '-' go to stdout."""
     print(args)
 
     objrun = get_enrichment_run(args)  # EnrichmentRun
     # Run Enrichment
-    stu_dct = read_ids(args['study_ids'])
-    stu_ids = stu_dct['ids']
-    objresults = objrun.run_study(stu_ids, stu_dct.get('name'))  # EnrichmentResults
-    # Write IDs found and not found to files
+    fin_studies = list(cx.OrderedDict.fromkeys(args['study_ids'].split(',')))
+    name2ids = {fin:read_ids(fin)['ids'] for fin in fin_studies}
+    jobs = int(args['jobs'])
+    if jobs == 1:
+        name_results = ((fin, objrun.run_study(name2ids[fin], fin, sys.stdout, args['terms']))
+                        for fin in fin_studies)
+    else:
+        name_results = run_studies_parallel(objrun, name2ids, jobs, args['terms'])
     prefix = args['prefix'] if 'prefix' in args else None
+    # One Parquet file for all studies, having a study column if there are many studies
+    objpq = None
+    if 'parquet' in args:
+        objpq = WrParquet(prepend(prefix, args['parquet']), study_column=len(fin_studies) != 1)
+    # Parquet rows are written in the order of the study files, as studies may finish in any order
+    fin2pending = {}
+    fins_pq = iter(fin_studies)
+    fin_pq = next(fins_pq)
+    for fin, objresults in name_results:  # EnrichmentResults
+        if len(fin_studies) != 1:
+            prefix = '{PRE}{STUDY}_'.format(
+                PRE=args.get('prefix', ''), STUDY=os.path.basename(fin))
+        _wr_results(objresults, name2ids[fin], objrun, args, prefix, stdout)
+        if objpq is not None:
+            fin2pending[fin] = objresults
+            while fin_pq in fin2pending:
+                _wr_parquet(objpq, fin_pq, fin2pending.pop(fin_pq), args)
+                fin_pq = next(fins_pq, None)
+    if objpq is not None:
+        objpq.close()
+
+def _wr_parquet(objpq, fin, objresults, args):
+    """Write the enrichment results for one study into the Parquet file of all studies."""
+    idxs = objresults.get_idxs_cond(_get_pval(args), args.get('pval_field'))
+    objpq.wr_results(objresults.results, idxs, os.path.basename(fin))
+
+def _get_pval(args):
+    """Get the maximum p-value of the results to report."""
+    return float(args['pval']) if 'pval' in args else None
+
+def _wr_results(objresults, stu_ids, objrun, args, prefix, stdout):
+    """Write the enrichment results for one study."""
+    # Write IDs found and not found to files
     objresults.wr_found(prepend(prefix, args['ids1']))
     objresults.wr_notfound(prepend(prefix, args['ids0']),
                            stu_ids.union(objrun.args['pop_ids']))
     # Write Pathway Enrichment Analysis to a file
-    pval = float(args['pval']) if 'pval' in args else None
+    pval = _get_pval(args)
     results = objresults.get_results_cond(pval, args.get('pval_field'))
     # Print results
     objrpt = ReportResults(results)  #, objrun.objmethods)
-    objrpt.prt_results()
+    objrpt.prt_results(sys.stdout)
+    # Write tables without holding all formatted rows in memory
+    pval_field = args.get('pval_field')
     if 'xlsx' in args:
-        objrpt.wrxlsx(args['xlsx'])
-    if 'tsv' in args:
-        objrpt.wrtsv(args['tsv'])
-    if 'csv' in args:
-        objrpt.wrcsv(args['csv'])
+        wr_results_xlsx(prepend(prefix, args['xlsx']), objresults, pval, pval_field)
+    for key, wr_results in [('tsv', wr_results_tsv), ('csv', wr_results_csv)]:
+        if key in args:
+            fout = prepend(prefix, args[key])
+            with contextlib.redirect_stdout(stdout if fout == '-' else sys.stdout):
+                wr_results(fout, objresults, pval, pval_field)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Serve enrichment analyses of studies, loading the populations and associations once.
+
+Usage:
+    serve_enrichment.py <population_ids> <associations> [options]
+
+    <population_ids> and <associations> may be comma-separated lists of the same
+    length to serve many runs. Each run is named by its population file's name.
+    Send studies as JSON to POST /run; list the runs with GET /runs.
+
+Options:
+  -h --help       Show usage
+  -a --alpha=A    Alpha for multiple-test correction [default: 0.05]
+  -m --methods=M1,M2  Methods for multiple-test correction [default: fdr_bh]
+  --pvalcalc=FNC  Uncorrected p-value function [default: fisher_scipy_stats]
+  --permutations=N    Random study gene sets drawn for method wy_minp [default: 1000]
+  --permutation_seed=S  Seed of the random study gene sets [default: 0]
+  --columnar      Store results in columns; create result records only when reporting
+  --result_cache=DIR  Save results in DIR; identical runs of a study load the saved results
+  --host=HOST     Host to serve on [default: 127.0.0.1]
+  --port=PORT     Port to serve on [default: 8080]
+  --socket=PATH   Serve on a Unix socket instead of on a host and port
+  -j --jobs=N     Number of studies run at the same time [default: 4]
+  -v --verbose    Log requests and enrichment runs to stdout
+"""
+
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+from docopt import docopt
+from enrichmentanalysis.file_utils import clean_args
+from enrichmentanalysis.cli import get_enrichment_run
+from enrichmentanalysis.server import EnrichmentServer
+from enrichmentanalysis.server import get_address
+from enrichmentanalysis.server import prt_address
+
+
+def main():
+    """Serve enrichment analyses of studies, loading the populations and associations once."""
+    docargs = docopt(__doc__)
+    args = clean_args(docargs)
+    fins_pop = args['population_ids'].split(',')
+    fins_assc = args['associations'].split(',')
+    assert len(fins_pop) == len(fins_assc), \
+        "NUMBER OF POPULATIONS({P}) != NUMBER OF ASSOCIATIONS({A})".format(
+            P=len(fins_pop), A=len(fins_assc))
+    name2objrun = {}
+    for fin_pop, fin_assc in zip(fins_pop, fins_assc):
+        kws = dict(args, population_ids=fin_pop, associations=fin_assc)
+        name2objrun[os.path.basename(fin_pop)] = get_enrichment_run(kws)
+    log = sys.stdout if args.get('verbose') else None
+    objsrv = EnrichmentServer(name2objrun, int(args['jobs']), log)
+    address = get_address(args)
+    prt_address(address)
+    try:
+        objsrv.serve_forever(address)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
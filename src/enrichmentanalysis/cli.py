@@ -4,18 +4,24 @@ __copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
 __author__ = "DV Klopfenstein"
 
 from enrichmentanalysis.file_utils import read_ids
-from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.file_utils import read_associations_cached
 from enrichmentanalysis.enrich_run import EnrichmentRun
 
 
 def get_enrichment_run(args):
     """Return EnrichmentRun containing population IDs, association, alpha ane methods."""
     pop_dct = read_ids(args['population_ids'])
-    assc = read_associations(args['associations'])
+    # Use the compiled association if it is fresh. Otherwise keep only population associations
+    assc = read_associations_cached(args['associations'], pop_dct['ids'])
     methods = args['methods'].split(',')
     return EnrichmentRun(pop_dct['ids'], assc,
                          alpha=float(args['alpha']),
                          methods=methods,
+                         pvalcalc=args.get('pvalcalc', 'fisher_scipy_stats'),
+                         columnar=args.get('columnar', False),
+                         result_cache=args.get('result_cache'),
+                         permutations=int(args.get('permutations', 1000)),
+                         permutation_seed=int(args.get('permutation_seed', 0)),
                          name=pop_dct.get('name'))
 
 
@@ -0,0 +1,111 @@
+"""Run enrichment analyses from an asyncio event loop without blocking it.
+
+Studies are run in an executor: the event loop's default thread pool, or any given executor.
+At most jobs studies are run at the same time. A study submitted while an identical study
+(the same study IDs and terms) is running waits for the running study's results.
+"""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import asyncio
+import functools
+import collections as cx
+from enrichmentanalysis.enrich_results import EnrichmentResults
+from enrichmentanalysis.result_cache import get_digest
+
+
+class AsyncRunner():
+    """Run the studies of one EnrichmentRun in an executor from one event loop."""
+
+    def __init__(self, objrun, jobs=4):
+        self.objrun = objrun
+        self.loop = asyncio.get_running_loop()
+        # Bounds the number of studies run at the same time
+        self.semaphore = asyncio.Semaphore(jobs)
+        # Studies being run: (hash of study IDs, terms) -> InFlight
+        self.key2inflight = {}
+        # Number of studies which waited for an identical running study
+        self.coalesced = 0
+
+    async def run_study(self, study_ids, study_name, log=None, terms='all', executor=None):
+        """Run an enrichment analysis, sharing the run of an identical study in flight.
+
+        If every caller waiting on a study is cancelled, the study is cancelled.
+        A study already running in the executor finishes, but its results are not used.
+        It holds its job until it finishes, so at most jobs studies are ever running.
+        """
+        key = (get_study_key(study_ids), terms)
+        inflight = self.key2inflight.get(key)
+        if inflight is None:
+            task = self.loop.create_task(
+                self._run_study(study_ids, study_name, log, terms, executor))
+            inflight = InFlight(task)
+            self.key2inflight[key] = inflight
+            task.add_done_callback(functools.partial(self._rm_inflight, key, inflight))
+        else:
+            self.coalesced += 1
+        inflight.waiters += 1
+        try:
+            objres = await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            inflight.waiters -= 1
+            if inflight.waiters == 0:
+                inflight.task.cancel()
+            raise
+        inflight.waiters -= 1
+        if not objres or objres.name == study_name:
+            return objres
+        # The same results, named as this caller requested
+        return EnrichmentResults(
+            objres.study_ids, objres.results, self.objrun, study_name, objres.terms)
+
+    async def run_studies(self, name2studyids, log=None, terms='all', executor=None):
+        """Run enrichment analyses on many studies. Return results in the order given."""
+        names = list(name2studyids)
+        coros = [self.run_study(name2studyids[nm], nm, log, terms, executor) for nm in names]
+        return cx.OrderedDict(zip(names, await asyncio.gather(*coros)))
+
+    async def _run_study(self, study_ids, study_name, log, terms, executor):
+        """Run one enrichment analysis in the executor when fewer than jobs studies are running."""
+        # Cancelled while waiting for a job: No job is held
+        await self.semaphore.acquire()
+        try:
+            future = self.loop.run_in_executor(executor, functools.partial(
+                self.objrun.run_study, study_ids, study_name, log, terms))
+        except BaseException:
+            self.semaphore.release()
+            raise
+        # Cancelled while running: The job is held until the executor finishes the study
+        future.add_done_callback(self._release)
+        return await asyncio.shield(future)
+
+    def _release(self, future):
+        """Release a job after the executor finishes a study."""
+        self.semaphore.release()
+        # Results of a cancelled caller are not used; neither are their exceptions
+        if not future.cancelled():
+            future.exception()
+
+    def _rm_inflight(self, key, inflight, _task):
+        """Forget a study after it is finished."""
+        if self.key2inflight.get(key) is inflight:
+            del self.key2inflight[key]
+
+
+class InFlight():
+    """A study being run and the number of callers waiting for its results."""
+
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+def get_study_key(study_ids):
+    """Return a hash of a set of study IDs."""
+    return get_digest(sorted(str(s) for s in set(study_ids)))
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,121 @@
+"""Enrichment results for one study stored as columns in a NumPy structured array."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import numpy as np
+from enrichmentanalysis.pvalcalc import PvalCalcBase
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+
+
+class EnrichmentColumns():
+    """Enrichment results for one study stored as columns in a NumPy structured array.
+
+    Iterating or indexing returns EnrichmentRecords, which are created only when requested.
+    """
+
+    dtype_base = [
+        ('term_idx', np.int32),
+        ('stu_num', np.int64),
+        ('pop_num', np.int64),
+        ('stu_ratio', np.float64),
+        ('pop_ratio', np.float64),
+        ('enrichment', 'U1'),
+        ('pval_uncorr', np.float64)]
+
+    def __init__(self, arr, study_tot, objrun, studyitems):
+        # One row per term. Fields: dtype_base, then one corrected p-value per method
+        self.arr = arr
+        self.study_tot = study_tot
+        self.objrun = objrun
+        self.studyitems = studyitems
+        self.ntobj_mult, self.prtfmt, self.ntobj = objrun.get_rec_attrs()
+
+    @classmethod
+    def from_counts(cls, objrun, term_idxs, study_cnts, study_tot, pvals, studyitems):
+        """Return columns filled with the counts, ratios, and uncorrected p-values of terms."""
+        fieldnames = [nt.fieldname for nt in objrun.objmethods.methods]
+        arr = np.zeros(len(term_idxs), dtype=cls.dtype_base + [(f, np.float64) for f in fieldnames])
+        arr['term_idx'] = term_idxs
+        arr['stu_num'] = study_cnts
+        arr['pop_num'] = objrun.index.pop_cnts[term_idxs]
+        if study_tot != 0:
+            arr['stu_ratio'] = arr['stu_num']/float(study_tot)
+        arr['pop_ratio'] = arr['pop_num']/float(objrun.pop_tot)
+        arr['enrichment'] = 'p'
+        if study_tot != 0:
+            arr['enrichment'][arr['stu_ratio'] > arr['pop_ratio']] = 'e'
+        arr['pval_uncorr'] = pvals
+        return cls(arr, study_tot, objrun, studyitems)
+
+    def __len__(self):
+        return len(self.arr)
+
+    def __iter__(self):
+        for idx in range(len(self.arr)):
+            yield self.get_rec(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.get_rec(i) for i in range(*idx.indices(len(self.arr)))]
+        return self.get_rec(idx)
+
+    def get_termids(self):
+        """Return the term IDs in the order of the rows."""
+        terms = self.objrun.index.terms
+        return [terms[i] for i in self.arr['term_idx']]
+
+    def set_pvals_corrected(self, pvals_corrected):
+        """Set the corrected p-values of each method, given in the order of the methods."""
+        num = len(self.arr)
+        for fieldname, pvals in zip(self.ntobj_mult._fields, pvals_corrected):
+            self.arr[fieldname] = pvals[:num]
+
+    def get_recs(self):
+        """Return EnrichmentRecords for all rows, converting each column to Python values once."""
+        arr = self.arr
+        objrun = self.objrun
+        terms = objrun.index.terms
+        ntpval = PvalCalcBase.ntpval
+        ntobj_mult = self.ntobj_mult
+        study_tot = self.study_tot
+        pop_tot = objrun.pop_tot
+        flds = ('term_idx', 'pval_uncorr', 'stu_num', 'stu_ratio', 'pop_num', 'pop_ratio',
+                'enrichment')
+        cols = [arr[f].tolist() for f in flds]
+        multitests = zip(*[arr[f].tolist() for f in ntobj_mult._fields])
+        recs = []
+        for (term_idx, pval, stu_num, stu_ratio, pop_num, pop_ratio, enrichment), mult in zip(
+                zip(*cols), multitests):
+            ntp = ntpval(pval, stu_num, study_tot, stu_ratio, pop_num, pop_tot, pop_ratio,
+                         enrichment)
+            rec = EnrichmentRecord(terms[term_idx], ntp, studyitems=self.studyitems)
+            rec.multitests = ntobj_mult._make(mult)
+            rec.prtfmt = self.prtfmt
+            rec.ntobj = self.ntobj
+            recs.append(rec)
+        return recs
+
+    def get_rec(self, idx):
+        """Return an EnrichmentRecord for one row."""
+        row = self.arr[idx]
+        objrun = self.objrun
+        term_idx = int(row['term_idx'])
+        termid = objrun.index.terms[term_idx]
+        ntpval = PvalCalcBase.ntpval(
+            pval_uncorr=float(row['pval_uncorr']),
+            study_cnt=int(row['stu_num']),
+            study_tot=self.study_tot,
+            study_ratio=float(row['stu_ratio']),
+            pop_cnt=int(row['pop_num']),
+            pop_tot=objrun.pop_tot,
+            pop_ratio=float(row['pop_ratio']),
+            enrichment=str(row['enrichment']))
+        rec = EnrichmentRecord(termid, ntpval, studyitems=self.studyitems)
+        rec.multitests = self.ntobj_mult._make(row[f] for f in self.ntobj_mult._fields)
+        rec.prtfmt = self.prtfmt
+        rec.ntobj = self.ntobj
+        return rec
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,260 @@
+"""Population genes and terms encoded as dense integers, with associations in CSR arrays."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import collections as cx
+import numpy as np
+
+
+class EnrichmentIndex():
+    """Population genes and terms encoded as dense integers, with associations in CSR arrays.
+
+    Gene i is associated with terms: gene_terms[gene_indptr[i]:gene_indptr[i+1]]
+    Term j is associated with genes: term_genes[term_indptr[j]:term_indptr[j+1]]
+    """
+
+    def __init__(self, gene_terms_pairs):
+        # Gene and term indexes are in the order first seen in the association
+        self.genes = []
+        self.gene2idx = {}
+        self.terms = []
+        self.term2idx = {}
+        self.gene_indptr, self.gene_terms = self._init_gene_csr(gene_terms_pairs)
+        self.term_indptr, self.term_genes = self._init_term_csr()
+        self.pop_cnts = np.diff(self.term_indptr)
+
+    def __len__(self):
+        return len(self.genes)
+
+    @classmethod
+    def from_arrays(cls, genes, terms, gene_indptr, gene_terms, term_indptr=None, term_genes=None):
+        """Return an index using existing arrays, such as memory-mapped arrays, without copying."""
+        obj = cls.__new__(cls)
+        obj.genes = genes
+        obj.gene2idx = {g:i for i, g in enumerate(genes)}
+        obj.terms = terms
+        obj.term2idx = {t:i for i, t in enumerate(terms)}
+        obj.gene_indptr = gene_indptr
+        obj.gene_terms = gene_terms
+        if term_indptr is None:
+            term_indptr, term_genes = obj._init_term_csr()
+        obj.term_indptr = term_indptr
+        obj.term_genes = term_genes
+        obj.pop_cnts = np.diff(term_indptr)
+        return obj
+
+    def get_subset(self, gene_ids):
+        """Return an index containing only the given genes and the terms associated with them."""
+        gene_mask = self.get_gene_mask(self.get_gene_idxs(gene_ids))
+        if gene_mask.all():
+            return self
+        lens = np.diff(self.gene_indptr)
+        gene_terms = self.gene_terms[np.repeat(gene_mask, lens)]
+        # Keep terms in the order first seen, as when reading the association
+        terms_old, first, gene_terms = np.unique(gene_terms, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        old2new = np.empty(len(order), dtype=np.int32)
+        old2new[order] = np.arange(len(order), dtype=np.int32)
+        gene_indptr = np.zeros(int(gene_mask.sum()) + 1, dtype=np.int64)
+        np.cumsum(lens[gene_mask], out=gene_indptr[1:])
+        genes = self.genes
+        terms = self.terms
+        return self.from_arrays(
+            [genes[i] for i in np.flatnonzero(gene_mask)],
+            [terms[i] for i in terms_old[order]],
+            gene_indptr,
+            old2new[gene_terms.ravel()])
+
+    def get_gene_idxs(self, gene_ids):
+        """Return the sorted indexes of the genes which are in the index."""
+        gene2idx = self.gene2idx
+        return np.sort(np.array([gene2idx[g] for g in gene_ids if g in gene2idx], dtype=np.int32))
+
+    def get_gene_mask(self, gene_idxs):
+        """Return a boolean array, True for each gene in gene_idxs."""
+        gene_mask = np.zeros(len(self.genes), dtype=bool)
+        gene_mask[gene_idxs] = True
+        return gene_mask
+
+    def get_term_cnts(self, gene_idxs):
+        """Return the number of genes in gene_idxs associated with each term."""
+        return np.bincount(self.get_genes_term_idxs(gene_idxs), minlength=len(self.terms))
+
+    def get_genes_term_idxs(self, gene_idxs):
+        """Return the term indexes associated with each gene in gene_idxs, one per association."""
+        starts = self.gene_indptr[gene_idxs]
+        lens = self.gene_indptr[np.asarray(gene_idxs) + 1] - starts
+        # Positions in gene_terms of every term associated with the genes
+        offsets = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        positions = offsets + np.arange(offsets.size)
+        return self.gene_terms[positions]
+
+    def get_term_gene_idxs(self, term_idx, gene_mask=None):
+        """Return the indexes of genes associated with a term, optionally only those in a mask."""
+        gene_idxs = self.term_genes[self.term_indptr[term_idx]:self.term_indptr[term_idx+1]]
+        if gene_mask is not None:
+            return gene_idxs[gene_mask[gene_idxs]]
+        return gene_idxs
+
+    def get_term_items(self, term_idx, gene_mask=None):
+        """Return the set of gene IDs associated with a term, optionally only those in a mask."""
+        genes = self.genes
+        return set(genes[i] for i in self.get_term_gene_idxs(term_idx, gene_mask))
+
+    def get_assc(self):
+        """Return the association as a dict of gene IDs to sets of term IDs."""
+        terms = self.terms
+        indptr = self.gene_indptr
+        gene_terms = self.gene_terms
+        return {g:set(terms[t] for t in gene_terms[indptr[i]:indptr[i+1]])
+                for i, g in enumerate(self.genes)}
+
+    def get_term2ids(self):
+        """Return a dict of term IDs to sets of associated gene IDs."""
+        return {t:self.get_term_items(i) for i, t in enumerate(self.terms)}
+
+    def get_incidence(self):
+        """Return a scipy.sparse gene-by-term incidence matrix sharing the CSR arrays."""
+        from scipy.sparse import csr_matrix
+        return csr_matrix(
+            (np.ones(len(self.gene_terms), dtype=np.int32), self.gene_terms, self.gene_indptr),
+            shape=(len(self.genes), len(self.terms)))
+
+    def _init_gene_csr(self, gene_terms_pairs):
+        """Intern gene and term IDs. Return the association as gene-to-term CSR arrays."""
+        genes = self.genes
+        gene2idx = self.gene2idx
+        terms = self.terms
+        term2idx = self.term2idx
+        indptr = [0]
+        indices = []
+        for gene, gene_terms in gene_terms_pairs:
+            assert gene not in gene2idx, "DUPLICATE GENE({G}) IN ASSOCIATION".format(G=gene)
+            gene2idx[gene] = len(genes)
+            genes.append(gene)
+            for term in gene_terms:
+                term_idx = term2idx.get(term)
+                if term_idx is None:
+                    term_idx = term2idx[term] = len(terms)
+                    terms.append(term)
+                indices.append(term_idx)
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32)
+
+    def _init_term_csr(self):
+        """Return the association as term-to-gene CSR arrays."""
+        gene_of_entry = np.repeat(
+            np.arange(len(self.genes), dtype=np.int32), np.diff(self.gene_indptr))
+        order = np.argsort(self.gene_terms, kind='stable')
+        term_indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.gene_terms, minlength=len(self.terms)), out=term_indptr[1:])
+        return term_indptr, gene_of_entry[order]
+
+
+class StudyItems():
+    """Study and population IDs associated with each term, created only when requested.
+
+    Shared by all the results of one study, which keep only their term ID.
+    """
+
+    __slots__ = ('index', 'gene_idxs')
+
+    def __init__(self, index, gene_idxs):
+        self.index = index
+        # Sorted indexes of the study genes in the index
+        self.gene_idxs = gene_idxs
+
+    def get_stu_items(self, termid):
+        """Return the set of study IDs associated with a term."""
+        genes = self.index.genes
+        term_gene_idxs = self.index.get_term_gene_idxs(self.index.term2idx[termid])
+        return set(genes[i] for i in np.intersect1d(term_gene_idxs, self.gene_idxs,
+                                                    assume_unique=True))
+
+    def get_stu_lists(self, term_idxs):
+        """Return a list of the study IDs associated with each term index, found all at once."""
+        index = self.index
+        term_idxs = np.asarray(term_idxs, dtype=np.int64)
+        starts = index.term_indptr[term_idxs]
+        lens = index.term_indptr[term_idxs + 1] - starts
+        # Positions in term_genes of every gene associated with the terms
+        offsets = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+        gene_idxs = index.term_genes[offsets + np.arange(offsets.size)]
+        is_stu = index.get_gene_mask(self.gene_idxs)[gene_idxs]
+        term_of_gene = np.repeat(np.arange(term_idxs.size), lens)[is_stu]
+        bounds = np.searchsorted(term_of_gene, np.arange(term_idxs.size + 1)).tolist()
+        genes = index.genes
+        ids = [genes[i] for i in gene_idxs[is_stu].tolist()]
+        return [ids[bounds[i]:bounds[i+1]] for i in range(term_idxs.size)]
+
+    def get_pop_items(self, termid):
+        """Return the set of population IDs associated with a term."""
+        return self.index.get_term_items(self.index.term2idx[termid])
+
+
+class TermBitsets():
+    """Term membership as packed bit arrays: study hits per term are popcounts of ANDs.
+
+    Bit g%64 of word_bits[g//64, j] is set if gene g is associated with term j.
+    Words are rows so that the words holding a study's genes are read as whole rows.
+    """
+
+    def __init__(self, index):
+        self.num_genes = len(index.genes)
+        self.num_words = (self.num_genes + 63)//64
+        self.word_bits = self._init_word_bits(index)
+
+    def get_term_cnts(self, gene_idxs):
+        """Return the number of genes in gene_idxs associated with each term."""
+        study_bits = self.get_bits(gene_idxs)
+        # Only the words containing study genes can contribute to the counts
+        words = np.flatnonzero(study_bits)
+        return popcount(self.word_bits[words] & study_bits[words, None]).sum(axis=0)
+
+    def get_bits(self, gene_idxs):
+        """Return a bitmask with the bits for gene_idxs set."""
+        gene_idxs = np.asarray(gene_idxs, dtype=np.int64)
+        bits = np.zeros(self.num_words, dtype=np.uint64)
+        np.bitwise_or.at(bits, gene_idxs >> 6, _get_bit(gene_idxs))
+        return bits
+
+    def _init_word_bits(self, index):
+        """Set the bits for each term's genes."""
+        num_terms = len(index.terms)
+        term_of_entry = np.repeat(np.arange(num_terms), np.diff(index.term_indptr))
+        gene_idxs = index.term_genes.astype(np.int64)
+        word_bits = np.zeros((self.num_words, num_terms), dtype=np.uint64)
+        np.bitwise_or.at(word_bits, (gene_idxs >> 6, term_of_entry), _get_bit(gene_idxs))
+        return word_bits
+
+
+def _get_bit(gene_idxs):
+    """Return the bit within its 64-bit word for each gene index."""
+    return np.left_shift(np.uint64(1), (gene_idxs & 63).astype(np.uint64))
+
+def _popcount_table(words):
+    """Return the number of set bits in each word, using a table of byte popcounts."""
+    counts = _POPCOUNT8[words.view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1)
+
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# NumPy 2.0 and later count bits natively
+popcount = getattr(np, 'bitwise_count', _popcount_table)
+
+# Study hit counting options: (name, function(EnrichmentIndex) -> object with get_term_cnts)
+COUNTERS = cx.OrderedDict([
+    ('csr', lambda index: index),
+    ('bitset', TermBitsets),
+])
+
+def get_term_counter(name, index):
+    """Return an object which counts study hits per term using the named representation."""
+    if name not in COUNTERS:
+        raise Exception("COUNTER({NAME}) NOT FOUND. CHOOSE FROM: {OPTS}".format(
+            NAME=name, OPTS=' '.join(COUNTERS)))
+    return COUNTERS[name](index)
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,79 @@
+"""Run enrichment analyses on many studies in parallel using a pool of processes."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import numpy as np
+from enrichmentanalysis.pvalcalc import PvalCalcBase
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+from enrichmentanalysis.enrich_results import EnrichmentResults
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+from enrichmentanalysis.enrich_index import StudyItems
+
+# Set once in each worker process: The population, associations, and methods
+_OBJRUN = None
+
+
+def run_studies_parallel(objrun, name2studyids, jobs=None, terms='all'):
+    """Run enrichment analyses in a pool of processes, yielding (name, results) as completed.
+
+    The EnrichmentRun is given to each worker process once, by fork inheritance
+    where available and through the pool initializer otherwise; tasks contain only study IDs.
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+    names = [nm for nm, ids in name2studyids.items() if ids]
+    for name in name2studyids:
+        if not name2studyids[name]:
+            yield name, []
+    if not names:
+        return
+    kws = {
+        'max_workers': max(1, min(jobs, len(names))),
+        'initializer': _init_worker,
+        'initargs': (objrun,),
+    }
+    # Process pools are imported only when studies are run in parallel
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import as_completed
+    if 'fork' in multiprocessing.get_all_start_methods():
+        kws['mp_context'] = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(**kws) as pool:
+        future2name = {pool.submit(_run_study, name2studyids[nm], nm, terms):nm for nm in names}
+        for future in as_completed(future2name):
+            name = future2name[future]
+            yield name, _get_results(objrun, name, terms, *future.result())
+
+def _init_worker(objrun):
+    """Save the EnrichmentRun in the worker process."""
+    # pylint: disable=global-statement
+    global _OBJRUN
+    _OBJRUN = objrun
+
+def _run_study(study_ids, name, terms):
+    """Run one enrichment analysis in a worker process. Return picklable results."""
+    objres = _OBJRUN.run_study(study_ids, name, log=None, terms=terms)
+    # Send back only the values calculated for this study, not the population or associations
+    if isinstance(objres.results, EnrichmentColumns):
+        return objres.study_ids, objres.results.arr
+    recs = [(r.termid, tuple(r.ntpval), tuple(r.multitests)) for r in objres.results]
+    return objres.study_ids, recs
+
+def _get_results(objrun, name, terms, study_in_pop, recs):
+    """Rebuild the enrichment results in the main process."""
+    # Study items are created on use from the study genes
+    studyitems = StudyItems(objrun.index, objrun.index.get_gene_idxs(study_in_pop))
+    if isinstance(recs, np.ndarray):
+        results = EnrichmentColumns(recs, len(study_in_pop), objrun, studyitems)
+        return EnrichmentResults(study_in_pop, results, objrun, name, terms)
+    ntpval_make = PvalCalcBase.ntpval._make
+    results = [EnrichmentRecord(termid, ntpval_make(ntpval), studyitems=studyitems)
+               for termid, ntpval, _ in recs]
+    pvals_corrected = list(zip(*[r[2] for r in recs]))
+    objrun._add_multitest(results, pvals_corrected)  # pylint: disable=protected-access
+    return EnrichmentResults(study_in_pop, results, objrun, name, terms)
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
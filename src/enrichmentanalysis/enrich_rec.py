@@ -13,6 +13,10 @@ import collections as cx
 class EnrichmentRecord():
     """Enrichment object."""
 
+    # No per-record __dict__: Many records are kept for each study
+    __slots__ = ('termid', 'ntpval', '_stu_items', '_pop_items', 'studyitems',
+                 'multitests', 'prtfmt', 'ntobj')
+
     flds = (
         'enrichment',
         'TermID',
@@ -36,15 +40,42 @@ class EnrichmentRecord():
         ('pval_uncorr', '{pval_uncorr:8.2e}'),
     ])
 
-    def __init__(self, termid, ntpval, stu_items, pop_items):
+    # Report namedtuple types, one per set of multiple-test fields
+    multiflds2ntobj = {}
+
+    def __init__(self, termid, ntpval, stu_items=None, pop_items=None, studyitems=None):
         self.termid = termid
         self.ntpval = ntpval
-        self.stu_items = stu_items
-        self.pop_items = pop_items
+        # Items may be given as sets or created from the StudyItems when requested
+        self._stu_items = stu_items
+        self._pop_items = pop_items
+        self.studyitems = studyitems
         self.multitests = None  # namedtuple
         self.prtfmt = None
         self.ntobj = None
 
+    @property
+    def stu_items(self):
+        """Study IDs associated with this term."""
+        if self._stu_items is not None:
+            return self._stu_items
+        return self.studyitems.get_stu_items(self.termid)
+
+    @stu_items.setter
+    def stu_items(self, items):
+        self._stu_items = items
+
+    @property
+    def pop_items(self):
+        """Population IDs associated with this term."""
+        if self._pop_items is not None:
+            return self._pop_items
+        return self.studyitems.get_pop_items(self.termid)
+
+    @pop_items.setter
+    def pop_items(self, items):
+        self._pop_items = items
+
     def __str__(self):
         """Return string representation for this record."""
         ntpval = self.ntpval
@@ -68,42 +99,45 @@ class EnrichmentRecord():
         if self.ntobj is None:
             self.ntobj = self._get_ntobj()
         ntp = self.ntpval
-        multidct = {m:'{:8.2e}'.format(v) for m, v in self.multitests._asdict().items()}
-        return self.ntobj(
-            enrichment=ntp.enrichment,
-            TermID=self.termid,
-            stu_num=ntp.study_cnt,
-            stu_tot=ntp.study_tot,
-            stu_ratio=self.fld2fmt['stu_ratio'].format(stu_ratio=ntp.study_ratio),
-            pop_num=ntp.pop_cnt,
-            pop_tot=ntp.pop_tot,
-            pop_ratio=self.fld2fmt['pop_ratio'].format(pop_ratio=ntp.pop_ratio),
-            pval_uncorr=self.fld2fmt['pval_uncorr'].format(pval_uncorr=ntp.pval_uncorr),
-            stu_items=self._get_items_str(self.stu_items, ';'),
-            **multidct)
+        # Fields: flds, multiple-test fields, stu_items
+        return self.ntobj._make((
+            ntp.enrichment,
+            self.termid,
+            ntp.study_cnt,
+            ntp.study_tot,
+            '{:7.5f}'.format(ntp.study_ratio),
+            ntp.pop_cnt,
+            ntp.pop_tot,
+            '{:7.5f}'.format(ntp.pop_ratio),
+            '{:8.2e}'.format(ntp.pval_uncorr),
+            *['{:8.2e}'.format(v) for v in self.multitests],
+            self.get_items_str(self.stu_items, ';')))
 
     @staticmethod
-    def _get_items_str(items, divider):
-        """Return one string containing all items."""
+    def get_items_str(items, divider):
+        """Return one string containing all items, sorted so output is repeatable."""
         if items:
             if isinstance(next(iter(items)), str):
-                return divider.join(items)
+                return divider.join(sorted(items))
             else:
-                return divider.join(str(e) for e in items)
+                return divider.join(sorted(str(e) for e in items))
         return ''
 
     def _get_ntobj(self):
-        """Create namedtuple object for enrichment results records."""
-        return cx.namedtuple('ntresults',
-                             ' '.join(self.flds) + \
-                             ' '.join(self.multitests._fields) + \
-                             'stu_items')
+        """Return the namedtuple type for reporting records with these multiple-test fields."""
+        multiflds = self.multitests._fields
+        ntobj = self.multiflds2ntobj.get(multiflds)
+        if ntobj is None:
+            ntobj = cx.namedtuple('ntresults', self.flds + multiflds + ('stu_items',))
+            self.multiflds2ntobj[multiflds] = ntobj
+        return ntobj
+
     def _get_prtfmt(self):
         """Create print format."""
         # pylint: disable=bad-format-string
         return '{FMT} {M}'.format(
             FMT=' '.join(self.fld2fmt.values()),
-            M=' '.join(['{{{M}:8.2e}'.format(M=m) for m in self.multitests._fields]))
+            M=' '.join(['{{{M}:8.2e}}'.format(M=m) for m in self.multitests._fields]))
 
 
 # Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -3,11 +3,18 @@
 __copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
 __author__ = "DV Klopfenstein"
 
+import collections as cx
+import numpy as np
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+
 
 class EnrichmentResults():
     """Store and manage enrichment results."""
 
-    def __init__(self, study_in_pop, results, objearun, name="enrichmentanalysis"):
+    # Results sorted by one p-value field: order of results, rank of each result, sorted p-values
+    ntsorted = cx.namedtuple('NtSorted', 'order rank pvals')
+
+    def __init__(self, study_in_pop, results, objearun, name="enrichmentanalysis", terms='all'):
         self.name = name
         # Save the population IDs that are in the association
         self.objearun = objearun  # pop_ids pop_tot
@@ -15,11 +22,31 @@ class EnrichmentResults():
         self.study_tot = len(self.study_ids)
         # Note: It is assumed that all GO IDs, Pathway IDs, etc. in association are valid
         # IDs->(GO|Pathway|etc.)
-        self.assc = objearun.assc
-        self.term2popids = objearun.term2popids
         self.nt_methods = objearun.objmethods.methods
-        # Results
+        # Results: A list of EnrichmentRecords or EnrichmentColumns, which creates records on use
+        self.results = results
+        # Terms reported: 'all' or 'study_hit'
+        self.terms = terms
+        # Sorted p-values of each field, created when first queried
+        self.field2sorted = {}
+        self._enrichments = None
+
+    def update(self, added_ids=(), removed_ids=(), log=None):
+        """Rerun the enrichment analysis after adding and removing a few study IDs.
+
+        Study hits are changed only for the terms associated with the added or removed IDs.
+        """
+        study_in_pop, results = self.objearun.update_results(self, added_ids, removed_ids, log)
+        self.study_ids = study_in_pop
+        self.study_tot = len(study_in_pop)
         self.results = results
+        self.field2sorted = {}
+        self._enrichments = None
+
+    @property
+    def term2popids(self):
+        """Terms and their sets of population IDs, built by the run on first use."""
+        return self.objearun.term2popids
 
     @staticmethod
     def sortby_eaobj(obj):
@@ -28,9 +55,18 @@ class EnrichmentResults():
 
     def get_results_cond(self, max_pval, pval_field, sortby=None):
         """Get sorted results below specified pvalue or FDR."""
-        if sortby is None:
-            sortby = self.sortby_eaobj
-        return sorted(self._get_results_cond(max_pval, pval_field), key=sortby)
+        if sortby is not None:
+            return sorted(self._get_results_cond(max_pval, pval_field), key=sortby)
+        return self._get_recs(self.get_idxs_cond(max_pval, pval_field))
+
+    def get_idxs_cond(self, max_pval, pval_field):
+        """Get indexes of the results returned by get_results_cond without sortby, in order."""
+        # Sorted by enrichment, then uncorrected p-value (sortby_eaobj) without sorting records
+        idxs = self._get_idxs_cond(max_pval, pval_field)
+        idxs = np.sort(self._get_sorted('pval_uncorr').rank[idxs])
+        idxs = self._get_sorted('pval_uncorr').order[idxs]
+        is_purified = self._get_enrichments()[idxs] != 'e'
+        return idxs[np.argsort(is_purified, kind='stable')]
 
     def _get_results_cond(self, max_pval, pval_field):
         """Get the subset of results which are under a specified p-value."""
@@ -40,26 +76,83 @@ class EnrichmentResults():
             return self.get_pvals_uncorr_subset(max_pval)
         return self.get_pvals_corr_subset(max_pval, pval_field)
 
+    def _get_idxs_cond(self, max_pval, pval_field):
+        """Get the indexes of results which are under a specified p-value."""
+        if max_pval is None:
+            return np.arange(len(self.results))
+        return self._get_idxs_below(max_pval, pval_field if pval_field else 'pval_uncorr')
+
     def get_pvals_corr_subset(self, max_pval, pval_field):
         """Return all results for pvalues less than a specified max."""
-        results = []
-        for rec in sorted(self.results, key=lambda o: o.ntpval.pval_uncorr):
-            ntm = rec.multitests
-            if getattr(ntm, pval_field) < max_pval:
-                results.append(rec)
-            else:
-                return results
-        return results
+        return self._get_recs(self._get_idxs_below(max_pval, pval_field))
 
     def get_pvals_uncorr_subset(self, max_pval):
         """Return all results for pvalues less than a specified max."""
-        results = []
-        for rec in sorted(self.results, key=lambda o: o.ntpval.pval_uncorr):
-            if rec.pval_uncorr < max_pval:
-                results.append(rec)
+        return self._get_recs(self._get_idxs_below(max_pval, 'pval_uncorr'))
+
+    def get_top(self, k, field='pval_uncorr'):
+        """Return the k results having the smallest p-values in field, sorted by field.
+
+        field: 'pval_uncorr' or a multiple-test field such as 'fdr_bh'.
+        Results are in the same order as the first k results of get_top(len(results), field):
+        Results having equal p-values in field are sorted by uncorrected p-value.
+        """
+        pvals = self._get_pvals(field)
+        if k >= len(pvals):
+            return self._get_recs(self._get_sorted(field).order)
+        if k <= 0:
+            return []
+        # Partial sort: Find the k smallest and all tied with the k-th, then sort only those
+        kth = np.partition(pvals, k-1)[k-1]
+        idxs = np.flatnonzero(pvals <= kth)
+        order = np.lexsort((self._get_sorted('pval_uncorr').rank[idxs], pvals[idxs]))
+        return self._get_recs(idxs[order[:k]])
+
+    def _get_idxs_below(self, max_pval, field):
+        """Return indexes of results with p-values below max_pval, sorted by the field p-value.
+
+        Results having equal p-values in field are sorted by uncorrected p-value.
+        """
+        objsorted = self._get_sorted(field)
+        return objsorted.order[:np.searchsorted(objsorted.pvals, max_pval, side='left')]
+
+    def _get_sorted(self, field):
+        """Return the order of results sorted by a p-value field, created once per field."""
+        objsorted = self.field2sorted.get(field)
+        if objsorted is None:
+            pvals = self._get_pvals(field)
+            if field == 'pval_uncorr':
+                order = np.argsort(pvals, kind='stable')
             else:
-                return results
-        return results
+                # Ties are sorted by uncorrected p-value
+                order = self._get_sorted('pval_uncorr').order
+                order = order[np.argsort(pvals[order], kind='stable')]
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            objsorted = self.ntsorted(order=order, rank=rank, pvals=pvals[order])
+            self.field2sorted[field] = objsorted
+        return objsorted
+
+    def _get_pvals(self, field):
+        """Return an array containing a p-value field for every result."""
+        if isinstance(self.results, EnrichmentColumns):
+            return self.results.arr[field]
+        if field == 'pval_uncorr':
+            return np.array([r.ntpval.pval_uncorr for r in self.results], dtype=float)
+        return np.array([getattr(r.multitests, field) for r in self.results], dtype=float)
+
+    def _get_enrichments(self):
+        """Return an array containing 'e' (enriched) or 'p' (purified) for every result."""
+        if isinstance(self.results, EnrichmentColumns):
+            return self.results.arr['enrichment']
+        if self._enrichments is None:
+            self._enrichments = np.array([r.ntpval.enrichment for r in self.results])
+        return self._enrichments
+
+    def _get_recs(self, idxs):
+        """Return a list of the results at the given indexes."""
+        results = self.results
+        return [results[i] for i in idxs]
 
     def wr_found(self, fout_txt):
         """Write the found study genes."""
@@ -71,7 +164,7 @@ class EnrichmentResults():
 
     def wr_notfound(self, fout_txt, pop_stu_genes):
         """Write the found study genes."""
-        not_found = pop_stu_genes.difference(self.assc)
+        not_found = pop_stu_genes.difference(self.objearun.index.gene2idx)
         with open(fout_txt, 'w') as prt:
             for gene_id in not_found:
                 prt.write('{ID}\n'.format(ID=gene_id))
@@ -5,55 +5,428 @@ __author__ = "DV Klopfenstein"
 
 import sys
 import collections as cx
+import numpy as np
+from enrichmentanalysis.enrich_index import EnrichmentIndex
+from enrichmentanalysis.enrich_index import StudyItems
+from enrichmentanalysis.enrich_index import get_term_counter
 from enrichmentanalysis.pvalcalc import FisherFactory
 from enrichmentanalysis.multiple_testing import Methods
+from enrichmentanalysis.multiple_testing import MultitestPermutation
 from enrichmentanalysis.enrich_rec import EnrichmentRecord
 from enrichmentanalysis.enrich_results import EnrichmentResults
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+from enrichmentanalysis.result_cache import ResultCache
+from enrichmentanalysis.result_cache import get_digest
 
 
 class EnrichmentRun():
     """Holds population set, associations, and methods for one or more enrichment analyses."""
 
     patpval = "Calculating {N:,} uncorrected p-values using {PFNC}\n"
+    # Most study-term counts in one chunk of studies run by run_studies
+    max_cells = 1 << 20
+    terms_options = ('all', 'study_hit')
     kw_dict = {
         'alpha':0.05,
-        'methods':('fdr_bh'),
-        'min_overlap':0.7}
+        'methods':('fdr_bh',),
+        'min_overlap':0.7,
+        'pvalcalc':'fisher_scipy_stats',
+        'pval_memo':100000,
+        'counter':'csr',
+        'columnar':False,
+        'result_cache':None,
+        'result_cache_bytes':1 << 30,
+        'async_jobs':4,
+        'permutations':1000,
+        'permutation_seed':0,
+        'permutation_jobs':1}
 
     def __init__(self, population_ids, associations, **kws):
         # Save all population IDs and associations
         self.args = self._init_args(population_ids, associations, **kws)
         assert population_ids, "NO POPULATION IDs: {A}".format(A=population_ids)
         assert associations, "EMPTY ASSOCIATION: {A}".format(A=associations)
+        # Associations may be a dict or a compiled association (EnrichmentIndex)
+        is_index = isinstance(associations, EnrichmentIndex)
         # Save the population IDs that are in the association
-        self.pop_ids = population_ids.intersection(set(associations))
+        self.pop_ids = population_ids.intersection(
+            associations.gene2idx if is_index else set(associations))
         self._prt_perc_found('population', 'assocation', self.pop_ids, population_ids)
         assert self.pop_ids, "NO POPULATION IDs IN ASSOCIATIONS: {A}".format(A=self.pop_ids)
         self.pop_tot = len(self.pop_ids)
         # Note: It is assumed that all GO IDs, Pathway IDs, etc. in association are valid
         # IDs->(GO|Pathway|etc.)
-        self.assc = {a_id:terms for a_id, terms in associations.items() if a_id in self.pop_ids}
-        self.term2popids = self._get_term2ids(self.pop_ids)
-        self.pval_obj = FisherFactory().pval_obj
+        # Population genes and terms are stored as integers; associations as CSR arrays
+        self.index = associations.get_subset(self.pop_ids) if is_index else EnrichmentIndex(
+            (a_id, terms) for a_id, terms in associations.items() if a_id in self.pop_ids)
+        self._assc = None
+        self._term2popids = None
+        # Counts study hits per term: 'csr' (index CSR arrays) or 'bitset' (term bitsets)
+        self.counter = get_term_counter(self.args['counter'], self.index)
+        # Sparse gene-by-term incidence matrix used to count study hits for many studies
+        self._incidence = None
+        self.pval_obj = FisherFactory(self.args['pvalcalc']).pval_obj
+        self.pval_obj.set_pop_tot(self.pop_tot)
+        self.pval_obj.set_memo(self.args['pval_memo'])
         # self._run_multitest = {
         #     'statsmodels':lambda iargs: self._run_multitest_statsmodels(iargs)}
         self.objmethods = Methods(self.args['methods'], self.args['alpha'])
+        self.objmethods.objperm = self._init_permutation()
+        # Namedtuple types and print format shared by all records; created on first use
+        self._rec_attrs = None
+        # Optional: Results saved on disk, keyed by everything the results depend on
+        self.result_cache = self._init_result_cache()
+        self._index_digest = None
+        # Runs studies submitted from an asyncio event loop; created on first use
+        self._arunner = None
 
-    def run_study(self, study_ids, study_name, log=sys.stdout):
-        """Run an enrichment analysis."""
+    def __getstate__(self):
+        """Namedtuple types created at runtime cannot be pickled; they are recreated on use."""
+        state = self.__dict__.copy()
+        state['_rec_attrs'] = None
+        state['_arunner'] = None
+        return state
+
+    def run_study(self, study_ids, study_name, log=sys.stdout, terms='all'):
+        """Run an enrichment analysis.
+
+        terms='all':       Report results for every term in the population
+        terms='study_hit': Report results only for terms annotated to one or more study IDs.
+                           Terms without study hits are still counted in multiple-test corrections.
+        """
         results = []
+        assert terms in self.terms_options, "terms({T}) NOT IN: {O}".format(
+            T=terms, O=' '.join(self.terms_options))
         # Get study IDs which which are present in the population
         study_in_pop = self._get_study_ids(study_ids, log)
         if not study_ids:
             return results
+        gene_idxs = self.index.get_gene_idxs(study_in_pop)
+        if self.result_cache is not None:
+            results = self._get_results_cached(study_in_pop, gene_idxs, None, log, terms)
+        else:
+            study_cnts = self.counter.get_term_cnts(gene_idxs)
+            results = self._get_results(len(study_in_pop), gene_idxs, study_cnts, log, terms)
+        objres = EnrichmentResults(study_in_pop, results, self, study_name, terms)
+        return objres
+
+    async def arun_study(self, study_ids, study_name, log=None, terms='all', executor=None):
+        """Run an enrichment analysis in an executor, without blocking the event loop.
+
+        At most async_jobs studies are run at the same time. Identical studies submitted
+        while one is running share its results. executor: None for the loop's thread pool
+        """
+        return await self._get_arunner().run_study(study_ids, study_name, log, terms, executor)
+
+    async def arun_studies(self, name2studyids, log=None, terms='all', executor=None):
+        """Run enrichment analyses on many studies in an executor, like arun_study."""
+        return await self._get_arunner().run_studies(name2studyids, log, terms, executor)
+
+    def _get_arunner(self):
+        """Return the runner of studies for the running event loop."""
+        # asyncio is imported only when studies are run from an event loop
+        from enrichmentanalysis.enrich_async import AsyncRunner
+        from asyncio import get_running_loop
+        if self._arunner is None or self._arunner.loop is not get_running_loop():
+            self._arunner = AsyncRunner(self, self.args['async_jobs'])
+        return self._arunner
+
+    @property
+    def assc(self):
+        """Associations of population IDs to sets of terms, built from the index on first use."""
+        if self._assc is None:
+            self._assc = self.index.get_assc()
+        return self._assc
+
+    @property
+    def term2popids(self):
+        """Terms and their sets of population IDs, built from the index on first use."""
+        if self._term2popids is None:
+            self._term2popids = self.index.get_term2ids()
+        return self._term2popids
+
+    def run_studies(self, name2studyids, log=sys.stdout, terms='all'):
+        """Run enrichment analyses on many studies, batching the work of all studies.
+
+        Study hits of all studies are counted in one sparse product. Studies are then run in
+        chunks of at most max_cells study-term counts: The uncorrected p-values of a chunk are
+        found in one call, calculating each distinct contingency table once, and numpy
+        multiple-test corrections are run on all studies in the chunk at once.
+        """
+        assert terms in self.terms_options, "terms({T}) NOT IN: {O}".format(
+            T=terms, O=' '.join(self.terms_options))
+        name2results = cx.OrderedDict()
+        name2stuinpop = cx.OrderedDict()
+        for name, study_ids in name2studyids.items():
+            name2results[name] = []
+            if study_ids:
+                name2stuinpop[name] = self._get_study_ids(study_ids, log)
+        if not name2stuinpop:
+            return name2results
+        # Study hits for every study and term: (studies x genes) * (genes x terms)
+        if self._incidence is None:
+            self._incidence = self.index.get_incidence()
+        name2geneidxs = {nm:self.index.get_gene_idxs(ids) for nm, ids in name2stuinpop.items()}
+        # Kept sparse: Only one chunk of studies' rows of term counts is made dense at a time
+        study_cnts = self._get_study_incidence(name2geneidxs.values()).dot(self._incidence)
+        study_cnts = study_cnts.tocsr()
+        name2row = {nm:row for row, nm in enumerate(name2stuinpop)}
+        # Studies having cached results are not run
+        name2key = cx.OrderedDict()
+        for name, study_in_pop in name2stuinpop.items():
+            key = None
+            if self.result_cache is not None:
+                key = self.result_cache.get_key(self._get_cache_fields(study_in_pop, terms))
+                cols = self._load_cached(key, study_in_pop, name2geneidxs[name], log)
+                if cols is not None:
+                    name2results[name] = self._get_study_results(study_in_pop, cols, name, terms)
+                    continue
+            name2key[name] = key
+        names = list(name2key)
+        step = max(1, self.max_cells//len(self.index.terms))
+        for start in range(0, len(names), step):
+            names_chunk = names[start:start+step]
+            studies_cols = self._get_columns_studies(
+                [len(name2stuinpop[nm]) for nm in names_chunk],
+                [name2geneidxs[nm] for nm in names_chunk],
+                study_cnts[[name2row[nm] for nm in names_chunk]].toarray(), log, terms)
+            for name, cols in zip(names_chunk, studies_cols):
+                if name2key[name] is not None:
+                    self.result_cache.save(name2key[name], cols.arr)
+                name2results[name] = self._get_study_results(
+                    name2stuinpop[name], cols, name, terms)
+        return name2results
+
+    def _get_study_results(self, study_in_pop, cols, name, terms):
+        """Return the EnrichmentResults of a study, given its results stored in columns."""
+        results = cols if self.args['columnar'] else cols.get_recs()
+        return EnrichmentResults(study_in_pop, results, self, name, terms)
+
+    def update_results(self, objres, added_ids, removed_ids, log=None):
+        """Return the study IDs and results of a study after adding and removing study IDs.
+
+        Study hits are changed only for the terms associated with the added or removed IDs.
+        If the number of study IDs is unchanged, only the p-values of those terms are
+        calculated. Otherwise the p-values of all terms are found in the memo or calculated.
+        Multiple-test corrections are run on all p-values.
+        """
+        index = self.index
+        removed = set(removed_ids).intersection(objres.study_ids)
+        added = set(added_ids).intersection(self.pop_ids).difference(objres.study_ids)
+        added.difference_update(removed_ids)
+        study_in_pop = set(objres.study_ids).union(added).difference(removed)
+        study_tot = len(study_in_pop)
+        # Study hits of every term: Unreported terms have no study hits
+        term_idxs_old = self._get_results_term_idxs(objres.results)
+        study_cnts = np.zeros(len(index.terms), dtype=np.int64)
+        study_cnts[term_idxs_old] = self._get_results_cnts(objres.results)
+        term_idxs_add = index.get_genes_term_idxs(index.get_gene_idxs(added))
+        term_idxs_rm = index.get_genes_term_idxs(index.get_gene_idxs(removed))
+        np.add.at(study_cnts, term_idxs_add, 1)
+        np.subtract.at(study_cnts, term_idxs_rm, 1)
+        term_idxs = self._get_term_idxs(study_cnts, objres.terms)
+        # Terms needing new uncorrected p-values: All terms if the number of study IDs changed
+        is_calc = np.ones(len(index.terms), dtype=bool)
+        if study_tot == objres.study_tot:
+            is_calc[term_idxs_old] = False
+            is_calc[term_idxs_add] = True
+            is_calc[term_idxs_rm] = True
+        term_idxs_calc = term_idxs[is_calc[term_idxs]]
+        if log:
+            log.write(self.patpval.format(N=len(term_idxs_calc), PFNC=self.pval_obj.name))
+        scnts_calc = study_cnts[term_idxs_calc].tolist()
+        pcnts_calc = index.pop_cnts[term_idxs_calc].tolist()
+        pvals_calc = self.pval_obj.get_pvals(scnts_calc, study_tot, pcnts_calc, self.pop_tot)
+        gene_idxs = index.get_gene_idxs(study_in_pop)
+        if self.args['columnar']:
+            pvals = np.empty(len(index.terms))
+            pvals[term_idxs_old] = objres.results.arr['pval_uncorr']
+            pvals[term_idxs_calc] = pvals_calc
+            return study_in_pop, self._get_columns_pvals(
+                study_tot, gene_idxs, study_cnts, term_idxs, pvals[term_idxs], log, objres.terms)
+        # Records of terms not recalculated keep their p-value namedtuples
+        ntpvals = [None]*len(index.terms)
+        for idx, rec in zip(term_idxs_old.tolist(), objres.results):
+            ntpvals[idx] = rec.ntpval
+        ntpvals_calc = self.pval_obj.get_nts_pvals(
+            pvals_calc, scnts_calc, study_tot, pcnts_calc, self.pop_tot)
+        for idx, ntpval in zip(term_idxs_calc.tolist(), ntpvals_calc):
+            ntpvals[idx] = ntpval
+        results = self._get_records(gene_idxs, term_idxs, [ntpvals[i] for i in term_idxs.tolist()])
+        # Corrected P-values
+        self._run_multitest(results, study_tot, study_cnts, log, objres.terms)
+        return study_in_pop, results
+
+    def _get_results_term_idxs(self, results):
+        """Return the term index of each result."""
+        if isinstance(results, EnrichmentColumns):
+            return results.arr['term_idx']
+        term2idx = self.index.term2idx
+        return np.array([term2idx[r.termid] for r in results], dtype=np.int64)
+
+    @staticmethod
+    def _get_results_cnts(results):
+        """Return the number of study hits of each result."""
+        if isinstance(results, EnrichmentColumns):
+            return results.arr['stu_num']
+        return np.array([r.ntpval.study_cnt for r in results], dtype=np.int64)
+
+    def _get_results(self, study_tot, gene_idxs, study_cnts, log, terms):
+        """Return results as records or as columns, given the study hit count for every term."""
+        if self.args['columnar']:
+            return self._get_columns(study_tot, gene_idxs, study_cnts, log, terms)
         # Uncorrected P-values
-        results = self.get_pval_uncorr(study_in_pop, log)
+        results = self._get_pval_uncorr(study_tot, gene_idxs, study_cnts, log, terms)
         # Corrected P-values
+        self._run_multitest(results, study_tot, study_cnts, log, terms)
+        return results
+
+    def _get_results_cached(self, study_in_pop, gene_idxs, study_cnts, log, terms):
+        """Return results from the result cache, or run the study and cache the results.
+
+        Results are cached as columns. Cached results need no p-value calculations.
+        """
+        key = self.result_cache.get_key(self._get_cache_fields(study_in_pop, terms))
+        cols = self._load_cached(key, study_in_pop, gene_idxs, log)
+        if cols is None:
+            if study_cnts is None:
+                study_cnts = self.counter.get_term_cnts(gene_idxs)
+            cols = self._get_columns(len(study_in_pop), gene_idxs, study_cnts, log, terms)
+            self.result_cache.save(key, cols.arr)
+        return cols if self.args['columnar'] else cols.get_recs()
+
+    def _load_cached(self, key, study_in_pop, gene_idxs, log):
+        """Return results stored in columns loaded from the result cache, or None if not cached."""
+        arr = self.result_cache.load(key)
+        if arr is None:
+            return None
+        if log:
+            log.write("  {N:,} results LOADED FROM CACHE: {DIR}\n".format(
+                N=len(arr), DIR=self.result_cache.dir_cache))
+        return EnrichmentColumns(arr, len(study_in_pop), self, StudyItems(self.index, gene_idxs))
+
+    def _get_cache_fields(self, study_in_pop, terms):
+        """Return the values which determine the results of a study."""
+        if self._index_digest is None:
+            index = self.index
+            self._index_digest = get_digest(
+                index.genes + index.terms,
+                [[len(index.genes)], index.gene_indptr, index.gene_terms])
+        fields = {
+            'study_ids': get_digest(sorted(str(s) for s in study_in_pop)),
+            # Population IDs in the association and their associations
+            'population_association': self._index_digest,
+            'alpha': self.objmethods.alpha,
+            'methods': [list(nt) for nt in self.objmethods.methods],
+            'pvalcalc': self.pval_obj.name,
+            'terms': terms,
+        }
+        objperm = self.objmethods.objperm
+        if objperm is not None:
+            fields['permutations'] = [objperm.num_perms, objperm.seed]
+        return fields
+
+    def _init_result_cache(self):
+        """Return the result cache if a cache directory is given."""
+        if self.args.get('result_cache') is None:
+            return None
+        return ResultCache(self.args['result_cache'], self.args['result_cache_bytes'])
+
+    def _get_columns(self, study_tot, gene_idxs, study_cnts, log, terms):
+        """Return results stored in columns. Records are created only when requested."""
+        term_idxs = self._get_term_idxs(study_cnts, terms)
+        if log:
+            log.write(self.patpval.format(N=len(term_idxs), PFNC=self.pval_obj.name))
+        pvals = self.pval_obj.get_pvals(
+            study_cnts[term_idxs].tolist(), study_tot,
+            self.index.pop_cnts[term_idxs].tolist(), self.pop_tot)
+        return self._get_columns_pvals(
+            study_tot, gene_idxs, study_cnts, term_idxs, pvals, log, terms)
+
+    def _get_columns_pvals(self, study_tot, gene_idxs, study_cnts, term_idxs, pvals, log, terms):
+        """Return results stored in columns, given the uncorrected p-values of terms reported."""
+        if log and self.pval_obj.memo is not None:
+            log.write("  {MEMO}\n".format(MEMO=self.pval_obj.memo))
+        cols = EnrichmentColumns.from_counts(
+            self, term_idxs, study_cnts[term_idxs], study_tot, pvals,
+            StudyItems(self.index, gene_idxs))
+        pvals_uncorr = cols.arr['pval_uncorr']
+        enrichments = cols.arr['enrichment']
+        if terms == 'study_hit':
+            # Terms without study hits are purified (or have no study), never enriched
+            pvals_nohit = self._get_pvals_nohit(study_tot, self.index.pop_cnts[study_cnts == 0])
+            pvals_uncorr = np.concatenate([pvals_uncorr, pvals_nohit])
+            enrichments = np.concatenate([enrichments, np.full(len(pvals_nohit), 'p')])
+        kws_perm = self._get_kws_perm(study_tot, study_cnts, terms)
+        cols.set_pvals_corrected(
+            self.objmethods.run_multitest_pvals(pvals_uncorr, log, enrichments, **kws_perm))
+        return cols
+
+    def _get_columns_studies(self, study_tots, studies_gene_idxs, study_cnts, log, terms):
+        """Return results stored in columns for many studies, one study per row of study_cnts.
+
+        Each study's p-values are corrected in the same order as in _get_columns_pvals.
+        """
+        pop_cnts = self.index.pop_cnts
+        if log:
+            log.write(self.patpval.format(N=study_cnts.size, PFNC=self.pval_obj.name))
+        pvals = self.pval_obj.get_pvals_studies(study_cnts, study_tots, pop_cnts, self.pop_tot)
+        if log and self.pval_obj.memo is not None:
+            log.write("  {MEMO}\n".format(MEMO=self.pval_obj.memo))
+        studies_cols = []
+        for cnts, pvals_study, study_tot, gene_idxs in zip(
+                study_cnts, pvals, study_tots, studies_gene_idxs):
+            term_idxs = self._get_term_idxs(cnts, terms)
+            studies_cols.append(EnrichmentColumns.from_counts(
+                self, term_idxs, cnts[term_idxs], study_tot, pvals_study[term_idxs],
+                StudyItems(self.index, gene_idxs)))
+        if terms == 'study_hit':
+            # Reported terms, then terms without study hits ordered by population count
+            rank_pop = np.empty(len(pop_cnts), dtype=np.int64)
+            rank_pop[np.argsort(pop_cnts, kind='stable')] = np.arange(len(pop_cnts))
+            order = np.argsort(np.where(
+                study_cnts != 0, np.arange(len(pop_cnts)), len(pop_cnts) + rank_pop), axis=1)
+            pvals = np.take_along_axis(pvals, order, axis=1)
+        # Terms without study hits are purified (or have no study), never enriched
+        enrichments = [np.concatenate([c.arr['enrichment'], np.full(len(pop_cnts)-len(c), 'p')])
+                       for c in studies_cols] if log else None
+        kws_perms = [self._get_kws_perm(study_tot, cnts, terms)
+                     for study_tot, cnts in zip(study_tots, study_cnts)]
+        pvals_corrected = self.objmethods.run_multitest_studies(pvals, log, enrichments, kws_perms)
+        for row, cols in enumerate(studies_cols):
+            cols.set_pvals_corrected([p[row] for p in pvals_corrected])
+        return studies_cols
+
+    def _run_multitest(self, results, study_tot, study_cnts, log, terms):
+        """Add multiple-test corrected p-values to the results."""
         ntpvals_uncorr = [o.ntpval for o in results]
-        pvals_corrected = self.objmethods.run_multitest_corr(ntpvals_uncorr, log)
+        if terms == 'study_hit':
+            nohit_pop_cnts = self.index.pop_cnts[study_cnts == 0]
+            ntpvals_uncorr.extend(self._get_ntpvals_nohit(study_tot, nohit_pop_cnts))
+        kws_perm = self._get_kws_perm(study_tot, study_cnts, terms)
+        pvals_corrected = self.objmethods.run_multitest_corr(ntpvals_uncorr, log, **kws_perm)
         self._add_multitest(results, pvals_corrected)
-        objres = EnrichmentResults(study_in_pop, results, self, study_name)
-        return objres
+
+    def _get_kws_perm(self, study_tot, study_cnts, terms):
+        """Return the study size and the term of each p-value corrected, for permutations."""
+        if self.objmethods.objperm is None:
+            return {}
+        term_idxs = self._get_term_idxs(study_cnts, terms)
+        if terms == 'study_hit':
+            # Terms without study hits follow, ordered by population count as in _get_pvals_nohit
+            nohit = np.flatnonzero(study_cnts == 0)
+            nohit = nohit[np.argsort(self.index.pop_cnts[nohit], kind='stable')]
+            term_idxs = np.concatenate([term_idxs, nohit])
+        return {'study_tot':study_tot, 'term_idxs':term_idxs}
+
+    def _init_permutation(self):
+        """Return the random study gene sets for permutation corrections, if used."""
+        if not self.objmethods.has_permutation():
+            return None
+        return MultitestPermutation(self.index, self.pop_tot, self.pval_obj,
+                                    permutations=self.args['permutations'],
+                                    seed=self.args['permutation_seed'],
+                                    jobs=self.args['permutation_jobs'])
 
     def _chk_genes(self, study):
         """Check gene sets."""
@@ -72,59 +445,91 @@ class EnrichmentRun():
 
     def _add_multitest(self, results, pvals_corrected):
         """Add multiple-test correction results to each result record."""
-        ntobj_mult = cx.namedtuple('NtM', ' '.join(nt.fieldname for nt in self.objmethods.methods))
-        prtfmt = self._get_prtfmt()
-        ntobj_results = self._get_ntobj()
+        ntobj_mult, prtfmt, ntobj_results = self.get_rec_attrs()
         # print(ntobj_results._fields)
         for rec, pvals_corr in zip(results, zip(*pvals_corrected)):
             rec.multitests = ntobj_mult._make(pvals_corr)
             rec.prtfmt = prtfmt
             rec.ntobj = ntobj_results
 
-    def get_pval_uncorr(self, study_in_pop, log=sys.stdout):
+    def get_rec_attrs(self):
+        """Return the multitests namedtuple, print format, and report namedtuple of records."""
+        if self._rec_attrs is None:
+            ntobj_mult = cx.namedtuple(
+                'NtM', ' '.join(nt.fieldname for nt in self.objmethods.methods))
+            self._rec_attrs = (ntobj_mult, self._get_prtfmt(), self._get_ntobj())
+        return self._rec_attrs
+
+    def get_pval_uncorr(self, study_in_pop, log=sys.stdout, terms='all'):
         """Calculate the uncorrected pvalues for study items."""
-        results = []
-        pop_tot, study_tot = self.pop_tot, len(study_in_pop)
+        gene_idxs = self.index.get_gene_idxs(study_in_pop)
+        study_cnts = self.counter.get_term_cnts(gene_idxs)
+        return self._get_pval_uncorr(len(study_in_pop), gene_idxs, study_cnts, log, terms)
 
-        _get_ntpval = self.pval_obj.get_nt
-        term2stuids = self._get_term2ids(study_in_pop)
-        allterms = set(term2stuids).union(self.term2popids)
+    def _get_pval_uncorr(self, study_tot, gene_idxs, study_cnts, log, terms):
+        """Calculate the uncorrected pvalues, given the study hit count for every term."""
+        index = self.index
+        term_idxs = self._get_term_idxs(study_cnts, terms)
         if log:
-            log.write(self.patpval.format(N=len(allterms), PFNC=self.pval_obj.name))
-        for goid in allterms:
-            study_items = term2stuids.get(goid, set())
-            study_cnt = len(study_items)
-            pop_items = self.term2popids.get(goid, set())
-            pop_cnt = len(pop_items)
+            log.write(self.patpval.format(N=len(term_idxs), PFNC=self.pval_obj.name))
+        # Calculate all p-values in one call so vectorized p-value functions may be used
+        ntpvals = self.pval_obj.get_nts(
+            study_cnts[term_idxs].tolist(), study_tot,
+            index.pop_cnts[term_idxs].tolist(), self.pop_tot)
+        if log and self.pval_obj.memo is not None:
+            log.write("  {MEMO}\n".format(MEMO=self.pval_obj.memo))
+        return self._get_records(gene_idxs, term_idxs, ntpvals)
 
-            one_record = EnrichmentRecord(
-                goid,
-                ntpval=_get_ntpval(study_cnt, study_tot, pop_cnt, pop_tot),
-                stu_items=study_items,
-                pop_items=pop_items)
+    def _get_records(self, gene_idxs, term_idxs, ntpvals):
+        """Return result records of terms, given their uncorrected p-value namedtuples."""
+        # Strings are only needed for reporting: Study and population items are created on use
+        studyitems = StudyItems(self.index, gene_idxs)
+        terms_str = self.index.terms
+        return [EnrichmentRecord(terms_str[i], nt, studyitems=studyitems)
+                for i, nt in zip(term_idxs.tolist(), ntpvals)]
 
-            results.append(one_record)
+    def _get_term_idxs(self, study_cnts, terms):
+        """Return the indexes of the terms to report."""
+        # Report terms in population order so every study has the same, repeatable order
+        if terms == 'study_hit':
+            return np.flatnonzero(study_cnts)
+        return np.arange(len(self.index.terms))
 
-        return results
+    def _get_study_incidence(self, studies_gene_idxs):
+        """Return a sparse study by population-gene matrix, one row per study."""
+        from scipy.sparse import csr_matrix
+        indptr = np.zeros(len(studies_gene_idxs) + 1, dtype=np.int64)
+        np.cumsum([len(idxs) for idxs in studies_gene_idxs], out=indptr[1:])
+        indices = np.concatenate(list(studies_gene_idxs))
+        return csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                          shape=(len(studies_gene_idxs), len(self.index.genes)))
+
+    def _get_pvals_nohit(self, study_tot, nohit_pop_cnts):
+        """Get p-values for the terms having no study hits, which were not reported."""
+        pop_cnts, nums = np.unique(nohit_pop_cnts, return_counts=True)
+        # Terms having the same number of population items have the same p-value
+        pvals = self.pval_obj.get_pvals(
+            [0]*len(pop_cnts), study_tot, pop_cnts.tolist(), self.pop_tot)
+        return np.repeat(np.array(pvals, dtype=float), nums)
+
+    def _get_ntpvals_nohit(self, study_tot, nohit_pop_cnts):
+        """Get p-values for the terms having no study hits, which were not reported."""
+        pop_cnts, nums = np.unique(nohit_pop_cnts, return_counts=True)
+        # Terms having the same number of population items have the same p-value
+        ntpvals = self.pval_obj.get_nts(
+            [0]*len(pop_cnts), study_tot, pop_cnts.tolist(), self.pop_tot)
+        return [nt for nt, num in zip(ntpvals, nums) for _ in range(num)]
 
     def _get_study_ids(self, study_ids, prt):
         """Get the study IDs which are in the association and in the population."""
         if not study_ids:
             return {}
         study_in_pop = set(study_ids).intersection(self.pop_ids)
-        self._prt_perc_found('study', 'population and association', study_in_pop, study_ids, prt)
+        if prt:
+            self._prt_perc_found(
+                'study', 'population and association', study_in_pop, study_ids, prt)
         return study_in_pop
 
-    def _get_term2ids(self, geneset):
-        """Get the terms in the IDs group"""
-        term2ids = cx.defaultdict(set)
-        _assc = self.assc
-        genes_in_assc = geneset.intersection(_assc)  # [g for g in geneset if g in assoc]
-        for gene in genes_in_assc:
-            for goid in _assc[gene]:
-                term2ids[goid].add(gene)
-        return {t:ids for t, ids in term2ids.items()}
-
     @staticmethod
     def _prt_perc_found(strcur, strtot, ids_cur, ids_tot, prt=sys.stdout):
         """Print percentage IDs found in the association."""
@@ -5,8 +5,11 @@ __author__ = "various"
 
 import os
 import sys
+import json
+import hashlib
 import numpy as np
 import collections as cx
+from enrichmentanalysis.enrich_index import EnrichmentIndex
 
 
 # https://docs.scipy.org/doc/numpy/user/basics.io.genfromtxt.html
@@ -69,7 +72,7 @@ def read_ids(file_txt, sep=None):
     print(msg)
     return ret
 
-def read_associations(assoc_fn):
+def read_associations(assoc_fn, population_ids=None):
     """
     Reads a gene id go term association file. The format of the file
     is as follows:
@@ -91,28 +94,138 @@ def read_associations(assoc_fn):
     AAR2    GO:0040029
 
     :param assoc_fn: file name of the association
+    :param population_ids: if provided, only genes in the population are kept
     :return: dictionary having keys: gene id, values set of GO terms
     """
-    assoc = cx.defaultdict(set)
+    assoc = {}
+    for gene_id, terms in iter_associations(assoc_fn, population_ids):
+        # Genes repeated on lines which are not adjacent are yielded more than once
+        if gene_id in assoc:
+            assoc[gene_id] |= terms
+        else:
+            assoc[gene_id] = terms
+    print('  {N:6,} POPULATION IDs READ: {FILE}'.format(
+        N=len(assoc), FILE=assoc_fn))
+    return assoc
+
+def iter_associations(assoc_fn, population_ids=None):
+    """Yield (gene id, set of terms) while reading an association file one line at a time.
+
+    Duplicate terms are removed. Adjacent lines for the same gene are yielded together.
+    If population_ids is provided, the terms of genes not in the population are never split.
+    See read_associations for the file formats.
+    """
+    gene_prev = None
+    terms_prev = None
     with open(assoc_fn) as ifstrm:
         for row in ifstrm:
-            atoms = row.split()
-            num_atoms = len(atoms)
-            if num_atoms == 2:
-                gene_id, go_terms = atoms
-            elif num_atoms > 2 and row.count('\t') == 1:
-                gene_id, go_terms = row.split("\t")
-            else:
+            gene_id, go_terms = _split_association(row)
+            if gene_id is None or (population_ids is not None and gene_id not in population_ids):
                 continue
-            gos = set(go_terms.split(";"))
-            assoc[gene_id] |= gos
-        print('  {N:6,} POPULATION IDs READ: {FILE}'.format(
-            N=len(assoc), FILE=assoc_fn))
-    return {p:es for p, es in assoc.items()}
+            if gene_id == gene_prev:
+                terms_prev.update(go_terms.split(";"))
+                continue
+            if gene_prev is not None:
+                yield gene_prev, terms_prev
+            gene_prev = gene_id
+            terms_prev = set(go_terms.split(";"))
+    if gene_prev is not None:
+        yield gene_prev, terms_prev
+
+def _split_association(row):
+    """Return the gene id and the unsplit terms on one association line."""
+    # A gene id may contain spaces if it is separated from its terms by a single tab
+    if row.count('\t') == 1:
+        gene_id, go_terms = row.split('\t')
+        gene_id = gene_id.strip()
+        go_terms = go_terms.strip()
+        if gene_id and go_terms:
+            return gene_id, go_terms
+        return None, None
+    atoms = row.split()
+    if len(atoms) == 2:
+        return atoms
+    return None, None
+
+def compile_associations(assoc_fn, dir_cache=None):
+    """Write an association file as string tables and CSR arrays which can be memory-mapped."""
+    if dir_cache is None:
+        dir_cache = get_dir_cache(assoc_fn)
+    if not os.path.isdir(dir_cache):
+        os.makedirs(dir_cache)
+    fin_src = os.path.join(dir_cache, 'source.json')
+    # The cache is not fresh while it is being written
+    if os.path.exists(fin_src):
+        os.remove(fin_src)
+    index = EnrichmentIndex(read_associations(assoc_fn).items())
+    for name in CACHE_ARRAYS:
+        np.save(os.path.join(dir_cache, name + '.npy'), np.asarray(getattr(index, name)))
+    with open(fin_src, 'w') as prt:
+        json.dump(_get_source_info(assoc_fn), prt)
+    print('  {N:6,} GENEs {M:6,} TERMs COMPILED: {DIR}'.format(
+        N=len(index.genes), M=len(index.terms), DIR=dir_cache))
+    return dir_cache
+
+def read_compiled_associations(dir_cache):
+    """Return an EnrichmentIndex using memory-mapped CSR arrays from a compiled association."""
+    arrays = {name:np.load(os.path.join(dir_cache, name + '.npy'), mmap_mode='r')
+              for name in CACHE_ARRAYS}
+    # Interned strings are Python objects; the CSR arrays remain memory-mapped
+    for name in ('genes', 'terms'):
+        arrays[name] = arrays[name].tolist()
+    return EnrichmentIndex.from_arrays(**arrays)
+
+def read_associations_cached(assoc_fn, population_ids=None, dir_cache=None, verify=False):
+    """Return a compiled association if it is fresh. Otherwise read the association file."""
+    if dir_cache is None:
+        dir_cache = get_dir_cache(assoc_fn)
+    if is_cache_fresh(assoc_fn, dir_cache, verify):
+        index = read_compiled_associations(dir_cache)
+        print('  {N:6,} ASSOCIATION IDs LOADED: {DIR}'.format(N=len(index.genes), DIR=dir_cache))
+        return index
+    return read_associations(assoc_fn, population_ids)
+
+def is_cache_fresh(assoc_fn, dir_cache, verify=False):
+    """Return True if the compiled association was compiled from the current association file.
+
+    A matching size and modification time is trusted. The association file is hashed only
+    if its modification time changed but its size did not, or if verify is True.
+    """
+    fin_src = os.path.join(dir_cache, 'source.json')
+    if not os.path.exists(fin_src):
+        return False
+    with open(fin_src) as ifstrm:
+        src = json.load(ifstrm)
+    stat = os.stat(assoc_fn)
+    if src['size'] != stat.st_size:
+        return False
+    if src['mtime_ns'] == stat.st_mtime_ns and not verify:
+        return True
+    return src['sha1'] == _get_sha1(assoc_fn)
+
+def get_dir_cache(assoc_fn):
+    """Return the default directory for a compiled association."""
+    return '{ASSC}.cache'.format(ASSC=assoc_fn)
+
+def _get_source_info(assoc_fn):
+    """Return size, modification time, and hash of the association file."""
+    stat = os.stat(assoc_fn)
+    return {'size':stat.st_size, 'mtime_ns':stat.st_mtime_ns, 'sha1':_get_sha1(assoc_fn)}
+
+def _get_sha1(fin):
+    """Return the SHA-1 hash of a file's contents."""
+    sha1 = hashlib.sha1()
+    with open(fin, 'rb') as ifstrm:
+        for chunk in iter(lambda: ifstrm.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+# EnrichmentIndex attributes saved in a compiled association, one .npy file each
+CACHE_ARRAYS = ('genes', 'terms', 'gene_indptr', 'gene_terms', 'term_indptr', 'term_genes')
 
 def prepend(file_prefix, fout):
-    """Prepend user-requested text to a filename."""
-    if file_prefix is None:
+    """Prepend user-requested text to a filename. '-' (stdout) is returned unchanged."""
+    if file_prefix is None or fout == '-':
         return fout
     fdir, fname = os.path.split(fout)
     return os.path.join(fdir, '{PRE}{FILE}'.format(PRE=file_prefix, FILE=fname))
@@ -2,9 +2,9 @@
 
 # import sys
 # import random
-# import numpy as np
+import os
 import collections as cx
-from statsmodels.sandbox.stats.multicomp import multipletests
+import numpy as np
 
 __copyright__ = "Copyright (C) 2015-2019, DV Klopfenstein. All rights reserved."
 __author__ = "DV Klopfenstein"
@@ -15,7 +15,21 @@ class MethodsAll():
     """All methods."""
 
     # https://github.com/statsmodels/statsmodels/blob/master/statsmodels/stats/multitest.py
+    # Methods without a prefix use the first source having them: numpy, which matches
+    # statsmodels, keeps statsmodels out of the default run. sm_ selects statsmodels.
     all_methods = [
+        ("numpy", (
+            'bonferroni',     #  0) Bonferroni one-step correction
+            'sidak',          #  1) Sidak one-step correction
+            'holm-sidak',     #  2) Holm-Sidak step-down method using Sidak adjustments
+            'holm',           #  3) Holm step-down method using Bonferroni adjustments
+            'simes-hochberg', #  4) Simes-Hochberg step-up method  (independent)
+            'hommel',         #  5) Hommel closed method based on Simes tests (non-negative)
+            'fdr_bh',         #  6) FDR Benjamini/Hochberg  (non-negative)
+            'fdr_by',         #  7) FDR Benjamini/Yekutieli (negative)
+            'fdr_tsbh',       #  8) FDR 2-stage Benjamini-Hochberg (non-negative)
+            'fdr_tsbky',      #  9) FDR 2-stage Benjamini-Krieger-Yekutieli (non-negative)
+            )),
         ("statsmodels", (
             'bonferroni',     #  0) Bonferroni one-step correction
             'sidak',          #  1) Sidak one-step correction
@@ -28,8 +42,11 @@ class MethodsAll():
             'fdr_tsbh',       #  8) FDR 2-stage Benjamini-Hochberg (non-negative)
             'fdr_tsbky',      #  9) FDR 2-stage Benjamini-Krieger-Yekutieli (non-negative)
             )),
+        ("permutation", (
+            'wy_minp',        #  0) Westfall-Young step-down min-p from random study gene sets
+            )),
     ]
-    prefixes = {'statsmodels':'sm_'}
+    prefixes = {'numpy':'np_', 'statsmodels':'sm_'}
 
     def __init__(self):
         self.srcmethod2fieldname = self._init_srcmethod2fieldname()
@@ -78,31 +95,85 @@ class Methods():
         self.all = MethodsAll()
         _ini = _Init(self.all)
         self._srcmethod2fieldname = _ini.srcmethod2fieldname
-        self.statsmodels_multicomp = multipletests
+        self.statsmodels_multicomp = None
+        # MultitestPermutation, set by an EnrichmentRun if a permutation method is used
+        self.objperm = None
         if usr_methods is None:
             usr_methods = ['fdr_bh']
         self.methods = _ini.get_methods(usr_methods)
 
-    def run_multitest_corr(self, ntpvals_uncorr, log):
+    def run_multitest_corr(self, ntpvals_uncorr, log, **kws_perm):
         """Do multiple-test corrections on uncorrected pvalues."""
         # ntobj = cx.namedtuple("ntobj", "results pvals_uncorr alpha nt_method study")
+        pvals_uncorr = np.fromiter((nt.pval_uncorr for nt in ntpvals_uncorr), dtype=float)
+        enrichments = [nt.enrichment for nt in ntpvals_uncorr] if log is not None else None
+        return self.run_multitest_pvals(pvals_uncorr, log, enrichments, **kws_perm)
+
+    def run_multitest_pvals(self, pvals_uncorr, log, enrichments=None, **kws_perm):
+        """Do multiple-test corrections on an array of uncorrected pvalues.
+
+        kws_perm: study_tot and term_idxs (the term of each p-value), for permutation methods
+        """
         pvals_corrected = []
-        pvals_uncorr = [nt.pval_uncorr for nt in ntpvals_uncorr]
+        # P-values are sorted once for all methods from the numpy source
+        objnumpy = None
         for nt_method in self.methods:  # usrmethod_flds:
-            # NtMethodInfo(source='statsmodels', method='bonferroni', fieldname='bonferroni'))
-            # NtMethodInfo(source='statsmodels', method='fdr_bh', fieldname='fdr_bh'))
-            ntres = self._run_multitest_statsmodels(pvals_uncorr, nt_method.method)
+            # NtMethodInfo(source='numpy', method='bonferroni', fieldname='bonferroni'))
+            # NtMethodInfo(source='statsmodels', method='fdr_bh', fieldname='sm_fdr_bh'))
+            if nt_method.source == 'numpy':
+                if objnumpy is None:
+                    objnumpy = MultitestNumpy(pvals_uncorr, self.alpha)
+                ntres = objnumpy.run_multitest(nt_method.method)
+            elif nt_method.source == 'permutation':
+                ntres = self._run_multitest_permutation(pvals_uncorr, nt_method.method, kws_perm)
+            else:
+                ntres = self._run_multitest_statsmodels(pvals_uncorr, nt_method.method)
             # attr_mult = "p_{M}".format(M=self.get_fieldname(nt_method.source, nt_method.method))
             pvals_corrected.append(ntres.pvals_corrected)
             if log is not None:
-                self._log_multitest_corr(log, ntres, ntpvals_uncorr, nt_method)
+                self._log_multitest_corr(log, ntres, enrichments, nt_method)
         assert len(pvals_corrected) == len(self.methods)
         return pvals_corrected
 
-    def _log_multitest_corr(self, log, ntres, ntpvals_uncorr, nt_method):
+    def run_multitest_studies(self, pvals_uncorr, log, enrichments=None, kws_perms=None):
+        """Do multiple-test corrections on the uncorrected p-values of many studies.
+
+        pvals_uncorr: A 2-D array with the p-values of one study in each row
+        Methods from the numpy source correct all studies at once; others, one study at a time.
+        kws_perms: study_tot and term_idxs of each study, for permutation methods
+        Return the corrected p-values of each method in a 2-D array, one study in each row.
+        """
+        pvals_corrected = []
+        objnumpy = None
+        for nt_method in self.methods:
+            if nt_method.source == 'numpy':
+                if objnumpy is None:
+                    objnumpy = MultitestNumpy(pvals_uncorr, self.alpha)
+                ntres = objnumpy.run_multitest(nt_method.method)
+                rejects = ntres.reject_lst
+                pvals_corrected.append(ntres.pvals_corrected)
+            else:
+                ntress = [self._run_multitest_study(nt_method, pvals, kws_perms, row)
+                          for row, pvals in enumerate(pvals_uncorr)]
+                rejects = [nt.reject_lst for nt in ntress]
+                pvals_corrected.append(np.array([nt.pvals_corrected for nt in ntress]))
+            if log is not None:
+                for reject, study_enrichments in zip(rejects, enrichments):
+                    ntres = self.ntresstat(reject, None, None, None)
+                    self._log_multitest_corr(log, ntres, study_enrichments, nt_method)
+        return pvals_corrected
+
+    def _run_multitest_study(self, nt_method, pvals_uncorr, kws_perms, row):
+        """Do one multiple-test correction from statsmodels or permutations on one study."""
+        if nt_method.source == 'permutation':
+            return self._run_multitest_permutation(
+                pvals_uncorr, nt_method.method, kws_perms[row] if kws_perms else None)
+        return self._run_multitest_statsmodels(pvals_uncorr, nt_method.method)
+
+    def _log_multitest_corr(self, log, ntres, enrichments, nt_method):
         """Print information regarding multitest correction results."""
         _alpha = self.alpha
-        eps = [nt.enrichment for pf, nt in zip(ntres.reject_lst, ntpvals_uncorr) if pf]
+        eps = [ep for pf, ep in zip(ntres.reject_lst, enrichments) if pf]
         sig_cnt = len(eps)
         ctr = cx.Counter(eps)
         log.write("{N:8,} terms ".format(N=sig_cnt))
@@ -113,7 +184,7 @@ class Methods():
     def _run_multitest_statsmodels(self, pvals_uncorr, method):
         """Use multitest mthods that have been implemented in statsmodels."""
         # print(len(pvals_uncorr), self.alpha, method)
-        results = self.statsmodels_multicomp(pvals_uncorr, self.alpha, method)
+        results = self.get_statsmodels_multipletests()(pvals_uncorr, self.alpha, method)
         # self._update_pvalcorr(ntmt, pvals_corrected)
         return self.ntresstat(
             reject_lst=results[0],
@@ -121,6 +192,16 @@ class Methods():
             alphacSidak=results[2],
             alphacBonf=results[3])
 
+    def _run_multitest_permutation(self, pvals_uncorr, method, kws_perm):
+        """Use multitest methods which compare p-values to p-values of random study gene sets."""
+        assert self.objperm is not None and kws_perm, \
+            "METHOD({M}) NEEDS THE STUDY GENES AND TERMS OF AN EnrichmentRun".format(M=method)
+        return self.objperm.run_multitest(method, pvals_uncorr, self.alpha, **kws_perm)
+
+    def has_permutation(self):
+        """Return True if a permutation method is used."""
+        return any(nt.source == 'permutation' for nt in self.methods)
+
     # def run_multipletests(self, pvals_uncorr):
     #     """Run multiple-test correction."""
     #     return self.statsmodels_multicomp(pvals_uncorr, self.alpha,
@@ -129,11 +210,13 @@ class Methods():
         """Get the name of the method used to create namedtuple fieldnames which store floats."""
         return self._srcmethod2fieldname[(method_source, method)]
 
-    #### def get_statsmodels_multipletests(self):
-    ####     if self.statsmodels_multicomp is not None:
-    ####         return self.statsmodels_multicomp
-    ####     self.statsmodels_multicomp = multipletests
-    ####     return self.statsmodels_multicomp
+    def get_statsmodels_multipletests(self):
+        """Import statsmodels only if a statsmodels method is used."""
+        if self.statsmodels_multicomp is not None:
+            return self.statsmodels_multicomp
+        from statsmodels.sandbox.stats.multicomp import multipletests
+        self.statsmodels_multicomp = multipletests
+        return self.statsmodels_multicomp
 
     def get_patfmt(self):
         """Get pattern format for values in each method."""
@@ -148,10 +231,345 @@ class Methods():
         return ' '.join(['{METHOD}'.format(METHOD=m.fieldname) for m in self.methods])
 
 
+class MultitestNumpy():
+    """Multiple-test corrections computed with numpy from p-values which are sorted once.
+
+    Corrected p-values and rejections match statsmodels multipletests (maxiter=1).
+    pvals_uncorr is one set of p-values, or a 2-D array with one set of p-values per row,
+    which are corrected separately, all at once.
+    """
+
+    def __init__(self, pvals_uncorr, alpha=0.05):
+        self.alpha = alpha
+        pvals_uncorr = np.asarray(pvals_uncorr, dtype=float)
+        self.ntests = pvals_uncorr.shape[-1]
+        # Order statistics shared by all methods
+        self.sortind = np.argsort(pvals_uncorr, axis=-1)
+        self.pvals = np.take_along_axis(pvals_uncorr, self.sortind, axis=-1)
+        self.ranks_rev = np.arange(self.ntests, 0, -1)
+        self.ecdffactor = np.arange(1, self.ntests+1)/float(self.ntests)
+        self._log1mp = None
+        self._fdr_bh = None
+        self.method2fnc = {
+            'bonferroni':self._get_bonferroni,
+            'sidak':self._get_sidak,
+            'holm-sidak':self._get_holm_sidak,
+            'holm':self._get_holm,
+            'simes-hochberg':self._get_simes_hochberg,
+            'hommel':self._get_hommel,
+            'fdr_bh':self._get_fdr_bh,
+            'fdr_by':self._get_fdr_by,
+            'fdr_tsbh':lambda: self._get_fdr_twostage(1.),
+            'fdr_tsbky':lambda: self._get_fdr_twostage(1.+self.alpha),
+        }
+
+    def run_multitest(self, method):
+        """Return reject, corrected p-values, and corrected alphas in the original order."""
+        if self.ntests == 0:
+            return Methods.ntresstat(
+                reject_lst=np.zeros(self.pvals.shape, dtype=bool),
+                pvals_corrected=np.zeros(self.pvals.shape),
+                alphacSidak=None, alphacBonf=None)
+        reject, pvals_corrected = self.method2fnc[method]()
+        pvals_corrected = np.minimum(pvals_corrected, 1.)
+        reject_lst = np.empty_like(reject)
+        np.put_along_axis(reject_lst, self.sortind, reject, axis=-1)
+        pvals_corrected_ = np.empty_like(pvals_corrected)
+        np.put_along_axis(pvals_corrected_, self.sortind, pvals_corrected, axis=-1)
+        return Methods.ntresstat(
+            reject_lst=reject_lst,
+            pvals_corrected=pvals_corrected_,
+            alphacSidak=1 - np.power((1. - self.alpha), 1./self.ntests),
+            alphacBonf=self.alpha/float(self.ntests))
+
+    def _get_bonferroni(self):
+        """Bonferroni one-step correction."""
+        return self.pvals <= self.alpha/float(self.ntests), self.pvals*float(self.ntests)
+
+    def _get_sidak(self):
+        """Sidak one-step correction."""
+        alphac = 1 - np.power((1. - self.alpha), 1./self.ntests)
+        return self.pvals <= alphac, -np.expm1(self.ntests*self._get_log1mp())
+
+    def _get_holm_sidak(self):
+        """Holm-Sidak step-down method using Sidak adjustments."""
+        alphacs = 1 - np.power((1. - self.alpha), 1./self.ranks_rev)
+        reject = self._get_reject_stepdown(self.pvals > alphacs)
+        pvals_corrected = -np.expm1(self.ranks_rev*self._get_log1mp())
+        return reject, np.maximum.accumulate(pvals_corrected, axis=-1)
+
+    def _get_holm(self):
+        """Holm step-down method using Bonferroni adjustments."""
+        reject = self._get_reject_stepdown(self.pvals > self.alpha/self.ranks_rev)
+        return reject, np.maximum.accumulate(self.pvals*self.ranks_rev, axis=-1)
+
+    def _get_simes_hochberg(self):
+        """Simes-Hochberg step-up method."""
+        reject = self._get_reject_stepup(self.pvals <= self.alpha/self.ranks_rev)
+        pvals_corrected = self.ranks_rev*self.pvals
+        return reject, self._get_cummin_rev(pvals_corrected)
+
+    def _get_hommel(self):
+        """Hommel closed method based on Simes tests, run on each set of p-values."""
+        if self.pvals.ndim == 1:
+            return self._get_hommel_sorted(self.pvals)
+        rejects, pvals_corrected = zip(*[self._get_hommel_sorted(p) for p in self.pvals])
+        return np.array(rejects), np.array(pvals_corrected)
+
+    def _get_hommel_sorted(self, pvals):
+        """Hommel closed method based on Simes tests, in O(n log n) rather than O(n^2) time.
+
+        With cim(m) from _get_hommel_cims and C(m) = max(cim(m), ..., cim(n)), p(i) is corrected
+        to max(J*p(i), C(J+1)). J is the number of m < n-i+1 with C(m) > m*p(i), counting m=1.
+        """
+        ntests = self.ntests
+        cims = self._get_hommel_cims(pvals)
+        # C(m) for m = 0..n+1, with C(n+1) = 0
+        cmax = np.zeros(ntests+2)
+        cmax[2:ntests+1] = np.maximum.accumulate(cims[:1:-1])[::-1]
+        # C(m)/m does not increase, so the m with C(m) > m*p(i) are m=2, 3, ..., J
+        ratios = cmax[2:ntests+1]/np.arange(2, ntests+1)
+        jidxs = 1 + np.searchsorted(-ratios, -pvals, side='left')
+        jidxs = np.maximum(1, np.minimum(jidxs, self.ranks_rev - 1))
+        pvals_corrected = np.maximum(jidxs*pvals, cmax[jidxs+1])
+        return pvals_corrected <= self.alpha, pvals_corrected
+
+    def _get_hommel_cims(self, pvals):
+        """Return cim(m) = min(m*p(n-m+k)/k for k in 1..m) for m = 0..n using a lower hull.
+
+        p(j)/(j-t), with t = n-m, is the slope from (t, 0) to (j, p(j)). Its minimum is where a
+        line from (t, 0) touches the lower convex hull of the points j > t.
+        """
+        pvals = pvals.tolist()
+        ntests = self.ntests
+        cims = np.zeros(ntests+1)
+        # Lower hull of the points (j, p(j)), j > t, with the leftmost point last
+        xs = []
+        ys = []
+        for tval in range(ntests-1, -1, -1):
+            xval = tval + 1
+            yval = pvals[tval]
+            while len(xs) >= 2 and (ys[-1]-yval)*(xs[-2]-xval) >= (ys[-2]-yval)*(xs[-1]-xval):
+                xs.pop()
+                ys.pop()
+            xs.append(xval)
+            ys.append(yval)
+            # Binary search for the first hull point where the next hull edge is not less steep
+            lo_ = 0
+            hi_ = len(xs) - 1
+            while lo_ < hi_:
+                mid = (lo_ + hi_)//2
+                idx = -1 - mid
+                if (ys[idx-1]-ys[idx])*(xs[idx]-tval) >= ys[idx]*(xs[idx-1]-xs[idx]):
+                    hi_ = mid
+                else:
+                    lo_ = mid + 1
+            mval = ntests - tval
+            cims[mval] = mval*pvals[xs[-1-lo_]-1]/(xs[-1-lo_]-tval)
+        return cims
+
+    def _get_fdr_bh(self):
+        """FDR Benjamini/Hochberg."""
+        return self._get_reject_fdr(self.alpha), self._get_pvals_fdr_bh()
+
+    def _get_fdr_by(self):
+        """FDR Benjamini/Yekutieli."""
+        ecdffactor = self.ecdffactor/np.sum(1./np.arange(1, self.ntests+1))
+        reject = self._get_reject_stepup(self.pvals <= ecdffactor*self.alpha)
+        pvals_corrected = self.pvals/ecdffactor
+        return reject, self._get_cummin_rev(pvals_corrected)
+
+    def _get_fdr_twostage(self, fact):
+        """FDR two-stage: Benjamini-Hochberg (fact=1) or Benjamini-Krieger-Yekutieli."""
+        alpha_prime = self.alpha/fact
+        reject = self._get_reject_fdr(alpha_prime)
+        num_reject = reject.sum(axis=-1, keepdims=True)
+        # The first stage BH corrected p-values, clipped to 1, are reused in the second stage
+        pvals_corrected = np.minimum(self._get_pvals_fdr_bh(), 1.)
+        # P-values with no or all first stage rejections keep their first stage results
+        is_stage1 = (num_reject == 0) | (num_reject == self.ntests)
+        if is_stage1.all():
+            return reject, pvals_corrected*fact
+        # Second stage: Alpha is adjusted for the estimated number of true null hypotheses
+        ntests0 = 1.0*self.ntests - np.where(is_stage1, 0, num_reject)
+        reject2 = self._get_reject_fdr(alpha_prime*self.ntests/ntests0)
+        pvals_corrected2 = pvals_corrected*(ntests0*1.0/self.ntests)
+        if fact != 1.:
+            pvals_corrected2 = pvals_corrected2*fact
+        return (np.where(is_stage1, reject, reject2),
+                np.where(is_stage1, pvals_corrected*fact, pvals_corrected2))
+
+    def _get_reject_fdr(self, alpha):
+        """Return rejections of the Benjamini/Hochberg linear step-up procedure."""
+        return self._get_reject_stepup(self.pvals <= self.ecdffactor*alpha)
+
+    def _get_pvals_fdr_bh(self):
+        """Return the Benjamini/Hochberg corrected p-values, which do not depend on alpha."""
+        if self._fdr_bh is None:
+            self._fdr_bh = self._get_cummin_rev(self.pvals/self.ecdffactor)
+        return self._fdr_bh
+
+    @staticmethod
+    def _get_cummin_rev(pvals_corrected):
+        """Return the minimum of each corrected p-value and the corrected p-values after it."""
+        return np.minimum.accumulate(pvals_corrected[..., ::-1], axis=-1)[..., ::-1]
+
+    def _get_log1mp(self):
+        """Return log(1-p) for the sorted p-values."""
+        if self._log1mp is None:
+            # p-values of 1 (e.g., terms with no study hits) give -inf, as intended
+            with np.errstate(divide='ignore'):
+                self._log1mp = np.log1p(-self.pvals)
+        return self._log1mp
+
+    @staticmethod
+    def _get_reject_stepdown(notreject):
+        """Step-down: Reject all hypotheses before the first one which is not rejected."""
+        return np.logical_and.accumulate(~notreject, axis=-1)
+
+    @staticmethod
+    def _get_reject_stepup(reject):
+        """Step-up: Reject all hypotheses up to the last one which is rejected."""
+        return np.logical_or.accumulate(reject[..., ::-1], axis=-1)[..., ::-1]
+
+
+class MultitestPermutation():
+    """Westfall-Young step-down min-p p-values from random study gene sets of the same size.
+
+    Each permutation draws study_tot genes from the population. The study hits of every term
+    for a chunk of permutations are counted in one sparse product; chunks hold at most
+    max_cells counts. Permutation i is drawn from seed (seed, i), so the corrected p-values
+    are the same for any chunk size or number of processes.
+    """
+
+    def __init__(self, index, pop_tot, pval_obj, **kws):
+        self.index = index
+        self.pop_tot = pop_tot
+        self.pval_obj = pval_obj
+        self.num_perms = kws.get('permutations', 1000)
+        self.seed = kws.get('seed', 0)
+        # Number of processes; None for the number of CPUs
+        self.jobs = kws.get('jobs', 1) or os.cpu_count()
+        self.max_cells = kws.get('max_cells', 1 << 22)
+        # Sparse gene-by-term incidence matrix; created on first use
+        self._incidence = None
+        assert self.num_perms > 0, "PERMUTATIONS({N}) MUST BE > 0".format(N=self.num_perms)
+
+    def __getstate__(self):
+        """Processes which are not forked recreate the incidence matrix."""
+        state = self.__dict__.copy()
+        state['_incidence'] = None
+        return state
+
+    def run_multitest(self, method, pvals_uncorr, alpha, study_tot, term_idxs):
+        """Return reject and corrected p-values in the order of the uncorrected p-values."""
+        assert method == 'wy_minp', "UNKNOWN PERMUTATION METHOD({M})".format(M=method)
+        pvals_corrected = self.get_pvals_minp(pvals_uncorr, study_tot, term_idxs)
+        return Methods.ntresstat(
+            reject_lst=pvals_corrected <= alpha, pvals_corrected=pvals_corrected,
+            alphacSidak=None, alphacBonf=None)
+
+    def get_pvals_minp(self, pvals_uncorr, study_tot, term_idxs):
+        """Return step-down min-p corrected p-values of terms, given their uncorrected p-values.
+
+        p(1) <= ... <= p(m) are the sorted p-values. The corrected p(i) is the fraction of
+        permutations in which the minimum p-value of the terms of p(i), ..., p(m) is <= p(i),
+        made non-decreasing in i.
+        """
+        pvals_uncorr = np.asarray(pvals_uncorr, dtype=float)
+        if not pvals_uncorr.size:
+            return np.zeros(0)
+        order = np.argsort(pvals_uncorr, kind='stable')
+        args = (study_tot, np.asarray(term_idxs)[order], pvals_uncorr[order])
+        chunksize = max(1, self.max_cells//len(self.index.terms))
+        chunks = [range(i, min(i + chunksize, self.num_perms))
+                  for i in range(0, self.num_perms, chunksize)]
+        if self.jobs == 1 or len(chunks) == 1:
+            cnts = sum(self.get_cnts_le(perms, *args) for perms in chunks)
+        else:
+            cnts = sum(self._get_cnts_le_parallel(chunks, args))
+        pvals_corrected = np.empty(pvals_uncorr.size)
+        pvals_corrected[order] = np.maximum.accumulate(cnts/float(self.num_perms))
+        return pvals_corrected
+
+    def get_cnts_le(self, perms, study_tot, term_idxs, pvals):
+        """For each term, count permutations where the successive minimum p-value is <= pvals.
+
+        term_idxs and pvals are sorted by p-value.
+        """
+        cnts_stu = self._get_study_cnts(perms, study_tot)[:, term_idxs]
+        # Calculate the p-value of each distinct (study count, population count) once
+        pop_cnts, pop_idxs = np.unique(self.index.pop_cnts[term_idxs], return_inverse=True)
+        keys = cnts_stu*len(pop_cnts) + pop_idxs
+        is_key = np.zeros(int(keys.max()) + 1, dtype=bool)
+        is_key[keys] = True
+        keys_uniq = np.flatnonzero(is_key)
+        pvals_key = np.empty(is_key.size)
+        pvals_key[keys_uniq] = self.pval_obj.get_pvals(
+            (keys_uniq//len(pop_cnts)).tolist(), study_tot,
+            pop_cnts[keys_uniq % len(pop_cnts)].tolist(), self.pop_tot)
+        pvals_perm = pvals_key[keys]
+        # Minimum p-value of terms i..m in each permutation
+        pvals_min = np.minimum.accumulate(pvals_perm[:, ::-1], axis=1)[:, ::-1]
+        return (pvals_min <= pvals).sum(axis=0)
+
+    def _get_study_cnts(self, perms, study_tot):
+        """Return study hits of every term for random study gene sets: (perms x terms)."""
+        from scipy.sparse import csr_matrix
+        num_genes = len(self.index.genes)
+        genes = [np.random.default_rng([self.seed, i]).choice(num_genes, study_tot, replace=False)
+                 for i in perms]
+        indices = np.concatenate(genes) if genes else np.zeros(0, dtype=np.int64)
+        indptr = np.arange(len(genes) + 1, dtype=np.int64)*study_tot
+        studies = csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                             shape=(len(genes), num_genes))
+        return studies.dot(self._get_incidence()).toarray()
+
+    def _get_incidence(self):
+        """Return the sparse gene-by-term incidence matrix."""
+        if self._incidence is None:
+            self._incidence = self.index.get_incidence()
+        return self._incidence
+
+    def _get_cnts_le_parallel(self, chunks, args):
+        """Count permutations of each chunk in a pool of processes."""
+        # Created before forking, so that worker processes share it
+        self._get_incidence()
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        kws = {
+            'max_workers': min(self.jobs, len(chunks)),
+            'initializer': _init_perm_worker,
+            'initargs': (self,),
+        }
+        if 'fork' in multiprocessing.get_all_start_methods():
+            kws['mp_context'] = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(**kws) as pool:
+            return list(pool.map(_get_cnts_le, [(perms,) + args for perms in chunks]))
+
+
+# Set once in each worker process: The MultitestPermutation
+_OBJPERM = None
+
+def _init_perm_worker(objperm):
+    """Save the MultitestPermutation in the worker process."""
+    # pylint: disable=global-statement
+    global _OBJPERM
+    _OBJPERM = objperm
+
+def _get_cnts_le(args):
+    """Count permutations of one chunk in a worker process."""
+    return _OBJPERM.get_cnts_le(*args)
+
+
+# At module level so that methods may be pickled, as when sending a run to a process pool
+NtMethodInfo = cx.namedtuple("NtMethodInfo", "source method fieldname")
+
+
 class _Init():
     """Initialize Methods object."""
 
-    NtMethodInfo = cx.namedtuple("NtMethodInfo", "source method fieldname")
+    NtMethodInfo = NtMethodInfo
 
     def __init__(self, obj_all_methods):
         self.obj = obj_all_methods
@@ -181,9 +599,8 @@ class _Init():
                 return self.NtMethodInfo(method_source, usr_method, fieldname)
         for src, prefix in self.obj.prefixes.items():
             if usr_method.startswith(prefix):
-                method_source = src
-                method = usr_method[len(prefix):]
-                return self.NtMethodInfo(method_source, method, usr_method)
+                # e.g., np_holm-sidak has the fieldname np_holm_sidak
+                return self._add_method_src(src, usr_method[len(prefix):])
         raise self._rpt_invalid_method(usr_method)
 
     def _add_method_src(self, method_source, usr_method, fieldname=None):
@@ -5,7 +5,9 @@ __author__ = "DV Klopfenstein"
 
 import collections as cx
 import sys
-from scipy import stats
+import threading
+from math import lgamma
+import numpy as np
 
 
 # pylint: disable=too-few-public-methods
@@ -23,6 +25,24 @@ class PvalCalcBase(object):
         self.log = log
         self.name = name
         self.pval_fnc = pval_fnc
+        self.memo = None
+
+    def __getstate__(self):
+        """Open files, such as the log, cannot be pickled; the unpickled log is sys.stdout."""
+        state = self.__dict__.copy()
+        state['log'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.log = sys.stdout
+
+    def set_pop_tot(self, pop_tot):
+        """Prepare for calculating p-values on a population of size pop_tot."""
+
+    def set_memo(self, maxsize):
+        """Remember up to maxsize recently calculated p-values. maxsize=0 turns memo off."""
+        self.memo = PvalMemo(maxsize) if maxsize else None
 
     def calc_pvalue(self, study_count, study_n, pop_count, pop_n):
         """pvalues are calculated in derived classes."""
@@ -31,12 +51,96 @@ class PvalCalcBase(object):
         raise Exception("NOT IMPLEMENTED: {FNC_CALL} using {FNC}.".format(
             FNC_CALL=fnc_call, FNC=self.pval_fnc))
 
+    def calc_pvalues(self, study_cnts, study_n, pop_cnts, pop_n):
+        """Calculate uncorrected p-values for many terms sharing the same study_n and pop_n."""
+        return [self.calc_pvalue(scnt, study_n, pcnt, pop_n)
+                for scnt, pcnt in zip(study_cnts, pop_cnts)]
+
+    def calc_pvalues_studies(self, study_cnts, study_ns, pop_cnts, pop_n):
+        """Calculate uncorrected p-values for terms of many studies, each having its study_n."""
+        return [self.calc_pvalue(scnt, stot, pcnt, pop_n)
+                for scnt, stot, pcnt in zip(study_cnts, study_ns, pop_cnts)]
+
     def get_nt(self, study_cnt, study_tot, pop_cnt, pop_tot):
         """Return P-value namedtuple."""
+        pval = self.get_pvals([study_cnt], study_tot, [pop_cnt], pop_tot)[0]
+        return self._get_nt(pval, study_cnt, study_tot, pop_cnt, pop_tot)
+
+    def get_nts(self, study_cnts, study_tot, pop_cnts, pop_tot):
+        """Return P-value namedtuples for many terms, calculating all p-values in one call."""
+        pvals = self.get_pvals(study_cnts, study_tot, pop_cnts, pop_tot)
+        return self.get_nts_pvals(pvals, study_cnts, study_tot, pop_cnts, pop_tot)
+
+    def get_nts_pvals(self, pvals, study_cnts, study_tot, pop_cnts, pop_tot):
+        """Return P-value namedtuples for many terms, given already calculated p-values."""
+        return [self._get_nt(pval, scnt, study_tot, pcnt, pop_tot)
+                for pval, scnt, pcnt in zip(pvals, study_cnts, pop_cnts)]
+
+    def get_pvals(self, study_cnts, study_tot, pop_cnts, pop_tot):
+        """Return p-values, using closed-form values and the memo before calculating."""
+        pvals = [1.0]*len(study_cnts)
+        # Terms with no study hits have a p-value of 1 if no study hits is the most likely count
+        idxs = [i for i, (scnt, pcnt) in enumerate(zip(study_cnts, pop_cnts))
+                if scnt != 0 or self.get_mode(study_tot, pcnt, pop_tot) != 0]
+        if not idxs:
+            return pvals
+        scnts = [study_cnts[i] for i in idxs]
+        pcnts = [pop_cnts[i] for i in idxs]
+        if self.memo is None:
+            pvals_calc = self.calc_pvalues(scnts, study_tot, pcnts, pop_tot)
+        else:
+            pvals_calc = self.memo.get_pvals(self.calc_pvalues, scnts, study_tot, pcnts, pop_tot)
+        for idx, pval in zip(idxs, pvals_calc):
+            pvals[idx] = pval
+        return pvals
+
+    def get_pvals_studies(self, study_cnts, study_tots, pop_cnts, pop_tot):
+        """Return p-values of every term of many studies, calculating all p-values in one call.
+
+        study_cnts: Study hits, one row per study. study_tots: The size of each study.
+        pop_cnts: Population hits of each term. Each distinct table is calculated once.
+        """
+        scnts = np.asarray(study_cnts, dtype=np.int64)
+        stots = np.broadcast_to(np.asarray(study_tots, dtype=np.int64)[:, None], scnts.shape)
+        pcnts = np.broadcast_to(np.asarray(pop_cnts, dtype=np.int64), scnts.shape)
+        pvals = np.ones(scnts.shape)
+        # Terms with no study hits have a p-value of 1 if no study hits is the most likely count
+        is_calc = (scnts != 0) | (self.get_mode(stots, pcnts, pop_tot) != 0)
+        if not is_calc.any():
+            return pvals
+        # Each distinct table is calculated once
+        tables, inverse = self._get_tables(scnts[is_calc], stots[is_calc], pcnts[is_calc], pop_tot)
+        args = [t.tolist() for t in tables] + [pop_tot]
+        if self.memo is None:
+            pvals_calc = self.calc_pvalues_studies(*args)
+        else:
+            pvals_calc = self.memo.get_pvals_studies(self.calc_pvalues_studies, *args)
+        pvals[is_calc] = np.asarray(pvals_calc, dtype=float)[inverse]
+        return pvals
+
+    @staticmethod
+    def _get_tables(scnts, stots, pcnts, pop_tot):
+        """Return the study_cnts, study_tots, and pop_cnts of distinct tables, and their inverse."""
+        base = pop_tot + 1
+        if base**3 >= 2**63:
+            tables, inverse = np.unique(
+                np.stack([scnts, stots, pcnts], axis=1), axis=0, return_inverse=True)
+            return tables.T, inverse.ravel()
+        # Faster: Each table is stored as one integer
+        keys, inverse = np.unique((stots*base + pcnts)*base + scnts, return_inverse=True)
+        return (keys % base, keys//(base*base), keys//base % base), inverse
+
+    @staticmethod
+    def get_mode(study_tot, pop_cnt, pop_tot):
+        """Return the most likely study count for a term having pop_cnt population items."""
+        return ((pop_cnt + 1)*(study_tot + 1))//(pop_tot + 2)
+
+    def _get_nt(self, pval, study_cnt, study_tot, pop_cnt, pop_tot):
+        """Return P-value namedtuple, given an already calculated p-value."""
         study_ratio = float(study_cnt)/study_tot if study_tot != 0 else 0.0
         pop_ratio = float(pop_cnt)/pop_tot if pop_tot != 0 else 0.0
         return self.ntpval(
-            pval_uncorr=self.calc_pvalue(study_cnt, study_tot, pop_cnt, pop_tot),
+            pval_uncorr=pval,
             study_cnt=study_cnt,
             study_tot=study_tot,
             study_ratio=study_ratio,
@@ -53,13 +157,89 @@ class PvalCalcBase(object):
         return 'p'
 
 
+class PvalMemo(object):
+    """Bounded LRU memo of p-values keyed on (study_cnt, study_tot, pop_cnt, pop_tot)."""
+
+    ntinfo = cx.namedtuple('NtMemoInfo', 'hits misses maxsize currsize')
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.key2pval = cx.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Studies may be run in many threads; p-values are calculated outside of the lock
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        """Locks cannot be pickled; the unpickled memo has a new lock."""
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_pvals(self, calc_pvalues, study_cnts, study_tot, pop_cnts, pop_tot):
+        """Return p-values, calculating only the contingency tables not seen recently."""
+        keys = [(scnt, study_tot, pcnt, pop_tot) for scnt, pcnt in zip(study_cnts, pop_cnts)]
+        return self._get_pvals(keys, lambda knew: calc_pvalues(
+            [k[0] for k in knew], study_tot, [k[2] for k in knew], pop_tot))
+
+    def get_pvals_studies(self, calc_pvalues_studies, study_cnts, study_tots, pop_cnts, pop_tot):
+        """Return p-values of terms of many studies, calculating only tables not seen recently."""
+        keys = [(scnt, stot, pcnt, pop_tot)
+                for scnt, stot, pcnt in zip(study_cnts, study_tots, pop_cnts)]
+        return self._get_pvals(keys, lambda knew: calc_pvalues_studies(
+            [k[0] for k in knew], [k[1] for k in knew], [k[2] for k in knew], pop_tot))
+
+    def _get_pvals(self, keys, calc_keys):
+        """Return p-values of (study_cnt, study_tot, pop_cnt, pop_tot) keys, calculating new."""
+        key2pval = self.key2pval
+        key2old = {}
+        key2new = cx.OrderedDict()
+        with self.lock:
+            for key in keys:
+                if key in key2pval:
+                    key2pval.move_to_end(key)
+                    key2old[key] = key2pval[key]
+                elif key not in key2new:
+                    key2new[key] = None
+            self.misses += len(key2new)
+            self.hits += len(keys) - len(key2new)
+        if key2new:
+            key2new = cx.OrderedDict(zip(key2new, calc_keys(list(key2new))))
+        pvals = [key2new[k] if k in key2new else key2old[k] for k in keys]
+        with self.lock:
+            self._add(key2new)
+        return pvals
+
+    def _add(self, key2new):
+        """Add newly calculated p-values, discarding the least recently used when full."""
+        key2pval = self.key2pval
+        key2pval.update(key2new)
+        while len(key2pval) > self.maxsize:
+            key2pval.popitem(last=False)
+
+    def get_info(self):
+        """Return the memo hit and miss counts."""
+        return self.ntinfo(self.hits, self.misses, self.maxsize, len(self.key2pval))
+
+    def __str__(self):
+        tot = self.hits + self.misses
+        return "{H:,} of {N:,} ({P:3.0f}%) p-values found in memo; {M:,} calculated".format(
+            H=self.hits, N=tot, P=100.0*self.hits/tot if tot else 0.0, M=self.misses)
+
+
 class FisherScipyStats(PvalCalcBase):
     """From the scipy stats package, use function, fisher_exact."""
 
     fmterr = "STUDY={A}/{B} POP={C}/{D} scnt({scnt}) stot({stot}) pcnt({pcnt}) ptot({ptot})"
 
     def __init__(self, name, log):
-        super(FisherScipyStats, self).__init__(name, stats.fisher_exact, log)
+        # scipy.stats is slow to import, so it is imported only if this option is chosen
+        from scipy.stats import fisher_exact
+        super(FisherScipyStats, self).__init__(name, fisher_exact, log)
 
     def calc_pvalue(self, study_count, study_n, pop_count, pop_n):
         """Calculate uncorrected p-values."""
@@ -88,11 +268,119 @@ class FisherScipyStats(PvalCalcBase):
         return p_uncorrected
 
 
+class FisherVectorized(PvalCalcBase):
+    """Two-sided Fisher's exact test on all terms at once using NumPy arrays."""
+
+    # Tables as probable as the observed table, within this relative tolerance, are summed
+    reltol = 1e-7
+    # Maximum number of hypergeometric probabilities held in memory at one time
+    maxelems = 1 << 22
+
+    def __init__(self, name, log):
+        super(FisherVectorized, self).__init__(name, self.calc_pvalues, log)
+
+    def calc_pvalue(self, study_count, study_n, pop_count, pop_n):
+        """Calculate one uncorrected p-value."""
+        return self.calc_pvalues([study_count], study_n, [pop_count], pop_n)[0]
+
+    def calc_pvalues(self, study_cnts, study_n, pop_cnts, pop_n):
+        """Calculate uncorrected p-values for all terms, returning a list of floats.
+
+        study_n: The study size, or the study size of each term
+        """
+        # Using the 2x2 table in FisherScipyStats, each term's study_cnt is drawn from
+        # a hypergeometric distribution: pop_n items, study_n "successes", pop_cnt draws.
+        scnts = np.asarray(study_cnts, dtype=np.int64)
+        pcnts = np.asarray(pop_cnts, dtype=np.int64)
+        num_terms = len(scnts)
+        if num_terms == 0:
+            return []
+        assert np.all(scnts <= pcnts), "STUDY COUNTS MUST NOT EXCEED POPULATION COUNTS"
+        study_ns = np.broadcast_to(np.asarray(study_n, dtype=np.int64), scnts.shape)
+        lows = np.maximum(0, pcnts - (pop_n - study_ns))
+        highs = np.minimum(pcnts, study_ns)
+        # Tables are calculated in order of the number of possible study counts, so few
+        # narrow tables are padded to the width of the widest table in their chunk
+        widths = highs - lows + 1
+        order = np.argsort(widths, kind='stable')
+        widths = widths[order].tolist()
+        pvals = np.empty(num_terms)
+        idx = 0
+        while idx < num_terms:
+            end = min(num_terms, idx + max(1, self.maxelems//widths[idx]))
+            end = idx + max(1, self.maxelems//widths[end-1])
+            chunk = order[idx:end]
+            pvals[chunk] = self._calc_pvalues_chunk(
+                scnts[chunk], study_ns[chunk], pcnts[chunk], pop_n, lows[chunk], highs[chunk])
+            idx = end
+        return pvals.tolist()
+
+    def calc_pvalues_studies(self, study_cnts, study_ns, pop_cnts, pop_n):
+        """Calculate uncorrected p-values for terms of many studies in one vectorized call."""
+        return self.calc_pvalues(study_cnts, study_ns, pop_cnts, pop_n)
+
+    def _calc_pvalues_chunk(self, scnts, study_ns, pcnts, pop_n, lows, highs):
+        """Sum the probabilities of all tables which are no more probable than the observed."""
+        width = int((highs - lows).max()) + 1
+        xvals = lows[:, None] + np.arange(width)
+        in_support = xvals <= highs[:, None]
+        xvals = np.where(in_support, xvals, lows[:, None])
+        logpmf_all = self._get_logpmf(xvals, study_ns[:, None], pcnts[:, None], pop_n)
+        logpmf_all[~in_support] = -np.inf
+        logpmf_obs = self._get_logpmf(scnts, study_ns, pcnts, pop_n)
+        logcutoff = logpmf_obs + np.log1p(self.reltol)
+        pmf_all = np.exp(logpmf_all)
+        # Summed in order: Padding added to the end of short rows does not change their sums,
+        # so a table's p-value does not depend on the other tables calculated with it
+        pvals = np.where(logpmf_all <= logcutoff[:, None], pmf_all, 0.0).cumsum(axis=1)[:, -1]
+        # Observed table is the most probable table
+        pvals[logpmf_all.max(axis=1) <= logcutoff] = 1.0
+        return np.minimum(pvals, 1.0)
+
+    def _get_logpmf(self, xvals, study_n, pcnts, pop_n):
+        """Return the log of the hypergeometric probabilities of seeing xvals study counts."""
+        lnf = self._get_logfactorial
+        return (lnf(study_n) - lnf(xvals) - lnf(study_n - xvals) +
+                lnf(pop_n - study_n) - lnf(pcnts - xvals) -
+                lnf(pop_n - study_n - pcnts + xvals) -
+                lnf(pop_n) + lnf(pcnts) + lnf(pop_n - pcnts))
+
+    @staticmethod
+    def _get_logfactorial(vals):
+        """Return log(n!) for each value."""
+        from scipy.special import gammaln
+        return gammaln(np.asarray(vals, dtype=float) + 1.0)
+
+
+class FisherLogFactorial(FisherVectorized):
+    """Vectorized Fisher's exact test using a log-factorial table built once per population."""
+
+    def __init__(self, name, log):
+        super(FisherLogFactorial, self).__init__(name, log)
+        self.logfactorials = np.zeros(1)
+
+    def set_pop_tot(self, pop_tot):
+        """Precompute log(n!) for n in 0..pop_tot, shared by every term and every study."""
+        if pop_tot >= len(self.logfactorials):
+            self.logfactorials = np.array([lgamma(n + 1.0) for n in range(pop_tot + 1)])
+
+    def calc_pvalues(self, study_cnts, study_n, pop_cnts, pop_n):
+        """Calculate uncorrected p-values for all terms, returning a list of floats."""
+        self.set_pop_tot(pop_n)
+        return super(FisherLogFactorial, self).calc_pvalues(study_cnts, study_n, pop_cnts, pop_n)
+
+    def _get_logfactorial(self, vals):
+        """Return log(n!) for each value by table lookup."""
+        return self.logfactorials[vals]
+
+
 class FisherFactory(object):
     """Factory for choosing a fisher function."""
 
     options = cx.OrderedDict([
         ('fisher_scipy_stats', FisherScipyStats),
+        ('fisher_vectorized', FisherVectorized),
+        ('fisher_logfactorial', FisherLogFactorial),
     ])
 
     def __init__(self, pvalfncname='fisher_scipy_stats', log=sys.stdout):
@@ -103,7 +391,7 @@ class FisherFactory(object):
     def _init_pval_obj(self):
         """Returns a Fisher object based on user-input."""
         if self.pval_fnc_name in self.options.keys():
-            fisher_obj = self.options['fisher_scipy_stats']('fisher_scipy_stats', self.log)
+            fisher_obj = self.options[self.pval_fnc_name](self.pval_fnc_name, self.log)
             return fisher_obj
         raise Exception("PVALUE FUNCTION({FNC}) NOT FOUND".format(FNC=self.pval_fnc_name))
 
@@ -57,16 +57,25 @@ class ReportResults():
         wr_tsv(fout_csv, self.nts, **kws)
         #### print('  WROTE: {CSV}'.format(CSV=fout_csv))
 
-    def wrxlsx(self, fout_xlsx):
-        """Write results into xlsx file."""
-        if self.nts is None:
-            self.nts = self.get_nts()
-        kws = {
+    def wrxlsx(self, fout_xlsx, **kws):
+        """Write results into xlsx file, one row at a time in constant memory."""
+        kws_xlsx = {
             'fld2col_widths': self.fld2col_widths_dflts,
+            'constant_memory': True,
         }
-        wr_xlsx(fout_xlsx, self.nts, **kws)
+        kws_xlsx.update(kws)
+        nts = self.nts if self.nts is not None else (r.get_nt_prt() for r in self.results)
+        wr_xlsx(fout_xlsx, nts, **kws_xlsx)
         #### print('  WROTE: {XLSX}'.format(XLSX=fout_xlsx))
 
+    def wrparquet(self, fout_parquet, study=None):
+        """Write results into a Parquet file as typed columns. Requires pyarrow.
+
+        If a study name is given, it is written in a study column.
+        """
+        from enrichmentanalysis.wr_parquet import wr_parquet
+        wr_parquet(fout_parquet, self.results, study)
+
     def get_nts(self):
         """Return namedtuples associated with results."""
         return [rec.get_nt_prt() for rec in self.results]
@@ -0,0 +1,108 @@
+"""Cache of enrichment results on disk, keyed by a hash of everything the results depend on.
+
+Each entry is one .npy file holding the columns of an EnrichmentColumns array.
+When the files exceed the maximum size, the least recently used files are removed.
+"""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+
+class ResultCache():
+    """Cache of enrichment results on disk with least-recently-used eviction."""
+
+    # Change when cached results are no longer the same as newly computed results
+    version = 1
+
+    def __init__(self, dir_cache, max_bytes=1 << 30):
+        self.dir_cache = dir_cache
+        self.max_bytes = max_bytes
+        if not os.path.isdir(dir_cache):
+            os.makedirs(dir_cache)
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return 'ResultCache({DIR}): {H:,} hits {M:,} misses'.format(
+            DIR=self.dir_cache, H=self.hits, M=self.misses)
+
+    def get_key(self, key_fields):
+        """Return the hash of a dict of the values which determine the results."""
+        key_fields = dict(key_fields, cache_version=self.version)
+        return hashlib.sha1(json.dumps(key_fields, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key):
+        """Return the cached results array, or None if the results are not cached."""
+        fin = self._get_filename(key)
+        try:
+            arr = np.load(fin)
+        except (IOError, ValueError, EOFError):
+            self.misses += 1
+            return None
+        # Mark as recently used, unless another thread or process just removed it
+        try:
+            os.utime(fin, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return arr
+
+    def save(self, key, arr):
+        """Save a results array, then remove the least recently used files if over the limit."""
+        fout = self._get_filename(key)
+        # Write to a temporary file first so a partly written file is never loaded.
+        # Each thread and process saving the same key writes its own temporary file.
+        fd_tmp, ftmp = tempfile.mkstemp(dir=self.dir_cache, suffix='.tmp')
+        try:
+            with os.fdopen(fd_tmp, 'wb') as prt:
+                np.save(prt, arr)
+            os.replace(ftmp, fout)
+        except OSError:
+            # Another thread or process saved the same results
+            if os.path.exists(ftmp):
+                os.remove(ftmp)
+            if not os.path.exists(fout):
+                raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache is under its maximum size."""
+        entries = []
+        for name in os.listdir(self.dir_cache):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.dir_cache, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        num_bytes = sum(e[1] for e in entries)
+        for _, size, name in sorted(entries):
+            if num_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.dir_cache, name))
+            except OSError:
+                # Removed by another process sharing the cache
+                pass
+            num_bytes -= size
+
+    def _get_filename(self, key):
+        """Return the name of the file holding the results for a key."""
+        return os.path.join(self.dir_cache, '{KEY}.npy'.format(KEY=key))
+
+
+def get_digest(strs=(), arrays=()):
+    """Return the hash of a list of strings and of the values in integer arrays."""
+    sha1 = hashlib.sha1('\n'.join(str(s) for s in strs).encode())
+    for arr in arrays:
+        sha1.update(np.ascontiguousarray(arr, dtype=np.int64).tobytes())
+    return sha1.hexdigest()
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
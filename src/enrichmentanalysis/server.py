@@ -0,0 +1,280 @@
+"""Serve enrichment analyses over a local HTTP JSON API using EnrichmentRuns loaded once.
+
+Requests are handled concurrently by a pool of worker threads.
+The server listens on a TCP (host, port) address or on a Unix socket path.
+
+    GET  /runs  Names of the EnrichmentRuns, their population sizes and methods
+    POST /run   JSON: {"study_ids": [...], "run": NAME, "name": STUDY_NAME,
+                       "terms": "all", "pval": MAX, "pval_field": METHOD}
+                Only study_ids is required. "run" may be omitted if one run is served.
+                Returns the study's results with the fields of EnrichmentRecord.get_nt_prt
+"""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import json
+import socket
+import socketserver
+import collections as cx
+from http.client import HTTPConnection
+from http.server import HTTPServer
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+from enrichmentanalysis.wr_results import ResultsColumns
+
+
+class EnrichmentServer():
+    """Run enrichment analyses on studies sent to a server, using EnrichmentRuns loaded once."""
+
+    def __init__(self, name2objrun, jobs=4, log=None):
+        self.name2objrun = cx.OrderedDict(name2objrun)
+        assert self.name2objrun, "NO EnrichmentRuns TO SERVE"
+        self.jobs = jobs
+        # Log for the enrichment runs; None to run quietly
+        self.log = log
+        self.httpd = None
+
+    def get_runs(self):
+        """Return a description of each EnrichmentRun served."""
+        return {nm:{'pop_tot':o.pop_tot, 'alpha':o.objmethods.alpha,
+                    'methods':o.objmethods.get_fields().split()}
+                for nm, o in self.name2objrun.items()}
+
+    def run_query(self, query):
+        """Run an enrichment analysis on one study, given a query dict. Return a results dict."""
+        objrun = self._get_objrun(query.get('run'))
+        study_ids = query.get('study_ids')
+        if not isinstance(study_ids, list) or \
+            not all(isinstance(i, (str, int, float)) for i in study_ids):
+            raise ValueError("study_ids MUST BE A LIST OF IDs (STRINGS OR NUMBERS)")
+        name = query.get('name', 'study')
+        objres = objrun.run_study(set(study_ids), name, self.log, query.get('terms', 'all'))
+        if not objres:
+            return {'name':name, 'study_tot':0, 'results':[]}
+        idxs = objres.get_idxs_cond(query.get('pval'), query.get('pval_field'))
+        return {
+            'name':name,
+            'study_tot':objres.study_tot,
+            'results':ResultsDicts(objres.results).get_dicts(idxs) if idxs.size else [],
+        }
+
+    def serve_forever(self, address=None):
+        """Serve requests on a (host, port) or a Unix socket path until shutdown."""
+        httpd = self.httpd if address is None else self.get_httpd(address)
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+
+    def get_httpd(self, address):
+        """Return a server bound to a (host, port) address or a Unix socket path."""
+        cls = PoolUnixServer if isinstance(address, str) else PoolHTTPServer
+        self.httpd = cls(address, EnrichmentHandler, self.jobs)
+        self.httpd.objsrv = self
+        return self.httpd
+
+    def shutdown(self):
+        """Stop serving from another thread. The server is closed when serve_forever returns."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd = None
+
+    def _get_objrun(self, name):
+        """Return the named EnrichmentRun, or the only one if no name is given."""
+        if name is None and len(self.name2objrun) == 1:
+            return next(iter(self.name2objrun.values()))
+        if name not in self.name2objrun:
+            raise ValueError("RUN({NAME}) NOT FOUND. CHOOSE FROM: {RUNS}".format(
+                NAME=name, RUNS=' '.join(self.name2objrun)))
+        return self.name2objrun[name]
+
+
+class ResultsDicts(ResultsColumns):
+    """Format enrichment results into dicts having the values of EnrichmentRecord.get_nt_prt."""
+
+    # Printf-style formats of the string fields in get_nt_prt
+    fld2fmt = {'stu_ratio':'%7.5f', 'pop_ratio':'%7.5f', 'pval_uncorr':'%8.2e'}
+
+    def get_dicts(self, idxs):
+        """Return one dict for each result at idxs, formatted column by column."""
+        fld2vals = self.fld2vals
+        termids = self.get_termids(idxs)
+        cols = [fld2vals['enrichment'][idxs].tolist(), termids]
+        for fld in EnrichmentRecord.flds[2:] + tuple(self.fieldnames):
+            vals = fld2vals[fld][idxs].tolist()
+            fmt = self.fld2fmt.get(fld, '%8.2e' if fld in self.fieldnames else None)
+            cols.append(vals if fmt is None else [fmt % v for v in vals])
+        get_str = EnrichmentRecord.get_items_str
+        cols.append([get_str(ids, ';') for ids in self.get_stu_items(idxs, termids)])
+        flds = EnrichmentRecord.flds + tuple(self.fieldnames) + ('stu_items',)
+        return [dict(zip(flds, row)) for row in zip(*cols)]
+
+
+class EnrichmentHandler(BaseHTTPRequestHandler):
+    """Handle one HTTP request for an EnrichmentServer."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Return the EnrichmentRuns served."""
+        if self.path != '/runs':
+            return self._wr_json(404, {'error':'NOT FOUND: {P}'.format(P=self.path)})
+        return self._wr_json(200, self.server.objsrv.get_runs())
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Run an enrichment analysis on the study in the request."""
+        if self.path != '/run':
+            return self._wr_json(404, {'error':'NOT FOUND: {P}'.format(P=self.path)})
+        try:
+            num_bytes = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(num_bytes).decode('utf-8'))
+            if not isinstance(query, dict):
+                raise ValueError("QUERY MUST BE A JSON OBJECT")
+            return self._wr_json(200, self.server.objsrv.run_query(query))
+        except (ValueError, TypeError, AssertionError) as err:
+            return self._wr_json(400, {'error':str(err)})
+
+    def _wr_json(self, status, dct):
+        """Write a JSON response."""
+        txt = json.dumps(dct).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(txt)))
+        self.end_headers()
+        self.wfile.write(txt)
+
+    def address_string(self):
+        """Clients of Unix sockets have no address."""
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests only if the server has a log."""
+        log = self.server.objsrv.log
+        if log is not None:
+            log.write("{ADDR} {MSG}\n".format(ADDR=self.address_string(), MSG=format % args))
+
+
+class PoolMixIn():
+    """Handle each request in a bounded pool of worker threads."""
+
+    # Connections waiting to be accepted. Clients of a full Unix socket fail instead of waiting
+    request_queue_size = 128
+
+    def init_pool(self, jobs):
+        """Create the pool of worker threads."""
+        # pylint: disable=attribute-defined-outside-init
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+
+    def process_request(self, request, client_address):
+        """Handle the request in a worker thread."""
+        self.pool.submit(self._process_request_pool, request, client_address)
+
+    def _process_request_pool(self, request, client_address):
+        """Handle the request, then close it."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Close the server after the requests being handled are finished."""
+        super(PoolMixIn, self).server_close()
+        self.pool.shutdown(wait=True)
+
+
+class PoolHTTPServer(PoolMixIn, HTTPServer):
+    """HTTP server on a TCP address, handling requests in a pool of worker threads."""
+
+    def __init__(self, address, handler, jobs):
+        self.init_pool(jobs)
+        super(PoolHTTPServer, self).__init__(address, handler)
+
+
+class PoolUnixServer(PoolMixIn, socketserver.UnixStreamServer):
+    """HTTP server on a Unix socket, handling requests in a pool of worker threads."""
+
+    def __init__(self, address, handler, jobs):
+        self.init_pool(jobs)
+        super(PoolUnixServer, self).__init__(address, handler)
+
+    def server_close(self):
+        """Close the server and remove its Unix socket file."""
+        super(PoolUnixServer, self).server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class EnrichmentClient():
+    """Send studies to an EnrichmentServer on a (host, port) address or a Unix socket path."""
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.timeout = timeout
+
+    def get_runs(self):
+        """Return a description of each EnrichmentRun served."""
+        return self._request('GET', '/runs')
+
+    def run_study(self, study_ids, run=None, name='study', **kws):
+        """Return the results of one study. kws: terms pval pval_field"""
+        query = dict(kws, study_ids=sorted(study_ids), name=name)
+        if run is not None:
+            query['run'] = run
+        return self._request('POST', '/run', query)
+
+    def _request(self, method, path, query=None):
+        """Send a request and return the JSON response. Raise ValueError if it failed."""
+        conn = self._get_connection()
+        try:
+            body = None if query is None else json.dumps(query)
+            conn.request(method, path, body, {'Content-Type':'application/json'})
+            resp = conn.getresponse()
+            dct = json.loads(resp.read().decode('utf-8'))
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise ValueError("{STATUS} {ERR}".format(STATUS=resp.status, ERR=dct.get('error')))
+        return dct
+
+    def _get_connection(self):
+        """Return a connection to the server."""
+        if isinstance(self.address, str):
+            return UnixHTTPConnection(self.address, self.timeout)
+        host, port = self.address
+        return HTTPConnection(host, port, timeout=self.timeout)
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        """Connect to the Unix socket."""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def get_address(args):
+    """Return a Unix socket path, or a (host, port) address, from command-line arguments."""
+    if 'socket' in args:
+        return args['socket']
+    return (args.get('host', '127.0.0.1'), int(args.get('port', 8080)))
+
+def prt_address(address, prt=sys.stdout):
+    """Print the address the server is listening on."""
+    if isinstance(address, str):
+        prt.write("  SERVING ON UNIX SOCKET: {PATH}\n".format(PATH=address))
+    else:
+        prt.write("  SERVING ON: http://{HOST}:{PORT}\n".format(HOST=address[0], PORT=address[1]))
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,121 @@
+"""Write enrichment results into Parquet files as typed Arrow columns. Requires pyarrow.
+
+Columns: study (optional), enrichment, TermID, counts, totals, ratios, uncorrected p-values,
+one column of corrected p-values for each multiple-test method, and stu_items (list<string>).
+"""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import sys
+import numpy as np
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+from enrichmentanalysis.wr_results import ResultsColumns
+
+
+def wr_parquet(fout_parquet, results, study=None):
+    """Write a list of EnrichmentRecords, or EnrichmentColumns, into a Parquet file."""
+    objwr = WrParquet(fout_parquet, study is not None)
+    objwr.wr_results(results, study=study)
+    return objwr.close()
+
+def wr_results_parquet(fout_parquet, objresults, max_pval=None, pval_field=None, study=None):
+    """Write the results of get_results_cond(max_pval, pval_field) into a Parquet file."""
+    objwr = WrParquet(fout_parquet, study is not None)
+    objwr.wr_results(objresults.results, objresults.get_idxs_cond(max_pval, pval_field), study)
+    return objwr.close()
+
+def wr_studies_parquet(fout_parquet, name_results, max_pval=None, pval_field=None):
+    """Write the results of many studies into one Parquet file having a study column.
+
+    name_results: (study name, EnrichmentResults) pairs, such as from run_studies_parallel
+    """
+    objwr = WrParquet(fout_parquet, study_column=True)
+    for name, objresults in name_results:
+        if objresults:
+            objwr.wr_results(
+                objresults.results, objresults.get_idxs_cond(max_pval, pval_field), name)
+    return objwr.close()
+
+def get_pyarrow():
+    """Import pyarrow, which is needed only to write Parquet files."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow IS NEEDED TO WRITE PARQUET FILES: pip install pyarrow")
+    return pyarrow
+
+
+class WrParquet():
+    """Write enrichment results into a Parquet file, one row group for each set of results."""
+
+    def __init__(self, fout_parquet, study_column=False):
+        self.pa = get_pyarrow()
+        self.fout_parquet = fout_parquet
+        self.study_column = study_column
+        self.num_rows = 0
+        self.studies = []
+        # The Parquet writer is opened when the first results give the multiple-test fields
+        self.writer = None
+
+    def get_schema(self, fieldnames):
+        """Return the Arrow schema for results having the given multiple-test fields."""
+        pa = self.pa
+        fld2type = {
+            'enrichment': pa.string(),
+            'TermID': pa.string(),
+            'stu_num': pa.int64(),
+            'stu_tot': pa.int64(),
+            'stu_ratio': pa.float64(),
+            'pop_num': pa.int64(),
+            'pop_tot': pa.int64(),
+            'pop_ratio': pa.float64(),
+            'pval_uncorr': pa.float64(),
+        }
+        fields = [pa.field('study', pa.string())] if self.study_column else []
+        fields.extend(pa.field(f, fld2type[f]) for f in EnrichmentRecord.flds)
+        fields.extend(pa.field(f, pa.float64()) for f in fieldnames)
+        fields.append(pa.field('stu_items', pa.list_(pa.string())))
+        return pa.schema(fields)
+
+    def get_table(self, results, idxs=None, study=None):
+        """Return an Arrow table of the results at idxs, or of all results."""
+        objcols = ResultsColumns(results)
+        if idxs is None:
+            idxs = np.arange(len(results))
+        schema = self.get_schema(objcols.fieldnames)
+        termids = objcols.get_termids(idxs)
+        fld2vals = objcols.fld2vals
+        cols = [[study]*len(idxs)] if self.study_column else []
+        cols.append(fld2vals['enrichment'][idxs])
+        cols.append([str(t) for t in termids])
+        cols.extend(fld2vals[f][idxs] for f in schema.names[len(cols):-1])
+        cols.append([sorted(str(e) for e in ids) for ids in objcols.get_stu_items(idxs, termids)])
+        return self.pa.Table.from_arrays(
+            [self.pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema)
+
+    def wr_results(self, results, idxs=None, study=None):
+        """Write the results at idxs, or all results, as one row group."""
+        if not len(results) or (idxs is not None and not len(idxs)):
+            return
+        table = self.get_table(results, idxs, study)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.fout_parquet, table.schema)
+        self.writer.write_table(table)
+        self.num_rows += table.num_rows
+        self.studies.append(study)
+
+    def close(self):
+        """Close the Parquet file. Return the number of results written."""
+        if self.writer is None:
+            sys.stdout.write("      0 items. NOT WRITING {FOUT}\n".format(FOUT=self.fout_parquet))
+            return 0
+        self.writer.close()
+        studies = " ({N} studies)".format(N=len(self.studies)) if self.study_column else ""
+        sys.stdout.write("  {N:>5} items WROTE: {FOUT}{STUDIES}\n".format(
+            N=self.num_rows, FOUT=self.fout_parquet, STUDIES=studies))
+        return self.num_rows
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,170 @@
+"""Write enrichment results into files without holding all formatted rows in memory.
+
+tsv and csv rows are formatted column by column from arrays, so records and their report
+namedtuples are not created. The text is identical to ReportResults wrtsv and wrcsv.
+xlsx rows are created from records one at a time and written in constant memory.
+"""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import sys
+import gzip
+import numpy as np
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_tbl import wr_xlsx
+
+
+def wr_results_tsv(fout, objresults, max_pval=None, pval_field=None, **kws):
+    """Write the results of get_results_cond(max_pval, pval_field) into a tsv file.
+
+    fout: A file name, a name ending with '.gz' to compress, or None or '-' for stdout
+    kws: sep (default tab), batchsize (rows formatted at a time), items (name in messages)
+    """
+    items_str = kws.get('items', 'items')
+    idxs = objresults.get_idxs_cond(max_pval, pval_field)
+    to_stdout = fout is None or fout == '-'
+    if not idxs.size:
+        # Only the table is written to stdout, so it can be piped
+        log = sys.stderr if to_stdout else sys.stdout
+        log.write("      0 {ITEMS}. NOT WRITING {FOUT}\n".format(ITEMS=items_str, FOUT=fout))
+        return 0
+    objwr = WrResultsTsv(objresults.results, kws.get('sep', '\t'))
+    batchsize = kws.get('batchsize', 4096)
+    prt = sys.stdout if to_stdout else _open_wr(fout)
+    prt.write(objwr.get_hdr())
+    for start in range(0, idxs.size, batchsize):
+        prt.write(objwr.get_lines(idxs[start:start+batchsize]))
+    if not to_stdout:
+        prt.close()
+        sys.stdout.write("  {N:>5} {ITEMS} WROTE: {FOUT}\n".format(
+            N=idxs.size, ITEMS=items_str, FOUT=fout))
+    return idxs.size
+
+def wr_results_csv(fout, objresults, max_pval=None, pval_field=None, **kws):
+    """Write the results of get_results_cond(max_pval, pval_field) into a csv file."""
+    kws['sep'] = ','
+    return wr_results_tsv(fout, objresults, max_pval, pval_field, **kws)
+
+def wr_results_xlsx(fout_xlsx, objresults, max_pval=None, pval_field=None, **kws):
+    """Write the results of get_results_cond(max_pval, pval_field) into a xlsx file.
+
+    kws: max_rows (rows per worksheet before continuing on a new worksheet)
+    """
+    results = objresults.results
+    kws_xlsx = {
+        'fld2col_widths': ReportResults.fld2col_widths_dflts,
+        'constant_memory': True,
+    }
+    kws_xlsx.update(kws)
+    idxs = objresults.get_idxs_cond(max_pval, pval_field)
+    wr_xlsx(fout_xlsx, (results[i].get_nt_prt() for i in idxs.tolist()), **kws_xlsx)
+
+def _open_wr(fout, bufsize=1 << 20):
+    """Open a text file for writing through a large buffer, compressed if fout ends in '.gz'."""
+    if fout.endswith('.gz'):
+        return gzip.open(fout, 'wt', compresslevel=6)
+    return open(fout, 'w', buffering=bufsize)
+
+
+class ResultsColumns():
+    """Columns of values of enrichment results, stored as records or as EnrichmentColumns."""
+
+    def __init__(self, results):
+        self.results = results
+        self.is_arr = isinstance(results, EnrichmentColumns)
+        self.fieldnames = list(self._get_ntobj_mult()._fields)
+        # Arrays of values for every result: counts, totals, ratios, and p-values
+        self.fld2vals = self._init_fld2vals()
+
+    def get_termids(self, idxs):
+        """Return the term IDs of the results at idxs."""
+        if self.is_arr:
+            terms = self.results.objrun.index.terms
+            return [terms[i] for i in self.results.arr['term_idx'][idxs].tolist()]
+        results = self.results
+        return [results[i].termid for i in idxs.tolist()]
+
+    def get_stu_items(self, idxs, termids):
+        """Return the study IDs of each result at idxs."""
+        if self.is_arr:
+            term_idxs = self.results.arr['term_idx'][idxs]
+            return self.results.studyitems.get_stu_lists(term_idxs)
+        results = self.results
+        if results and results[0].studyitems is not None:
+            # Records sharing study items find the study IDs of a batch of terms at once
+            studyitems = results[0].studyitems
+            term2idx = studyitems.index.term2idx
+            term_idxs = np.array([term2idx[t] for t in termids], dtype=np.int64)
+            return studyitems.get_stu_lists(term_idxs)
+        return [results[i].stu_items for i in idxs.tolist()]
+
+    def _get_ntobj_mult(self):
+        """Return the namedtuple type holding the multiple-test p-values of the results."""
+        if self.is_arr:
+            return self.results.ntobj_mult
+        return type(self.results[0].multitests)
+
+    def _init_fld2vals(self):
+        """Return arrays of the values in each column, shared by all batches of rows."""
+        results = self.results
+        if self.is_arr:
+            arr = results.arr
+            fld2vals = {f:arr[f] for f in arr.dtype.names}
+            fld2vals['stu_tot'] = np.full(len(arr), results.study_tot, dtype=np.int64)
+            fld2vals['pop_tot'] = np.full(len(arr), results.objrun.pop_tot, dtype=np.int64)
+            return fld2vals
+        ntpvals = [r.ntpval for r in results]
+        fld2vals = {
+            'enrichment': np.array([nt.enrichment for nt in ntpvals]),
+            'stu_num': np.array([nt.study_cnt for nt in ntpvals], dtype=np.int64),
+            'stu_tot': np.array([nt.study_tot for nt in ntpvals], dtype=np.int64),
+            'stu_ratio': np.array([nt.study_ratio for nt in ntpvals], dtype=float),
+            'pop_num': np.array([nt.pop_cnt for nt in ntpvals], dtype=np.int64),
+            'pop_tot': np.array([nt.pop_tot for nt in ntpvals], dtype=np.int64),
+            'pop_ratio': np.array([nt.pop_ratio for nt in ntpvals], dtype=float),
+            'pval_uncorr': np.array([nt.pval_uncorr for nt in ntpvals], dtype=float),
+        }
+        for idx, fld in enumerate(self.fieldnames):
+            fld2vals[fld] = np.array([r.multitests[idx] for r in results], dtype=float)
+        return fld2vals
+
+
+class WrResultsTsv(ResultsColumns):
+    """Format rows of enrichment results from columns of values."""
+
+    # Formatted fields between the term ID and the multiple-test p-values
+    flds_fmt = ['stu_num', 'stu_tot', 'stu_ratio', 'pop_num', 'pop_tot', 'pop_ratio',
+                'pval_uncorr']
+
+    def __init__(self, results, sep='\t'):
+        super(WrResultsTsv, self).__init__(results)
+        self.sep = sep
+        self.rowfmt = self._init_rowfmt()
+
+    def get_hdr(self):
+        """Return the header line."""
+        flds = EnrichmentRecord.flds + tuple(self.fieldnames) + ('stu_items',)
+        return "# {}\n".format(self.sep.join(flds))
+
+    def get_lines(self, idxs):
+        """Return the lines for the results at idxs."""
+        fld2vals = self.fld2vals
+        termids = self.get_termids(idxs)
+        cols = [fld2vals['enrichment'][idxs].tolist(), termids]
+        cols.extend(fld2vals[f][idxs].tolist() for f in self.flds_fmt + self.fieldnames)
+        get_str = EnrichmentRecord.get_items_str
+        cols.append([get_str(ids, ';') for ids in self.get_stu_items(idxs, termids)])
+        rowfmt = self.rowfmt
+        return ''.join([rowfmt % row for row in zip(*cols)])
+
+    def _init_rowfmt(self):
+        """Return the printf-style format of one row."""
+        fmts = ['%s', '%s', '%d', '%d', '%7.5f', '%d', '%d', '%7.5f'] + \
+               ['%8.2e']*(len(self.fieldnames) + 1) + ['%s']
+        return '{}\n'.format(self.sep.join(fmts))
+
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -28,6 +28,7 @@ __author__ = "DV Klopfenstein"
 
 import re
 import sys
+import itertools as it
 from enrichmentanalysis.wr_tbl_class import get_hdrs
 
 def prt_txt(prt, data_nts, prtfmt=None, nt_fields=None, **kws):
@@ -61,31 +62,43 @@ def prt_nts(data_nts, prtfmt=None, prt=sys.stdout, nt_fields=None, **kws):
     prt_txt(prt, data_nts, prtfmt, nt_fields, **kws)
 
 def wr_xlsx(fout_xlsx, data_xlsx, **kws):
-    """Write a spreadsheet into a xlsx file."""
-    from goatools.wr_tbl_class import WrXlsx
+    """Write a spreadsheet into a xlsx file.
+
+    data_xlsx may be a list or an iterator of namedtuples. With constant_memory=True,
+    each row is written to disk as the rows are read from the iterator.
+    """
+    from enrichmentanalysis.wr_tbl_class import WrXlsx
     # optional keyword args: fld2col_widths hdrs prt_if sort_by fld2fmt prt_flds
+    #                        constant_memory max_rows
     items_str = kws.get("items", "items") if "items" not in kws else kws["items"]
-    if data_xlsx:
+    data_iter = iter(data_xlsx)
+    data_nt0 = next(data_iter, None)
+    if data_nt0 is not None:
         # Open xlsx file
-        xlsxobj = WrXlsx(fout_xlsx, data_xlsx[0]._fields, **kws)
+        xlsxobj = WrXlsx(fout_xlsx, data_nt0._fields, **kws)
         worksheet = xlsxobj.add_worksheet()
         # Write title (optional) and headers.
         row_idx = xlsxobj.wr_title(worksheet)
         row_idx = xlsxobj.wr_hdrs(worksheet, row_idx)
-        row_idx_data0 = row_idx
         # Write data
-        row_idx = xlsxobj.wr_data(data_xlsx, row_idx, worksheet)
+        xlsxobj.wr_data(it.chain([data_nt0], data_iter), row_idx, worksheet)
         # Close xlsx file
         xlsxobj.workbook.close()
-        sys.stdout.write("  {N:>5} {ITEMS} WROTE: {FOUT}\n".format(
-            N=row_idx-row_idx_data0, ITEMS=items_str, FOUT=fout_xlsx))
+        sys.stdout.write("  {N:>5} {ITEMS} WROTE: {FOUT}{SHEETS}\n".format(
+            N=xlsxobj.num_data_rows, ITEMS=items_str, FOUT=fout_xlsx,
+            SHEETS=_get_sheets_str(xlsxobj)))
     else:
         sys.stdout.write("      0 {ITEMS}. NOT WRITING {FOUT}\n".format(
             ITEMS=items_str, FOUT=fout_xlsx))
 
+def _get_sheets_str(xlsxobj):
+    """Return the number of worksheets written, if data was split across worksheets."""
+    num_sheets = len(xlsxobj.workbook.worksheets())
+    return '' if num_sheets == 1 else " ({N} worksheets)".format(N=num_sheets)
+
 def wr_xlsx_sections(fout_xlsx, xlsx_data, **kws):
     """Write xlsx file containing section names followed by lines of namedtuple data."""
-    from goatools.wr_tbl_class import WrXlsx
+    from enrichmentanalysis.wr_tbl_class import WrXlsx
     items_str = "items" if "items" not in kws else kws["items"]
     prt_hdr_min = 10
     num_items = 0
@@ -103,15 +116,19 @@ def wr_xlsx_sections(fout_xlsx, xlsx_data, **kws):
         for section_text, data_nts in xlsx_data:
             num_items += len(data_nts)
             fmt = xlsxobj.wbfmtobj.get_fmt_section()
+            # Start a new worksheet if the section name and headers do not fit
+            worksheet, row_idx = xlsxobj.get_wsh_row(worksheet, row_idx, 2)
             row_idx = xlsxobj.wr_row_mergeall(worksheet, section_text, fmt, row_idx)
             if hdrs_wrote is False or len(data_nts) > prt_hdr_min:
                 row_idx = xlsxobj.wr_hdrs(worksheet, row_idx)
                 hdrs_wrote = True
             row_idx = xlsxobj.wr_data(data_nts, row_idx, worksheet)
+            worksheet = xlsxobj.worksheet
         # Close xlsx file
         xlsxobj.workbook.close()
-        sys.stdout.write("  {N:>5} {ITEMS} WROTE: {FOUT} ({S} sections)\n".format(
-            N=num_items, ITEMS=items_str, FOUT=fout_xlsx, S=len(xlsx_data)))
+        sys.stdout.write("  {N:>5} {ITEMS} WROTE: {FOUT} ({S} sections){SHEETS}\n".format(
+            N=num_items, ITEMS=items_str, FOUT=fout_xlsx, S=len(xlsx_data),
+            SHEETS=_get_sheets_str(xlsxobj)))
     else:
         sys.stdout.write("      0 {ITEMS}. NOT WRITING {FOUT}\n".format(
             ITEMS=items_str, FOUT=fout_xlsx))
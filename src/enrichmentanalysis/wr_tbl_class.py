@@ -15,6 +15,10 @@ class WrXlsxParams(object):
         self.prt_if = kws.get('prt_if', None)
         # Initialize sort_by
         self.sort_by = kws.get('sort_by', None)
+        # Write each row to disk when the next row is started, rather than when closing
+        self.constant_memory = kws.get('constant_memory', False)
+        # Rows in a worksheet, including titles and headers. More rows continue on a new sheet
+        self.max_rows = kws.get('max_rows', WrXlsx.excel_max_rows)
 
 
 class WrXlsx(object):
@@ -22,15 +26,22 @@ class WrXlsx(object):
 
     dflt_fmt_hdr = {'top':0, 'bottom':0, 'left':0, 'right':0, 'bold':True}
 
+    # The maximum number of rows in an Excel worksheet
+    excel_max_rows = 1048576
+
     def __init__(self, fout_xlsx, nt_flds, **kws):
         # KEYWORDS FOR WRITING DATA:
         self.vars = WrXlsxParams(**kws)
         # Workbook
         from xlsxwriter import Workbook
-        self.workbook = Workbook(fout_xlsx)
+        # In constant_memory mode, rows must be written in order
+        self.workbook = Workbook(fout_xlsx, {'constant_memory':self.vars.constant_memory})
         self.wbfmtobj = WbFmt(nt_flds, self.workbook, **kws)
         self.hdrs = self.wbfmtobj.get_hdrs(**kws)
         self.fmt_hdr = self.workbook.add_format(self.dflt_fmt_hdr)
+        # The worksheet being written and the number of data rows written to all worksheets
+        self.worksheet = None
+        self.num_data_rows = 0
 
     def wr_title(self, worksheet, row_idx=0):
         """Write title (optional)."""
@@ -61,8 +72,18 @@ class WrXlsx(object):
         row_idx += 1
         return row_idx
 
+    def get_wsh_row(self, worksheet, row_idx, num_rows=1):
+        """Return the worksheet and row to write num_rows rows, adding a worksheet if full."""
+        if row_idx + num_rows <= self.vars.max_rows:
+            return worksheet, row_idx
+        worksheet = self.add_worksheet()
+        return worksheet, self.wr_hdrs(worksheet, 0)
+
     def wr_data(self, xlsx_data, row_i, worksheet):
-        """Write data into xlsx worksheet."""
+        """Write data into xlsx worksheet, continuing on new worksheets when full.
+
+        xlsx_data may be any iterable. The worksheet written last is in self.worksheet.
+        """
         fld2fmt = self.vars.fld2fmt
         # User may specify to skip rows based on values in row
         prt_if = self.vars.prt_if
@@ -75,6 +96,7 @@ class WrXlsx(object):
         try:
             for data_nt in xlsx_data:
                 if prt_if is None or prt_if(data_nt):
+                    worksheet, row_i = self.get_wsh_row(worksheet, row_i)
                     wbfmt = get_wbfmt(data_nt)  # xlsxwriter.format.Format created w/add_format
                     # Print an xlsx row by printing each column in order.
                     for col_i, fld in enumerate(prt_flds):
@@ -89,6 +111,7 @@ class WrXlsx(object):
                         except:
                             raise RuntimeError(self._get_err_msg(row_i, col_i, fld, val, prt_flds))
                     row_i += 1
+                    self.num_data_rows += 1
         except RuntimeError as inst:
             import traceback
             traceback.print_exc()
@@ -111,6 +134,7 @@ class WrXlsx(object):
         wsh = self.workbook.add_worksheet()
         if self.vars.fld2col_widths is not None:
             self.set_xlsx_colwidths(wsh, self.vars.fld2col_widths, self.wbfmtobj.get_prt_flds())
+        self.worksheet = wsh
         return wsh
 
     @staticmethod
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Benchmark multiple-test corrections using numpy and statsmodels."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import sys
+import timeit
+import collections as cx
+import numpy as np
+from enrichmentanalysis.multiple_testing import Methods
+from enrichmentanalysis.multiple_testing import MethodsAll
+from enrichmentanalysis.multiple_testing import MultitestNumpy
+
+
+def bench_multitest(repeat=5, prt=sys.stdout):
+    """Time running all numpy methods and the same methods in statsmodels."""
+    methods = [m for m in dict(MethodsAll.all_methods)['numpy'] if m != 'hommel']
+    ntobj = cx.namedtuple('NtPval', 'pval_uncorr')
+    prng = np.random.RandomState(1)
+    prt.write('\n{N:>7} {NP:>9} {SM:>9} {SPEEDUP:>7}\n'.format(
+        N='TERMS', NP='NUMPY', SM='STATSMOD', SPEEDUP='SPEEDUP'))
+    for num_terms in (4000, 40000, 400000):
+        ntpvals = [ntobj(p) for p in prng.uniform(size=num_terms)**3]
+        objnp = Methods(['np_' + m for m in methods])
+        objsm = Methods(['sm_' + m for m in methods])
+        secs_np = min(timeit.repeat(lambda: objnp.run_multitest_corr(ntpvals, None),
+                                    number=1, repeat=repeat))
+        secs_sm = min(timeit.repeat(lambda: objsm.run_multitest_corr(ntpvals, None),
+                                    number=1, repeat=repeat))
+        prt.write('{N:7,} {NP:9.5f} {SM:9.5f} {SPEEDUP:6.1f}x\n'.format(
+            N=num_terms, NP=secs_np, SM=secs_sm, SPEEDUP=secs_sm/secs_np))
+
+def bench_hommel(repeat=1, prt=sys.stdout):
+    """Time the numpy O(n log n) Hommel correction and the O(n^2) statsmodels Hommel."""
+    from statsmodels.sandbox.stats.multicomp import multipletests
+    prng = np.random.RandomState(1)
+    prt.write('\n{N:>7} {NP:>9} {SM:>9} {SPEEDUP:>7} HOMMEL\n'.format(
+        N='PVALS', NP='NUMPY', SM='STATSMOD', SPEEDUP='SPEEDUP'))
+    for num_pvals in (1000, 10000, 50000):
+        pvals = prng.uniform(size=num_pvals)**3
+        secs_np = min(timeit.repeat(lambda: MultitestNumpy(pvals).run_multitest('hommel'),
+                                    number=1, repeat=repeat))
+        secs_sm = min(timeit.repeat(lambda: multipletests(pvals, 0.05, 'hommel'),
+                                    number=1, repeat=repeat))
+        prt.write('{N:7,} {NP:9.5f} {SM:9.5f} {SPEEDUP:6.1f}x\n'.format(
+            N=num_pvals, NP=secs_np, SM=secs_sm, SPEEDUP=secs_sm/secs_np))
+
+
+if __name__ == '__main__':
+    bench_multitest()
+    bench_hommel()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
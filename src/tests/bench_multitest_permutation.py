@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Benchmark Westfall-Young min-p p-values by number of processes and permutations per chunk."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import timeit
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def bench_multitest_permutation(permutations=2000, repeat=3, prt=sys.stdout):
+    """Time Westfall-Young min-p p-values by number of processes and permutations per chunk."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    prt.write('\n{N:,} permutations\n{JOBS:>4} {CHUNK:>6} {MB:>8} {SECS:>9}\n'.format(
+        N=permutations, JOBS='JOBS', CHUNK='CHUNK', MB='CHUNK MB', SECS='SECONDS'))
+    pvals_exp = None
+    for jobs in [1, 2, 4]:
+        for max_cells in [1 << 20, 1 << 23]:
+            objrun = EnrichmentRun(pop_ids, assc, methods=['wy_minp'], permutations=permutations,
+                                   permutation_jobs=jobs, pvalcalc='fisher_logfactorial')
+            objperm = objrun.objmethods.objperm
+            objperm.max_cells = max_cells
+            fnc = lambda o=objrun: o.run_study(stu_ids, 'exgo', None)
+            secs = min(timeit.repeat(fnc, number=1, repeat=repeat))
+            pvals = [r.multitests.wy_minp for r in fnc().results]
+            assert pvals_exp is None or pvals == pvals_exp
+            pvals_exp = pvals
+            num_terms = len(objrun.index.terms)
+            chunk = max(1, max_cells//num_terms)
+            # Study counts and p-values of one chunk: int64 and float64 for each term
+            prt.write('{JOBS:4} {CHUNK:6} {MB:8.1f} {SECS:9.3f}\n'.format(
+                JOBS=jobs, CHUNK=chunk, MB=chunk*num_terms*16/1e6, SECS=secs))
+
+
+if __name__ == '__main__':
+    bench_multitest_permutation()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
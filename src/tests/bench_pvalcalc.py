@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Benchmark the uncorrected p-value functions on the GO example in data/exgo."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import timeit
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.pvalcalc import FisherFactory
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def bench_pvalcalc(pvalcalcs=None, repeat=3, prt=sys.stdout):
+    """Time the uncorrected p-values for the exgo study using each p-value function."""
+    if pvalcalcs is None:
+        pvalcalcs = list(FisherFactory.options.keys())
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    name2secs = {}
+    name2pvals = {}
+    for pvalcalc in pvalcalcs:
+        # Turn off the p-value memo so repeated runs time the p-value function
+        objrun = EnrichmentRun(pop_ids, assc, methods=['fdr_bh'], pvalcalc=pvalcalc, pval_memo=0)
+        study_in_pop = stu_ids.intersection(objrun.pop_ids)
+        fnc = lambda o=objrun: o.get_pval_uncorr(study_in_pop, log=None)
+        name2secs[pvalcalc] = min(timeit.repeat(fnc, number=1, repeat=repeat))
+        name2pvals[pvalcalc] = {r.termid:r.ntpval.pval_uncorr for r in fnc()}
+    _prt_bench(name2secs, name2pvals, pvalcalcs[0], prt)
+    return name2secs
+
+def _prt_bench(name2secs, name2pvals, name_ref, prt):
+    """Print the run times and the largest difference from the reference p-values."""
+    secs_ref = name2secs[name_ref]
+    term2pval_ref = name2pvals[name_ref]
+    prt.write('\n{NAME:20} {SECS:>9} {SPEEDUP:>7} {RELDIFF:>12}\n'.format(
+        NAME='P-VALUE FUNCTION', SECS='SECONDS', SPEEDUP='SPEEDUP', RELDIFF='MAX REL DIFF'))
+    for name, secs in name2secs.items():
+        term2pval = name2pvals[name]
+        reldiff = max(abs(term2pval[t] - p)/p for t, p in term2pval_ref.items())
+        prt.write('{NAME:20} {SECS:9.4f} {SPEEDUP:6.1f}x {RELDIFF:12.2e}\n'.format(
+            NAME=name, SECS=secs, SPEEDUP=secs_ref/secs, RELDIFF=reldiff))
+
+
+if __name__ == '__main__':
+    bench_pvalcalc()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Benchmark the memory used by enrichment records on the GO example in data/exgo."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import tracemalloc
+import collections as cx
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+class RecordDict(EnrichmentRecord):
+    """An enrichment record having a __dict__, like records before __slots__ were added."""
+
+
+def bench_rec_memory(prt=sys.stdout):
+    """Measure bytes per record with and without __slots__ and for runtime namedtuple types."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'])
+    recs = objrun.run_study(stu_ids, 'exgo', log=None).results
+    prt.write('\n{N:,} records\n'.format(N=len(recs)))
+    prt.write('{BYTES:>9} {TYPE}\n'.format(BYTES='BYTES/REC', TYPE='RECORD'))
+    for cls in [RecordDict, EnrichmentRecord]:
+        prt.write('{BYTES:9.1f} {TYPE}\n'.format(
+            BYTES=get_bytes_per_rec(cls, recs), TYPE=cls.__name__))
+    # Before namedtuple types were cached, each study created its own types
+    tracemalloc.start()
+    ntobj = cx.namedtuple('NtM', ' '.join(objrun.objmethods.get_fields().split()))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    prt.write('{BYTES:9,} bytes for each namedtuple type ({NT})\n'.format(
+        BYTES=peak, NT=ntobj.__name__))
+
+def get_bytes_per_rec(cls, recs):
+    """Return the memory allocated for each record object, excluding shared values."""
+    tracemalloc.start()
+    objs = []
+    for rec in recs:
+        obj = cls(rec.termid, rec.ntpval, studyitems=rec.studyitems)
+        obj.multitests = rec.multitests
+        obj.prtfmt = rec.prtfmt
+        obj.ntobj = rec.ntobj
+        objs.append(obj)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(size)/len(objs)
+
+
+if __name__ == '__main__':
+    bench_rec_memory()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
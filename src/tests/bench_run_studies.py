@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark running many studies with run_studies vs. running each study with run_study."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import random
+import timeit
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def bench_run_studies(num_studies=150, prt=sys.stdout):
+    """Time running random studies of 20 to 500 population IDs, one at a time and all at once.
+
+    Each timing uses a new EnrichmentRun, so both start with an empty p-value memo.
+    """
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    random.seed(4)
+    pop_assc = sorted(pop_ids.intersection(assc))
+    name2ids = {'study{I}'.format(I=i):set(random.sample(pop_assc, random.randint(20, 500)))
+                for i in range(num_studies)}
+    prt.write('\n{PVAL:20} {COLS:8} {LOOP:>9} {BATCH:>9} {SPEEDUP:>7}\n'.format(
+        PVAL='P-VALUE FUNCTION', COLS='RESULTS', LOOP='LOOP', BATCH='BATCH', SPEEDUP='SPEEDUP'))
+    for pvalcalc, columnar in [('fisher_scipy_stats', False),
+                               ('fisher_logfactorial', False),
+                               ('fisher_logfactorial', True)]:
+        kws = {'methods':['fdr_bh', 'holm'], 'pvalcalc':pvalcalc, 'columnar':columnar}
+        objrun = EnrichmentRun(pop_ids, assc, **kws)
+        fnc_loop = lambda o=objrun: [o.run_study(ids, nm, None) for nm, ids in name2ids.items()]
+        secs_loop = timeit.timeit(fnc_loop, number=1)
+        objrun = EnrichmentRun(pop_ids, assc, **kws)
+        secs_batch = timeit.timeit(lambda o=objrun: o.run_studies(name2ids, None), number=1)
+        prt.write('{PVAL:20} {COLS:8} {LOOP:9.3f} {BATCH:9.3f} {SPEEDUP:6.1f}x\n'.format(
+            PVAL=pvalcalc, COLS='columns' if columnar else 'records',
+            LOOP=secs_loop, BATCH=secs_batch, SPEEDUP=secs_loop/secs_batch))
+    prt.write('{N} studies, {T:,} terms\n'.format(N=num_studies, T=len(objrun.index.terms)))
+
+
+if __name__ == '__main__':
+    bench_run_studies()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Benchmark counting study hits per term on the GO example in data/exgo."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import random
+import timeit
+import collections as cx
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_index import COUNTERS
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def bench_term_cnts(repeat=5, prt=sys.stdout):
+    """Time counting study hits per term using sets of strings and each counting option."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    name2objrun = {nm:EnrichmentRun(pop_ids, assc, counter=nm) for nm in COUNTERS}
+    index = next(iter(name2objrun.values())).index
+    assc_pop = index.get_assc()
+    random.seed(1)
+    genes = sorted(index.genes)
+    studies = [('exgo study', stu_ids.intersection(index.gene2idx))] + \
+              [('random {N}'.format(N=n), set(random.sample(genes, n))) for n in (1000, 10000)]
+    prt.write('\n{STUDY:12} {COUNTER:>8} {SECS:>9} {SPEEDUP:>7}\n'.format(
+        STUDY='STUDY', COUNTER='COUNTER', SECS='SECONDS', SPEEDUP='SPEEDUP'))
+    for study_name, study in studies:
+        # The dict-of-sets counting which EnrichmentRun used before the index was added
+        fnc_sets = lambda s=study: get_term2ids(s, assc_pop)
+        secs_sets = min(timeit.repeat(fnc_sets, number=1, repeat=repeat))
+        term2ids = get_term2ids(study, assc_pop)
+        prt.write('{STUDY:12} {COUNTER:>8} {SECS:9.5f}\n'.format(
+            STUDY=study_name, COUNTER='sets', SECS=secs_sets))
+        gene_idxs = index.get_gene_idxs(study)
+        for name, objrun in name2objrun.items():
+            fnc = lambda o=objrun: o.counter.get_term_cnts(gene_idxs)
+            secs = min(timeit.repeat(fnc, number=1, repeat=repeat))
+            cnts = fnc()
+            assert all(cnts[i] == len(term2ids.get(t, [])) for i, t in enumerate(index.terms))
+            prt.write('{STUDY:12} {COUNTER:>8} {SECS:9.5f} {SPEEDUP:6.1f}x\n'.format(
+                STUDY=study_name, COUNTER=name, SECS=secs, SPEEDUP=secs_sets/secs))
+
+def get_term2ids(geneset, assc):
+    """Get the terms in the IDs group"""
+    term2ids = cx.defaultdict(set)
+    genes_in_assc = geneset.intersection(assc)
+    for gene in genes_in_assc:
+        for goid in assc[gene]:
+            term2ids[goid].add(gene)
+    return {t:ids for t, ids in term2ids.items()}
+
+
+if __name__ == '__main__':
+    bench_term_cnts()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Benchmark updating a study's results after a few study IDs change, vs. rerunning the study."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import random
+import timeit
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def bench_update_study(repeat=7, prt=sys.stdout):
+    """Time rerunning a study and updating its results after 5 study IDs are changed.
+
+    With the p-value memo, rerunning a study finds most p-values in the memo.
+    """
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(2)
+    # Population IDs which are in the association
+    pop_assc = pop_ids.intersection(assc)
+    genes_add = random.sample(sorted(pop_assc.difference(stu_ids)), 5)
+    genes_swap = random.sample(sorted(pop_assc.intersection(stu_ids)), 5)
+    prt.write('\n{COLS:8} {MEMO:6} {DELTA:9} {RERUN:>9} {UPDATE:>9} {SPEEDUP:>7}\n'.format(
+        COLS='RESULTS', MEMO='MEMO', DELTA='DELTA', RERUN='RERUN', UPDATE='UPDATE',
+        SPEEDUP='SPEEDUP'))
+    for columnar, memo in [(False, 100000), (True, 100000), (False, 0), (True, 0)]:
+        objrun = EnrichmentRun(pop_ids, assc, methods=['np_fdr_bh'], columnar=columnar,
+                               pval_memo=memo)
+        objres = objrun.run_study(stu_ids, 'exgo', None)
+        # 5 IDs added and then removed; 5 IDs replaced by 5 others, keeping the study size
+        for delta, added, removed in [('+5/-5', genes_add, []), ('swap 5', genes_add, genes_swap)]:
+            study_ids = stu_ids.union(added).difference(removed)
+            fnc_rerun = lambda s=study_ids: objrun.run_study(s, 'exgo', None)
+            secs_rerun = min(timeit.repeat(fnc_rerun, number=1, repeat=repeat))
+            fnc_update = lambda a=added, r=removed: (objres.update(a, r), objres.update(r, a))
+            # Each repetition updates the results twice: to the changed study and back
+            secs_update = min(timeit.repeat(fnc_update, number=1, repeat=repeat))/2
+            prt.write(
+                '{COLS:8} {MEMO:6} {DELTA:9} {RERUN:9.5f} {UPDATE:9.5f} {SPEEDUP:6.1f}x\n'.format(
+                    COLS='columns' if columnar else 'records', MEMO='on' if memo else 'off',
+                    DELTA=delta, RERUN=secs_rerun, UPDATE=secs_update,
+                    SPEEDUP=secs_rerun/secs_update))
+    prt.write('{N:,} terms\n'.format(N=len(objrun.index.terms)))
+
+
+if __name__ == '__main__':
+    bench_update_study()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
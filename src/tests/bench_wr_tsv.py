@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Benchmark writing a tsv of 20,000 terms corrected with all multiple-test methods."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import random
+import timeit
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.multiple_testing import MethodsAll
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_results import wr_results_tsv
+
+
+def bench_wr_tsv(num_terms=20000, repeat=3, prt=sys.stdout):
+    """Time writing all results using ReportResults and writing a batch of rows at a time."""
+    random.seed(1)
+    genes = ['G{N:05}'.format(N=n) for n in range(20000)]
+    terms = ['T{N:05}'.format(N=n) for n in range(num_terms)]
+    assc = {g:set(random.sample(terms, random.randint(5, 30))) for g in genes}
+    stu_ids = set(random.sample(genes, 2000))
+    methods = ['np_' + m for m in dict(MethodsAll.all_methods)['numpy']]
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        name2fnc = {}
+        for columnar in [False, True]:
+            objres = EnrichmentRun(set(genes), assc, methods=methods, columnar=columnar).run_study(
+                stu_ids, 'random', log=None)
+            name = 'columns' if columnar else 'records'
+            name2fnc['ReportResults ' + name] = lambda o=objres: ReportResults(
+                o.get_results_cond(None, None)).wrtsv('bench_wr_tsv.tsv')
+            name2fnc['wr_results_tsv ' + name] = lambda o=objres: wr_results_tsv(
+                'bench_wr_tsv.tsv', o)
+            name2fnc['wr_results_tsv.gz ' + name] = lambda o=objres: wr_results_tsv(
+                'bench_wr_tsv.tsv.gz', o)
+        name2secs = {n:min(timeit.repeat(f, number=1, repeat=repeat)) for n, f in name2fnc.items()}
+    sys.stdout = stdout
+    prt.write('\n{N:,} terms, {M} methods\n'.format(N=len(objres.results), M=len(methods)))
+    secs_base = name2secs['ReportResults records']
+    for name, secs in name2secs.items():
+        prt.write('{NAME:28} {SECS:8.3f} sec {SPEEDUP:5.1f}x\n'.format(
+            NAME=name, SECS=secs, SPEEDUP=secs_base/secs))
+
+
+if __name__ == '__main__':
+    bench_wr_tsv()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
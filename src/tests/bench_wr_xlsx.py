@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Benchmark the peak memory of writing a xlsx of 20,000 terms with all multiple-test methods."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import random
+import timeit
+import tracemalloc
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.multiple_testing import MethodsAll
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_results import wr_results_xlsx
+
+
+def bench_wr_xlsx(num_terms=20000, prt=sys.stdout):
+    """Measure peak memory writing all results in memory and writing in constant memory."""
+    random.seed(1)
+    genes = ['G{N:05}'.format(N=n) for n in range(20000)]
+    terms = ['T{N:05}'.format(N=n) for n in range(num_terms)]
+    assc = {g:set(random.sample(terms, random.randint(5, 30))) for g in genes}
+    stu_ids = set(random.sample(genes, 2000))
+    methods = ['np_' + m for m in dict(MethodsAll.all_methods)['numpy']]
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        objres = EnrichmentRun(set(genes), assc, methods=methods, columnar=True).run_study(
+            stu_ids, 'random', log=None)
+        name2fnc = {
+            'in memory': lambda: ReportResults(objres.get_results_cond(None, None)).wrxlsx(
+                'bench_wr_xlsx.xlsx', constant_memory=False),
+            'constant_memory': lambda: wr_results_xlsx('bench_wr_xlsx.xlsx', objres),
+        }
+        name2vals = {n:_get_peak_secs(f) for n, f in name2fnc.items()}
+    sys.stdout = stdout
+    prt.write('\n{N:,} terms, {M} methods\n'.format(N=len(objres.results), M=len(methods)))
+    for name, (peak, secs) in name2vals.items():
+        prt.write('{NAME:16} {MB:8.1f} MB peak {SECS:8.3f} sec\n'.format(
+            NAME=name, MB=peak/1e6, SECS=secs))
+
+def _get_peak_secs(fnc):
+    """Return the peak memory allocated while running a function and its run time."""
+    tracemalloc.start()
+    fnc()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, min(timeit.repeat(fnc, number=1, repeat=1))
+
+
+if __name__ == '__main__':
+    bench_wr_xlsx()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
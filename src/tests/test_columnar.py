@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Test that results stored in columns match results stored as records."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+from enrichmentanalysis.enrich_parallel import run_studies_parallel
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_columnar():
+    """Test that results stored in columns match results stored as records."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    kws = {'methods':['holm', 'fdr_bh', 'sm_fdr_bh'], 'pvalcalc':'fisher_logfactorial'}
+    objrun_recs = EnrichmentRun(pop_ids, assc, **kws)
+    objrun_cols = EnrichmentRun(pop_ids, assc, columnar=True, **kws)
+    random.seed(9)
+    name2ids = {'exgo':stu_ids, 'random':set(random.sample(sorted(objrun_recs.pop_ids), 300))}
+    for terms in ['all', 'study_hit']:
+        for name, ids in name2ids.items():
+            objres_a = objrun_recs.run_study(ids, name, None, terms)
+            objres_b = objrun_cols.run_study(ids, name, None, terms)
+            assert isinstance(objres_b.results, EnrichmentColumns)
+            _chk_results(objres_a, objres_b)
+        name2res = objrun_cols.run_studies(name2ids, None, terms)
+        for name, objres in name2res.items():
+            _chk_results(objrun_recs.run_study(name2ids[name], name, None, terms), objres)
+    for name, objres in run_studies_parallel(objrun_cols, name2ids, jobs=2):
+        assert isinstance(objres.results, EnrichmentColumns)
+        _chk_results(objrun_recs.run_study(name2ids[name], name, None), objres)
+
+def _chk_results(objres_a, objres_b):
+    """Check that two sets of enrichment results are the same."""
+    assert len(objres_a.results) == len(objres_b.results)
+    assert objres_b.results.get_termids() == [r.termid for r in objres_a.results]
+    for rec_a, rec_b in zip(objres_a.results, objres_b.results):
+        assert rec_a.ntpval == rec_b.ntpval
+        assert rec_a.multitests == rec_b.multitests
+        assert rec_a.stu_items == rec_b.stu_items
+        assert rec_a.pop_items == rec_b.pop_items
+        assert str(rec_a) == str(rec_b)
+        assert rec_a.get_nt_prt() == rec_b.get_nt_prt()
+    for max_pval, pval_field in [(None, None), (0.05, None), (0.05, 'fdr_bh'), (0.5, 'holm')]:
+        recs_a = objres_a.get_results_cond(max_pval, pval_field)
+        recs_b = objres_b.get_results_cond(max_pval, pval_field)
+        assert [str(r) for r in recs_a] == [str(r) for r in recs_b]
+
+
+if __name__ == '__main__':
+    test_columnar()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Test that a compiled association gives the same results as the association file."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+import shutil
+import tempfile
+import numpy as np
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.file_utils import read_associations_cached
+from enrichmentanalysis.file_utils import compile_associations
+from enrichmentanalysis.file_utils import is_cache_fresh
+from enrichmentanalysis.enrich_index import EnrichmentIndex
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_compile_associations():
+    """Test that a compiled association gives the same results as the association file."""
+    dir_tmp = tempfile.mkdtemp()
+    try:
+        fin_assc = os.path.join(dir_tmp, 'association')
+        shutil.copy(os.path.join(REPO, 'data/exgo/association'), fin_assc)
+        _run(fin_assc)
+    finally:
+        shutil.rmtree(dir_tmp)
+
+def _run(fin_assc):
+    """Compile an association, load it, and run enrichments."""
+    assc = read_associations(fin_assc)
+    # The association file is read until it is compiled
+    assert read_associations_cached(fin_assc) == assc
+    dir_cache = compile_associations(fin_assc)
+    assert is_cache_fresh(fin_assc, dir_cache)
+    index = read_associations_cached(fin_assc)
+    assert isinstance(index, EnrichmentIndex)
+    assert isinstance(index.gene_terms, np.memmap)
+    assert index.get_assc() == assc
+    # Enrichments use the compiled association, with the population a subset of its genes
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(5)
+    for pop in [pop_ids, set(random.sample(sorted(pop_ids), 400)).union(stu_ids)]:
+        objres_a = EnrichmentRun(pop, index, methods=['holm']).run_study(stu_ids, 'a', None)
+        objres_b = EnrichmentRun(pop, assc, methods=['holm']).run_study(stu_ids, 'b', None)
+        assert objres_a.study_ids == objres_b.study_ids
+        assert _get_nts(objres_a) == _get_nts(objres_b)
+    # A touched association file is hashed and found unchanged
+    mtime_ns = os.stat(fin_assc).st_mtime_ns
+    _set_mtime_ns(fin_assc, mtime_ns + 10**9)
+    assert is_cache_fresh(fin_assc, dir_cache)
+    # A matching size and modification time is trusted unless verified by the hash
+    with open(fin_assc, 'r+b') as prt:
+        prt.seek(-2, os.SEEK_END)
+        last = prt.read(1)
+        prt.seek(-2, os.SEEK_END)
+        prt.write(b'8' if last != b'8' else b'9')
+    _set_mtime_ns(fin_assc, mtime_ns)
+    assert is_cache_fresh(fin_assc, dir_cache)
+    assert not is_cache_fresh(fin_assc, dir_cache, verify=True)
+    # A compiled association is not used after the association file changes
+    with open(fin_assc, 'a') as prt:
+        prt.write('NEWGENE\tGO:0000001\n')
+    assert not is_cache_fresh(fin_assc, dir_cache)
+    assert 'NEWGENE' in read_associations_cached(fin_assc)
+
+def _set_mtime_ns(fin, mtime_ns):
+    """Set the access and modification times of a file."""
+    os.utime(fin, ns=(mtime_ns, mtime_ns))
+
+def _get_nts(objres):
+    """Return the p-values and study and population items for each term."""
+    return {r.termid:(r.ntpval, r.multitests, r.stu_items, r.pop_items) for r in objres.results}
+
+
+if __name__ == '__main__':
+    test_compile_associations()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
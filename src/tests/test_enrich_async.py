@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Test running studies from an asyncio event loop: results, coalescing, and cancellation."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+import asyncio
+import threading
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_results import EnrichmentResults
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_enrich_async():
+    """Test running studies from an asyncio event loop: results, coalescing, and cancellation."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(11)
+    name2ids = {'exgo':stu_ids, 'empty':set()}
+    for idx in range(5):
+        name2ids['random{I}'.format(I=idx)] = set(random.sample(sorted(pop_ids), 100 + 50*idx))
+    for columnar in [False, True]:
+        objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'], columnar=columnar,
+                               async_jobs=2)
+        exp = objrun.run_studies(name2ids, None)
+        # Results are the same as running the studies without an event loop
+        act = asyncio.run(objrun.arun_studies(name2ids))
+        assert list(act) == list(exp)
+        for name, objres in act.items():
+            _chk_results(exp[name], objres, name)
+        act = asyncio.run(objrun.arun_study(stu_ids, 'exgo', terms='study_hit'))
+        _chk_results(objrun.run_study(stu_ids, 'exgo', None, 'study_hit'), act, 'exgo')
+    # Identical studies in flight are run once; at most async_jobs studies are run at once
+    counts = _wrap_run_study(objrun)
+    name2ids_dup = dict(name2ids, exgo_copy=list(stu_ids), exgo_again=stu_ids)
+    act = asyncio.run(objrun.arun_studies(name2ids_dup))
+    assert counts['calls'] == len(name2ids), counts
+    assert counts['max_running'] == 2, counts
+    assert objrun._arunner.coalesced == 2  # pylint: disable=protected-access
+    for name in ['exgo_copy', 'exgo_again']:
+        _chk_results(exp['exgo'], act[name], name)
+    assert not objrun._arunner.key2inflight  # pylint: disable=protected-access
+    asyncio.run(_chk_cancel(objrun, name2ids, counts))
+    asyncio.run(_chk_cancel_running(objrun, name2ids, counts))
+
+async def _chk_cancel(objrun, name2ids, counts):
+    """Check that cancelling a study does not cancel other callers waiting for it."""
+    counts['calls'] = 0
+    # Two studies fill the two jobs; the studies submitted later wait for a job
+    tasks = [asyncio.ensure_future(objrun.arun_study(name2ids[nm], nm))
+             for nm in ['random3', 'random4']]
+    task_a = asyncio.ensure_future(objrun.arun_study(name2ids['random0'], 'a'))
+    task_b = asyncio.ensure_future(objrun.arun_study(name2ids['random0'], 'b'))
+    task_c = asyncio.ensure_future(objrun.arun_study(name2ids['random1'], 'c'))
+    await asyncio.sleep(0)
+    # One of two callers of an identical study is cancelled: the study is still run
+    task_a.cancel()
+    # The only caller of a study is cancelled before the study runs: it is not run
+    task_c.cancel()
+    objres_b = await task_b
+    for task in [task_a, task_c]:
+        try:
+            await task
+            assert False, task
+        except asyncio.CancelledError:
+            pass
+    await asyncio.gather(*tasks)
+    assert objres_b.name == 'b' and objres_b.study_tot
+    assert counts['calls'] == 3, counts
+
+async def _chk_cancel_running(objrun, name2ids, counts):
+    """Check that a cancelled study running in the executor holds its job until it finishes."""
+    counts.update(calls=0, max_running=0, gate=threading.Event())
+    task_a = asyncio.ensure_future(objrun.arun_study(name2ids['random2'], 'a'))
+    task_b = asyncio.ensure_future(objrun.arun_study(name2ids['random3'], 'b'))
+    try:
+        while counts['running'] != 2:
+            await asyncio.sleep(0.01)
+        # Both jobs are running: The cancelled study is still running, so a new study waits
+        task_a.cancel()
+        task_c = asyncio.ensure_future(objrun.arun_study(name2ids['random4'], 'c'))
+        await asyncio.sleep(0.2)
+        assert counts['calls'] == 2, counts
+    finally:
+        # The executor's threads finish even if a check fails
+        counts['gate'].set()
+    await asyncio.gather(task_b, task_c)
+    assert task_a.cancelled()
+    assert counts['calls'] == 3, counts
+    assert counts['max_running'] == 2, counts
+
+def _wrap_run_study(objrun):
+    """Count calls to run_study and the most studies running at the same time.
+
+    If counts['gate'] is set to a threading.Event, studies finish only after it is set.
+    """
+    counts = {'calls':0, 'running':0, 'max_running':0, 'gate':None}
+    lock = threading.Lock()
+    run_study = objrun.run_study
+    def _run_study(*args):
+        with lock:
+            counts['calls'] += 1
+            counts['running'] += 1
+            counts['max_running'] = max(counts['max_running'], counts['running'])
+        try:
+            if counts['gate'] is not None:
+                counts['gate'].wait()
+            return run_study(*args)
+        finally:
+            with lock:
+                counts['running'] -= 1
+    objrun.run_study = _run_study
+    return counts
+
+def _chk_results(objres_exp, objres_act, name):
+    """Check that two sets of enrichment results are the same."""
+    if not objres_exp:
+        assert objres_act == []
+        return
+    assert isinstance(objres_act, EnrichmentResults)
+    assert objres_act.name == name
+    assert objres_act.study_ids == objres_exp.study_ids
+    recs_exp = objres_exp.get_results_cond(None, None)
+    recs_act = objres_act.get_results_cond(None, None)
+    assert [r.get_nt_prt() for r in recs_act] == [r.get_nt_prt() for r in recs_exp]
+
+
+if __name__ == '__main__':
+    test_enrich_async()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
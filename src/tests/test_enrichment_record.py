@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Test that records have no __dict__ and share the namedtuple types of their run."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import pickle
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_rec import EnrichmentRecord
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_enrichment_record():
+    """Test that records have no __dict__ and share the namedtuple types of their run."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'])
+    recs = objrun.run_study(stu_ids, 'a', log=None).results
+    recs += objrun.run_study(set(sorted(stu_ids)[:100]), 'b', log=None).results
+    assert not hasattr(recs[0], '__dict__')
+    assert len(set(type(r.multitests) for r in recs)) == 1
+    assert len(set(r.ntobj for r in recs)) == 1
+    # Items are created from the index when requested
+    index = objrun.index
+    for rec in recs[:200]:
+        term_gene_idxs = index.get_term_gene_idxs(index.term2idx[rec.termid])
+        assert rec.pop_items == set(index.genes[i] for i in term_gene_idxs)
+        assert rec.stu_items == rec.pop_items.intersection(rec.studyitems.index.genes[i]
+                                                           for i in rec.studyitems.gene_idxs)
+        assert len(rec.stu_items) == rec.ntpval.study_cnt
+    # Report namedtuples
+    rec = min(recs, key=lambda r: r.ntpval.pval_uncorr)
+    ntprt = rec.get_nt_prt()
+    rec_str = str(rec)
+    assert ntprt._fields == EnrichmentRecord.flds + ('holm', 'fdr_bh', 'stu_items')
+    assert ntprt.fdr_bh == '{:8.2e}'.format(rec.multitests.fdr_bh)
+    assert ntprt.stu_items == ';'.join(sorted(rec.stu_items))
+    # A record without a report namedtuple type gets a shared type for its multitest fields
+    rec.ntobj = None
+    rec.prtfmt = None
+    assert rec.get_nt_prt() == ntprt
+    assert str(rec) == rec_str
+    # The run may be pickled after its namedtuple types are created
+    assert pickle.loads(pickle.dumps(objrun)).run_study(stu_ids, 'c', log=None).results
+
+
+if __name__ == '__main__':
+    test_enrichment_record()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
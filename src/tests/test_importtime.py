@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Test that run_enrichment.py starts quickly, importing slow packages only when used."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import subprocess
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+# Packages which are imported only when the options using them are chosen
+SLOW_PKGS = ['scipy', 'statsmodels', 'pyarrow', 'xlsxwriter', 'multiprocessing']
+
+# Regression budget: Import time of 'run_enrichment.py --help' relative to the import time of
+# numpy and docopt, measured at the same time so the machine's speed and load cancel out.
+# It is about 1.3; before slow imports were deferred, scipy.stats alone made it more than 8.
+# Set ENRICHMENT_NO_IMPORT_BUDGET=1 to skip this check.
+BUDGET_RATIO = 3.0
+
+
+def test_importtime(prt=sys.stdout):
+    """Test that run_enrichment.py starts quickly, importing slow packages only when used."""
+    fin_bin = os.path.join(REPO, 'src/bin/run_enrichment.py')
+    mod2secs = _get_importtimes([fin_bin, '--help'])
+    # The fastest of a few runs is least affected by other work on the machine
+    secs = min([sum(mod2secs.values())] + [
+        sum(_get_importtimes([fin_bin, '--help']).values()) for _ in range(2)])
+    secs_base = min(sum(_get_importtimes(['import numpy, docopt']).values()) for _ in range(3))
+    prt.write('{N} modules imported in {S:.3f} seconds (numpy and docopt: {B:.3f})\n'.format(
+        N=len(mod2secs), S=secs, B=secs_base))
+    for mod, msecs in sorted(mod2secs.items(), key=lambda t: -t[1])[:5]:
+        prt.write('    {S:.3f} {MOD}\n'.format(S=msecs, MOD=mod))
+    assert not [m for m in mod2secs if m.split('.')[0] in SLOW_PKGS], sorted(mod2secs)
+    if not os.environ.get('ENRICHMENT_NO_IMPORT_BUDGET'):
+        assert secs < BUDGET_RATIO*secs_base, 'IMPORTS TOOK {R:.1f}x numpy+docopt'.format(
+            R=secs/secs_base)
+    # Importing the modules used to run enrichments does not import slow packages
+    _run_python([
+        'import sys',
+        'import enrichmentanalysis.enrich_run',
+        'import enrichmentanalysis.cli',
+        'slow = [m for m in sys.modules if m.split(".")[0] in {SLOW}]'.format(SLOW=SLOW_PKGS),
+        'assert not slow, slow',
+    ])
+    # Slow packages are imported when the options using them are used
+    _run_python([
+        'import sys',
+        'from enrichmentanalysis.pvalcalc import FisherFactory',
+        'from enrichmentanalysis.multiple_testing import Methods',
+        'assert "scipy" not in sys.modules',
+        'FisherFactory("fisher_logfactorial")',
+        'Methods(["fdr_bh", "holm"])',
+        'assert "scipy" not in sys.modules',
+        'FisherFactory("fisher_scipy_stats")',
+        'assert "scipy.stats" in sys.modules',
+        'assert "statsmodels" not in sys.modules',
+    ])
+
+def _get_importtimes(args):
+    """Return the time in seconds spent importing each module, excluding its imports."""
+    stderr = _run_python(args, ['-X', 'importtime'])
+    mod2secs = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'self [us]' not in line:
+            self_us, _, mod = line[12:].split('|')
+            mod2secs[mod.strip()] = int(self_us)/1e6
+    return mod2secs
+
+def _run_python(args, opts=()):
+    """Run Python, with code lines if args are not a script. Return stderr."""
+    if not args[0].endswith('.py'):
+        args = ['-c', '\n'.join(args)]
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO, 'src'))
+    proc = subprocess.run([sys.executable] + list(opts) + list(args), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    assert proc.returncode == 0, proc.stderr
+    return proc.stderr
+
+
+if __name__ == '__main__':
+    test_importtime()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test that numpy multiple-test corrections match statsmodels."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import numpy as np
+from statsmodels.sandbox.stats.multicomp import multipletests
+from enrichmentanalysis.multiple_testing import Methods
+from enrichmentanalysis.multiple_testing import MethodsAll
+from enrichmentanalysis.multiple_testing import MultitestNumpy
+
+
+def test_multitest_numpy():
+    """Test that numpy multiple-test corrections match statsmodels."""
+    methods = dict(MethodsAll.all_methods)['numpy']
+    prng = np.random.RandomState(7)
+    for pvals in _get_pvals_lists(prng):
+        for alpha in [0.01, 0.05, 0.25]:
+            objnp = MultitestNumpy(pvals, alpha)
+            for method in methods:
+                ntres = objnp.run_multitest(method)
+                reject, pvals_corrected, alpha_sidak, alpha_bonf = multipletests(
+                    pvals, alpha, method)
+                if method != 'hommel':
+                    assert np.array_equal(ntres.reject_lst, reject), method
+                    assert np.array_equal(ntres.pvals_corrected, pvals_corrected), method
+                else:
+                    # The minimum slope may be found at a different, but equal, p-value
+                    assert np.allclose(ntres.pvals_corrected, pvals_corrected, rtol=1e-12)
+                    assert np.array_equal(ntres.reject_lst, pvals_corrected <= alpha)
+                assert ntres.alphacSidak == alpha_sidak
+                assert ntres.alphacBonf == alpha_bonf
+
+def test_multitest_numpy_rows():
+    """Test that correcting many sets of p-values at once matches correcting each set."""
+    methods = dict(MethodsAll.all_methods)['numpy']
+    prng = np.random.RandomState(5)
+    # Sets with no, some, or all first stage rejections in the two-stage FDR methods
+    pvals_rows = np.round(prng.uniform(size=(40, 60))**prng.uniform(1, 12, (40, 1)), 3)
+    pvals_rows[:5] = 1.0
+    pvals_rows[5:10] = 1e-6
+    for alpha in [0.05, 0.25]:
+        objnp = MultitestNumpy(pvals_rows, alpha)
+        for method in methods:
+            ntres = objnp.run_multitest(method)
+            for pvals, reject, pvals_corrected in zip(
+                    pvals_rows, ntres.reject_lst, ntres.pvals_corrected):
+                ntres_row = MultitestNumpy(pvals, alpha).run_multitest(method)
+                assert np.array_equal(reject, ntres_row.reject_lst), method
+                assert np.array_equal(pvals_corrected, ntres_row.pvals_corrected), method
+
+def test_methods_source():
+    """Test that methods not prefixed with a source use numpy. statsmodels is used with sm_."""
+    objmethods = Methods(['fdr_bh', 'sm_fdr_bh', 'np_fdr_bh', 'np_holm', 'hommel', 'np_hommel',
+                          'np_holm-sidak'])
+    assert [(nt.source, nt.method, nt.fieldname) for nt in objmethods.methods] == [
+        ('numpy', 'fdr_bh', 'fdr_bh'),
+        ('statsmodels', 'fdr_bh', 'sm_fdr_bh'),
+        ('numpy', 'fdr_bh', 'np_fdr_bh'),
+        ('numpy', 'holm', 'np_holm'),
+        ('numpy', 'hommel', 'hommel'),
+        ('numpy', 'hommel', 'np_hommel'),
+        ('numpy', 'holm-sidak', 'np_holm_sidak')]
+
+def test_hommel():
+    """Test the O(n log n) Hommel correction against statsmodels on more p-values."""
+    prng = np.random.RandomState(11)
+    for num in range(1, 40):
+        for _ in range(20):
+            pvals = np.round(prng.uniform(size=num)**prng.uniform(1, 6), prng.randint(1, 4))
+            _, pvals_corrected, _, _ = multipletests(pvals, 0.05, 'hommel')
+            ntres = MultitestNumpy(pvals, 0.05).run_multitest('hommel')
+            assert np.allclose(ntres.pvals_corrected, pvals_corrected, rtol=1e-12, atol=0)
+
+def _get_pvals_lists(prng):
+    """Return lists of p-values: small, tied, and with many significant p-values."""
+    return [
+        np.array([0.03]),
+        np.array([0.001, 1.0]),
+        prng.uniform(size=50),
+        prng.uniform(size=200)**4,
+        np.round(prng.uniform(size=300)**3, 2),
+        np.concatenate([prng.uniform(0, 1e-4, 90), prng.uniform(size=10)]),
+        np.full(20, 1e-5),
+        np.ones(30),
+    ]
+
+
+if __name__ == '__main__':
+    test_multitest_numpy()
+    test_multitest_numpy_rows()
+    test_methods_source()
+    test_hommel()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
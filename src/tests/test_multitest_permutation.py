@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Test Westfall-Young step-down min-p p-values from random study gene sets."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import numpy as np
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.multiple_testing import Methods
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_multitest_permutation():
+    """Test Westfall-Young step-down min-p p-values from random study gene sets."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    kws = {'methods':['holm', 'wy_minp'], 'pvalcalc':'fisher_logfactorial', 'permutations':60}
+    objrun = EnrichmentRun(pop_ids, assc, **kws)
+    objres = objrun.run_study(stu_ids, 'exgo', None)
+    exp = _get_pvals_minp(objrun, objres)
+    act = np.array([r.multitests.wy_minp for r in objres.results])
+    assert np.array_equal(act, exp)
+    assert (act >= act[np.argmin([r.ntpval.pval_uncorr for r in objres.results])]).all()
+    # Permutations are the same for any chunk size, number of processes, and terms reported
+    for columnar, terms, jobs, max_cells in [(True, 'all', 1, 1 << 22),
+                                             (False, 'all', 2, 20000),
+                                             (True, 'study_hit', 3, 50000),
+                                             (False, 'study_hit', 1, 1)]:
+        objrun = EnrichmentRun(pop_ids, assc, columnar=columnar, permutation_jobs=jobs, **kws)
+        objrun.objmethods.objperm.max_cells = max_cells
+        term2pval = {r.termid:r.multitests.wy_minp
+                     for r in objrun.run_study(stu_ids, 'exgo', None, terms).results}
+        assert term2pval == {r.termid:r.multitests.wy_minp for r in objres.results
+                             if r.termid in term2pval}
+    # Other seeds draw other study gene sets
+    objrun = EnrichmentRun(pop_ids, assc, permutation_seed=1, **kws)
+    act_seed = [r.multitests.wy_minp for r in objrun.run_study(stu_ids, 'exgo', None).results]
+    assert not np.array_equal(act_seed, act)
+    # Permutation methods need an EnrichmentRun
+    try:
+        Methods(['wy_minp']).run_multitest_pvals(np.array([0.01, 0.5]), None)
+        assert False
+    except AssertionError as err:
+        assert 'wy_minp' in str(err)
+
+def _get_pvals_minp(objrun, objres):
+    """Return step-down min-p p-values calculated one permutation and one term at a time."""
+    objperm = objrun.objmethods.objperm
+    index = objrun.index
+    study_tot = objres.study_tot
+    pvals = [r.ntpval.pval_uncorr for r in objres.results]
+    order = sorted(range(len(pvals)), key=lambda i: pvals[i])
+    cnts = [0]*len(pvals)
+    for perm in range(objperm.num_perms):
+        genes = np.random.default_rng([objperm.seed, perm]).choice(
+            len(index.genes), study_tot, replace=False)
+        pvals_perm = objrun.pval_obj.calc_pvalues(
+            index.get_term_cnts(genes).tolist(), study_tot, index.pop_cnts.tolist(),
+            objrun.pop_tot)
+        pval_min = 1.0
+        for pos in reversed(range(len(order))):
+            pval_min = min(pval_min, pvals_perm[order[pos]])
+            if pval_min <= pvals[order[pos]]:
+                cnts[pos] += 1
+    pvals_corr = np.maximum.accumulate(np.array(cnts)/float(objperm.num_perms))
+    pvals_minp = np.empty(len(pvals))
+    pvals_minp[order] = pvals_corr
+    return pvals_minp
+
+
+if __name__ == '__main__':
+    test_multitest_permutation()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Test that running studies in a process pool matches running them serially."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_parallel import run_studies_parallel
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_parallel():
+    """Test that running studies in a process pool matches running them serially."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'],
+                           pvalcalc='fisher_logfactorial')
+    random.seed(5)
+    name2ids = {'exgo': stu_ids, 'empty': set()}
+    for idx in range(4):
+        name2ids['random{I}'.format(I=idx)] = set(random.sample(sorted(objrun.pop_ids), 150))
+    name2res = dict(run_studies_parallel(objrun, name2ids, jobs=2))
+    assert set(name2res) == set(name2ids)
+    assert name2res['empty'] == []
+    for name, study_ids in name2ids.items():
+        if study_ids:
+            objres = name2res[name]
+            objres_serial = objrun.run_study(study_ids, name, log=None)
+            assert objres.study_ids == objres_serial.study_ids
+            assert objres.objearun is objrun
+            assert [str(r) for r in objres.results] == [str(r) for r in objres_serial.results]
+            assert [r.get_nt_prt() for r in objres.results] == \
+                   [r.get_nt_prt() for r in objres_serial.results]
+
+
+if __name__ == '__main__':
+    test_parallel()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Test that the vectorized Fisher's exact tests match scipy.stats.fisher_exact."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import numpy as np
+from enrichmentanalysis.pvalcalc import FisherFactory
+
+
+def test_fisher_vectorized(num_tables=100):
+    """Test that the vectorized Fisher's exact test matches scipy.stats.fisher_exact."""
+    obj_scipy = FisherFactory('fisher_scipy_stats').pval_obj
+    objs_vec = [FisherFactory(nm).pval_obj for nm in ('fisher_vectorized', 'fisher_logfactorial')]
+    rng = np.random.RandomState(1)
+    for _ in range(num_tables):
+        pop_n = rng.randint(2, 40000)
+        study_n = rng.randint(1, min(pop_n, 500))
+        pop_cnts = rng.randint(0, pop_n+1, size=20)
+        study_cnts = [rng.randint(max(0, p - (pop_n - study_n)), min(p, study_n) + 1)
+                      for p in pop_cnts]
+        for obj_vec in objs_vec:
+            _chk_pvals(obj_scipy, obj_vec, study_cnts, study_n, pop_cnts, pop_n)
+    # Edge cases: Empty terms, terms containing every population item, and tiny tables
+    for obj_vec in objs_vec:
+        _chk_pvals(obj_scipy, obj_vec, [0, 3, 3, 1, 0], 3, [0, 3, 7, 1, 3], 7)
+        _chk_pvals(obj_scipy, obj_vec, [8, 3], 10, [9, 9], 16)
+
+def test_pval_memo():
+    """Test that memoized p-values match calculated p-values and that repeats are not rerun."""
+    obj_calc = FisherFactory('fisher_scipy_stats').pval_obj
+    obj_memo = FisherFactory('fisher_scipy_stats').pval_obj
+    obj_memo.set_memo(4)
+    study_cnts = [0, 1, 0, 2, 1, 0]
+    pop_cnts = [5, 9, 5, 9, 9, 7]
+    nts_calc = obj_calc.get_nts(study_cnts, 20, pop_cnts, 100)
+    assert obj_memo.get_nts(study_cnts, 20, pop_cnts, 100) == nts_calc
+    assert obj_memo.memo.get_info() == (2, 4, 4, 4)
+    # A second study of the same size finds all of its p-values in the memo
+    assert obj_memo.get_nts(study_cnts, 20, pop_cnts, 100) == nts_calc
+    assert obj_memo.memo.get_info() == (8, 4, 4, 4)
+    # A different study size is a different contingency signature; the memo stays bounded
+    assert obj_memo.get_nt(1, 21, 9, 100) == obj_calc.get_nt(1, 21, 9, 100)
+    assert obj_memo.memo.get_info() == (8, 5, 4, 4)
+
+def _chk_pvals(obj_a, obj_b, study_cnts, study_n, pop_cnts, pop_n):
+    """Check that two p-value objects return the same p-values."""
+    pvals_a = obj_a.calc_pvalues(study_cnts, study_n, pop_cnts, pop_n)
+    pvals_b = obj_b.calc_pvalues(study_cnts, study_n, pop_cnts, pop_n)
+    assert np.allclose(pvals_a, pvals_b, rtol=1e-8, atol=0), \
+        "STUDY={S}/{SN} POP={P}/{PN}\n{A}\n{B}".format(
+            S=study_cnts, SN=study_n, P=pop_cnts, PN=pop_n, A=pvals_a, B=pvals_b)
+
+
+if __name__ == '__main__':
+    test_fisher_vectorized()
+    test_pval_memo()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Test reading association files one line at a time."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import tempfile
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.file_utils import iter_associations
+
+ASSC = """\
+AAR1	GO:0005575;GO:0006970;GO:0006970;GO:0040029
+18S RRNA	GO:0003735;GO:0006412;GO:0006412
+ACD5 GO:0005575;GO:0008219
+ACL1	GO:0005575
+ACL1    GO:0009965
+ACL1    GO:0009965
+# comment line
+ACL2	GO:0005575;GO:0009826
+AAR1	GO:0009845
+"""
+
+
+def test_read_associations():
+    """Test reading association files one line at a time."""
+    fd_tmp, fin_assc = tempfile.mkstemp(suffix='.assc')
+    with os.fdopen(fd_tmp, 'w') as prt:
+        prt.write(ASSC)
+    try:
+        # Adjacent lines for a gene are merged, duplicate terms removed
+        assert list(iter_associations(fin_assc)) == [
+            ('AAR1', {'GO:0005575', 'GO:0006970', 'GO:0040029'}),
+            ('18S RRNA', {'GO:0003735', 'GO:0006412'}),
+            ('ACD5', {'GO:0005575', 'GO:0008219'}),
+            ('ACL1', {'GO:0005575', 'GO:0009965'}),
+            ('ACL2', {'GO:0005575', 'GO:0009826'}),
+            ('AAR1', {'GO:0009845'})]
+        assert read_associations(fin_assc) == {
+            'AAR1': {'GO:0005575', 'GO:0006970', 'GO:0040029', 'GO:0009845'},
+            '18S RRNA': {'GO:0003735', 'GO:0006412'},
+            'ACD5': {'GO:0005575', 'GO:0008219'},
+            'ACL1': {'GO:0005575', 'GO:0009965'},
+            'ACL2': {'GO:0005575', 'GO:0009826'}}
+        # Only population genes are kept
+        assert read_associations(fin_assc, {'ACL1', 'AAR1', 'NOT_IN_ASSC'}) == {
+            'AAR1': {'GO:0005575', 'GO:0006970', 'GO:0040029', 'GO:0009845'},
+            'ACL1': {'GO:0005575', 'GO:0009965'}}
+    finally:
+        os.remove(fin_assc)
+
+
+if __name__ == '__main__':
+    test_read_associations()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
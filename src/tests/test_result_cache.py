@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Test that cached enrichment results match newly computed results."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import time
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+from enrichmentanalysis.result_cache import ResultCache
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_result_cache():
+    """Test that cached enrichment results match newly computed results."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(5)
+    name2ids = {'exgo':stu_ids, 'random':set(random.sample(sorted(pop_ids), 300))}
+    dir_cache = 'test_result_cache'
+    if os.path.isdir(dir_cache):
+        shutil.rmtree(dir_cache)
+    kws = {'methods':['holm', 'fdr_bh'], 'result_cache':dir_cache}
+    objrun_nocache = EnrichmentRun(pop_ids, assc, methods=kws['methods'])
+    for columnar in [False, True]:
+        for terms in ['all', 'study_hit']:
+            objrun = EnrichmentRun(pop_ids, assc, columnar=columnar, **kws)
+            exp = objrun_nocache.run_study(stu_ids, 'exgo', None, terms)
+            act = objrun.run_study(stu_ids, 'exgo', None, terms)
+            _chk_results(exp, act, columnar)
+            # Cache hits do not calculate p-values
+            objrun.pval_obj.get_pvals = _no_pvals
+            objrun.pval_obj.get_nts = _no_pvals
+            act = objrun.run_study(stu_ids, 'exgo', None, terms)
+            _chk_results(exp, act, columnar)
+            name2res = objrun.run_studies({'exgo':stu_ids}, None, terms)
+            _chk_results(exp, name2res['exgo'], columnar)
+    assert len(_get_files(dir_cache)) == 2
+    # Results of other studies or with other options are not found in the cache
+    for kws_run, ids in [({}, name2ids['random']), ({'alpha':0.01}, stu_ids),
+                         ({'pvalcalc':'fisher_logfactorial'}, stu_ids),
+                         ({'methods':['holm']}, stu_ids)]:
+        objrun = EnrichmentRun(pop_ids, assc, **dict(kws, **kws_run))
+        objrun.run_study(ids, 'other', None)
+        assert (objrun.result_cache.hits, objrun.result_cache.misses) == (0, 1)
+    assert len(_get_files(dir_cache)) == 6
+    # The least recently used results are removed when the cache is over its maximum size
+    num_bytes = max(os.path.getsize(os.path.join(dir_cache, f)) for f in _get_files(dir_cache))
+    time.sleep(0.01)
+    objrun = EnrichmentRun(pop_ids, assc, result_cache_bytes=2*num_bytes, **kws)
+    objrun.run_study(stu_ids, 'exgo', None)
+    objrun.run_study(name2ids['random'], 'random', None)
+    assert (objrun.result_cache.hits, objrun.result_cache.misses) == (2, 0)
+    objrun.result_cache.evict()
+    assert len(_get_files(dir_cache)) == 2
+    objrun.run_study(stu_ids, 'exgo', None)
+    assert objrun.result_cache.hits == 3
+
+def test_result_cache_threads():
+    """Test that many threads can save and load the same results at once."""
+    dir_cache = 'test_result_cache_threads'
+    if os.path.isdir(dir_cache):
+        shutil.rmtree(dir_cache)
+    objcache = ResultCache(dir_cache)
+    arr = np.arange(1000)
+    def _save_load(_):
+        for _ in range(50):
+            objcache.save('key', arr)
+            assert np.array_equal(objcache.load('key'), arr)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(_save_load, range(8)))
+    assert os.listdir(dir_cache) == ['key.npy']
+    shutil.rmtree(dir_cache)
+
+def _chk_results(objres_a, objres_b, columnar):
+    """Check that two sets of enrichment results are the same."""
+    assert isinstance(objres_b.results, EnrichmentColumns) == columnar
+    assert len(objres_a.results) == len(objres_b.results)
+    for rec_a, rec_b in zip(objres_a.results, objres_b.results):
+        assert rec_a.termid == rec_b.termid
+        assert rec_a.ntpval == rec_b.ntpval
+        assert rec_a.multitests == rec_b.multitests
+        assert rec_a.get_nt_prt() == rec_b.get_nt_prt()
+
+def _get_files(dir_cache):
+    """Return the names of the results files in the cache."""
+    return [f for f in os.listdir(dir_cache) if f.endswith('.npy')]
+
+def _no_pvals(*args):
+    """Fail if p-values are calculated."""
+    raise RuntimeError("P-VALUES CALCULATED: {A}".format(A=args))
+
+
+if __name__ == '__main__':
+    test_result_cache()
+    test_result_cache_threads()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Test p-value threshold and top-k queries on enrichment results."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_results_index():
+    """Test p-value threshold and top-k queries on enrichment results."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    methods = ['bonferroni', 'holm', 'fdr_bh', 'fdr_tsbky']
+    for columnar in [False, True]:
+        objrun = EnrichmentRun(pop_ids, assc, methods=methods, columnar=columnar)
+        objres = objrun.run_study(stu_ids, 'exgo', log=None)
+        recs = list(objres.results)
+        get_uncorr = lambda r: r.ntpval.pval_uncorr
+        for field in ['pval_uncorr'] + methods:
+            get_pval = get_uncorr if field == 'pval_uncorr' else \
+                       lambda r, f=field: getattr(r.multitests, f)
+            recs_sorted = sorted(sorted(recs, key=get_uncorr), key=get_pval)
+            # Thresholds
+            for max_pval in [0.0, 1e-4, 0.01, 0.05, 0.5, 1.0, 1.1]:
+                exp = [r for r in recs_sorted if get_pval(r) < max_pval]
+                if field == 'pval_uncorr':
+                    act = objres.get_pvals_uncorr_subset(max_pval)
+                else:
+                    act = objres.get_pvals_corr_subset(max_pval, field)
+                _chk_recs(act, exp)
+                exp = sorted(exp, key=objres.sortby_eaobj)
+                pval_field = None if field == 'pval_uncorr' else field
+                _chk_recs(objres.get_results_cond(max_pval, pval_field), exp)
+                _chk_recs(objres.get_results_cond(max_pval, pval_field, objres.sortby_eaobj), exp)
+            # Top k
+            for k in list(range(60)) + [100, len(recs), len(recs)+5]:
+                top = objres.get_top(k, field)
+                assert len(top) == min(k, len(recs))
+                _chk_recs(top, recs_sorted[:k])
+        _chk_recs(objres.get_results_cond(None, None), sorted(recs, key=objres.sortby_eaobj))
+
+def _chk_recs(recs_act, recs_exp):
+    """Check that two lists of records contain the same terms in the same order."""
+    assert [r.termid for r in recs_act] == [r.termid for r in recs_exp]
+
+
+if __name__ == '__main__':
+    test_results_index()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Test that running many studies at once matches running each study separately."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_run_studies():
+    """Test that running many studies at once matches running each study separately."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    kws = {'methods':['holm', 'fdr_bh', 'sm_fdr_by'], 'pvalcalc':'fisher_logfactorial'}
+    random.seed(3)
+    pop_assc = sorted(pop_ids.intersection(assc))
+    name2ids = {
+        'exgo': stu_ids,
+        'half': set(random.sample(sorted(stu_ids), 130)),
+        'random': set(random.sample(pop_assc, 200)),
+        'empty': set(),
+        'small': set(random.sample(pop_assc, 3)),
+        'not_in_pop': {'NOT_AN_ID'},
+    }
+    for columnar in [False, True]:
+        objrun = EnrichmentRun(pop_ids, assc, columnar=columnar, **kws)
+        # Studies are run in chunks of two studies
+        objrun.max_cells = 2*len(objrun.index.terms)
+        # No p-values are shared through the p-value memo
+        objrun_study = EnrichmentRun(pop_ids, assc, columnar=columnar, pval_memo=0, **kws)
+        for terms in ['all', 'study_hit']:
+            name2res = objrun.run_studies(name2ids, log=None, terms=terms)
+            assert list(name2res) == list(name2ids)
+            assert name2res['empty'] == []
+            for name in ['exgo', 'half', 'random', 'small', 'not_in_pop']:
+                _chk_results(name2res[name],
+                             objrun_study.run_study(name2ids[name], name, None, terms))
+
+def _chk_results(objres_a, objres_b):
+    """Check that two sets of enrichment results are the same."""
+    assert objres_a.study_ids == objres_b.study_ids
+    term2rec = {r.termid:r for r in objres_b.results}
+    assert len(objres_a.results) == len(term2rec)
+    assert isinstance(objres_a.results, list) == isinstance(objres_b.results, list)
+    for rec in objres_a.results:
+        rec_b = term2rec[rec.termid]
+        assert rec.ntpval == rec_b.ntpval
+        assert rec.multitests == rec_b.multitests
+        assert rec.stu_items == rec_b.stu_items
+        assert rec.pop_items == rec_b.pop_items
+
+
+if __name__ == '__main__':
+    test_run_studies()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Test that an enrichment server returns the same results as running the studies directly."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.server import EnrichmentServer
+from enrichmentanalysis.server import EnrichmentClient
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_server():
+    """Test that an enrichment server returns the same results as running the studies directly."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(7)
+    name2ids = {'exgo':stu_ids}
+    for idx in range(7):
+        name2ids['random{I}'.format(I=idx)] = set(random.sample(sorted(pop_ids), 50 + 25*idx))
+    name2objrun = {
+        'exgo':EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh']),
+        'exgo_columnar':EnrichmentRun(pop_ids, assc, methods=['fdr_bh'], columnar=True),
+    }
+    fsock = 'test_server.sock'
+    if os.path.exists(fsock):
+        os.remove(fsock)
+    for address in [('127.0.0.1', 0), fsock]:
+        objsrv = EnrichmentServer(name2objrun, jobs=4)
+        objsrv.get_httpd(address)
+        thread = threading.Thread(target=objsrv.serve_forever)
+        thread.start()
+        try:
+            _chk_server(EnrichmentClient(objsrv.httpd.server_address, timeout=60),
+                        name2objrun, name2ids)
+        finally:
+            objsrv.shutdown()
+            thread.join()
+    assert not os.path.exists(fsock)
+
+def _chk_server(client, name2objrun, name2ids):
+    """Check the results of studies sent to the server at the same time."""
+    runs = client.get_runs()
+    assert set(runs) == set(name2objrun)
+    assert runs['exgo']['methods'] == ['holm', 'fdr_bh']
+    # All results of one study; results under a p-value of the others
+    queries = [(run, name, None if name == 'exgo' else 0.05)
+               for run in name2objrun for name in name2ids]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(client.run_study, name2ids[name], run, name, pval=pval)
+                   for run, name, pval in queries]
+        for (run, name, pval), future in zip(queries, futures):
+            act = future.result()
+            objres = name2objrun[run].run_study(name2ids[name], name, None)
+            assert act['name'] == name
+            assert act['study_tot'] == objres.study_tot
+            # Compare values as they are after a round trip through JSON
+            exp = [rec.get_nt_prt()._asdict() for rec in objres.get_results_cond(pval, None)]
+            assert act['results'] == json.loads(json.dumps(exp))
+    # Bad requests
+    for ids, kws in [(name2ids['exgo'], {'run':'missing'}),
+                     (name2ids['exgo'], {'run':None}),
+                     (name2ids['exgo'], {'pval_field':'missing'}),
+                     (name2ids['exgo'], {'pval':'0.05'}),
+                     ([[1]], {}),
+                     ([{'id':1}], {})]:
+        try:
+            client.run_study(ids, **kws)
+            assert False, kws
+        except ValueError as err:
+            assert str(err).startswith('400'), err
+
+
+if __name__ == '__main__':
+    test_server()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
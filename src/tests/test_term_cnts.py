@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Test that all options for counting study hits per term return the same counts."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import random
+from enrichmentanalysis.enrich_index import EnrichmentIndex
+from enrichmentanalysis.enrich_index import COUNTERS
+from enrichmentanalysis.enrich_index import get_term_counter
+
+
+def test_term_cnts(num_genes=300, num_terms=40):
+    """Test that all options for counting study hits per term return the same counts."""
+    random.seed(7)
+    terms = ['T{N:02}'.format(N=n) for n in range(num_terms)]
+    assc = {'G{N:03}'.format(N=n):set(random.sample(terms, random.randint(1, 6)))
+            for n in range(num_genes)}
+    index = EnrichmentIndex(assc.items())
+    assert index.get_assc() == assc
+    counters = [get_term_counter(name, index) for name in COUNTERS]
+    for study_n in [0, 1, 2, 63, 64, 65, 150, num_genes]:
+        study = set(random.sample(sorted(assc), study_n))
+        gene_idxs = index.get_gene_idxs(study | {'NOT_IN_POPULATION'})
+        exp = [sum(t in assc[g] for g in study) for t in index.terms]
+        for counter in counters:
+            assert list(counter.get_term_cnts(gene_idxs)) == exp
+
+
+if __name__ == '__main__':
+    test_term_cnts()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Test reporting only terms with study hits while correcting for all population terms."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_terms_study_hit():
+    """Test reporting only terms with study hits while correcting for all population terms."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    objrun = EnrichmentRun(pop_ids, assc, methods=['bonferroni', 'holm', 'fdr_bh'],
+                           pvalcalc='fisher_logfactorial')
+    res_all = objrun.run_study(stu_ids, 'all', log=None).results
+    res_hit = objrun.run_study(stu_ids, 'study_hit', log=None, terms='study_hit').results
+    term2rec = {r.termid:r for r in res_all}
+    assert len(res_hit) == sum(r.ntpval.study_cnt != 0 for r in res_all)
+    assert len(res_hit) < len(res_all)
+    for rec in res_hit:
+        rec_all = term2rec[rec.termid]
+        assert rec.ntpval == rec_all.ntpval
+        assert rec.multitests == rec_all.multitests, '{T}: {A} {B}'.format(
+            T=rec.termid, A=rec.multitests, B=rec_all.multitests)
+
+
+if __name__ == '__main__':
+    test_terms_study_hit()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Test that updating a study's results gives the same results as rerunning the study."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import random
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.enrich_columns import EnrichmentColumns
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_update_study():
+    """Test that updating a study's results gives the same results as rerunning the study."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(13)
+    # Population IDs which are in the association, so swapping IDs keeps the study size
+    pop_assc = pop_ids.intersection(assc)
+    others = sorted(pop_assc.difference(stu_ids))
+    stu_lst = sorted(pop_assc.intersection(stu_ids))
+    # (added, removed, change in study size): IDs not in the population or study are ignored
+    updates = [
+        (random.sample(others, 5), [], 5),
+        ([], random.sample(stu_lst, 5), -5),
+        (random.sample(others, 3), random.sample(stu_lst, 3), 0),
+        (['NOT_IN_POPULATION'] + random.sample(stu_lst, 2), ['NOT_IN_STUDY'], 0),
+        (random.sample(others, 2), [], 2),
+    ]
+    for columnar in [False, True]:
+        objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'], columnar=columnar)
+        for terms in ['all', 'study_hit']:
+            objres = objrun.run_study(stu_ids, 'exgo', None, terms)
+            study_ids = set(stu_ids)
+            for added, removed, num in updates:
+                study_tot = objres.study_tot
+                objres.update(added, removed)
+                assert objres.study_tot == study_tot + num
+                study_ids = study_ids.union(added).difference(removed)
+                exp = objrun.run_study(study_ids, 'exgo', None, terms)
+                _chk_results(exp, objres, columnar)
+            # Both added and removed: The study ID is removed
+            gene = others[0]
+            objres.update([gene], [gene])
+            assert gene not in objres.study_ids
+            _chk_results(objrun.run_study(objres.study_ids, 'exgo', None, terms), objres, columnar)
+
+def _chk_results(objres_exp, objres_act, columnar):
+    """Check that two sets of enrichment results are the same."""
+    assert objres_act.study_ids == objres_exp.study_ids
+    assert objres_act.study_tot == objres_exp.study_tot
+    assert isinstance(objres_act.results, EnrichmentColumns) == columnar
+    recs_exp = objres_exp.get_results_cond(None, None)
+    recs_act = objres_act.get_results_cond(None, None)
+    assert len(recs_act) == len(recs_exp)
+    for rec_exp, rec_act in zip(recs_exp, recs_act):
+        assert rec_act.termid == rec_exp.termid
+        assert rec_act.ntpval == rec_exp.ntpval
+        assert rec_act.multitests == rec_exp.multitests
+        assert rec_act.get_nt_prt() == rec_exp.get_nt_prt()
+    # Sorted p-values are recreated after an update
+    assert [r.termid for r in objres_act.get_results_cond(0.05, 'fdr_bh')] == \
+        [r.termid for r in objres_exp.get_results_cond(0.05, 'fdr_bh')]
+
+
+if __name__ == '__main__':
+    test_update_study()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Test writing enrichment results into Parquet files as typed Arrow columns."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import sys
+import collections as cx
+import random
+import shutil
+import tempfile
+import subprocess
+import pytest
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_parquet import wr_results_parquet
+from enrichmentanalysis.wr_parquet import wr_studies_parquet
+
+PQ = pytest.importorskip('pyarrow.parquet')
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_wr_parquet():
+    """Test writing enrichment results into Parquet files as typed Arrow columns."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    random.seed(3)
+    name2ids = {'exgo':stu_ids, 'random':set(random.sample(sorted(pop_ids), 300))}
+    for columnar in [False, True]:
+        objrun = EnrichmentRun(pop_ids, assc, methods=['holm', 'fdr_bh'], columnar=columnar)
+        objres = objrun.run_study(stu_ids, 'exgo', log=None)
+        fields = objrun.objmethods.get_fields().split()
+        # All results, from records
+        recs = objres.get_results_cond(None, None)
+        ReportResults(recs).wrparquet('test_wr_parquet_a.parquet')
+        table = PQ.read_table('test_wr_parquet_a.parquet')
+        assert table.column_names == list(recs[0].flds) + fields + ['stu_items']
+        assert str(table.schema.field('stu_num').type) == 'int64'
+        assert str(table.schema.field('fdr_bh').type) == 'double'
+        assert str(table.schema.field('stu_items').type) == 'list<element: string>'
+        _chk_table(table.to_pydict(), recs, fields)
+        # Results under a p-value, from EnrichmentResults
+        wr_results_parquet('test_wr_parquet_b.parquet', objres, 0.05, 'fdr_bh', study='exgo')
+        table = PQ.read_table('test_wr_parquet_b.parquet').to_pydict()
+        assert set(table['study']) == {'exgo'}
+        _chk_table(table, objres.get_results_cond(0.05, 'fdr_bh'), fields)
+        # Many studies in one file
+        name2res = objrun.run_studies(name2ids, None)
+        wr_studies_parquet('test_wr_parquet_c.parquet', name2res.items())
+        table = PQ.read_table('test_wr_parquet_c.parquet').to_pydict()
+        assert table['study'] == [n for n, o in name2res.items() for _ in o.results]
+        recs = [r for o in name2res.values() for r in o.get_results_cond(None, None)]
+        _chk_table(table, recs, fields)
+
+def test_wr_parquet_jobs():
+    """Test that run_enrichment.py writes Parquet rows in study file order for any jobs."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    dir_tmp = tempfile.mkdtemp()
+    try:
+        # The first study is the largest, so it is likely to finish last when run in parallel
+        random.seed(7)
+        fin_studies = []
+        for num in [2000, 300, 20, 100]:
+            fin_study = os.path.join(dir_tmp, 'study{N}'.format(N=num))
+            with open(fin_study, 'w') as prt:
+                prt.write('\n'.join(random.sample(sorted(pop_ids), min(num, len(pop_ids)))))
+            fin_studies.append(fin_study)
+        # Term order follows set iteration order, so both runs use the same string hashes
+        env = dict(os.environ, PYTHONPATH=os.path.join(REPO, 'src'), PYTHONHASHSEED='0')
+        tables = []
+        for jobs in ['1', '2']:
+            fout_pq = 'jobs{J}.parquet'.format(J=jobs)
+            subprocess.run(
+                [sys.executable, os.path.join(REPO, 'src/bin/run_enrichment.py'),
+                 ','.join(fin_studies), os.path.join(REPO, 'data/exgo/population'),
+                 os.path.join(REPO, 'data/exgo/association'),
+                 '--pvalcalc=fisher_logfactorial', '--jobs=' + jobs, '--parquet=' + fout_pq],
+                cwd=dir_tmp, env=env, stdout=subprocess.DEVNULL, check=True)
+            tables.append(PQ.read_table(os.path.join(dir_tmp, fout_pq)).to_pydict())
+        studies = [os.path.basename(f) for f in fin_studies]
+        assert list(cx.OrderedDict.fromkeys(tables[0]['study'])) == studies
+        assert tables[0] == tables[1]
+    finally:
+        shutil.rmtree(dir_tmp)
+
+def _chk_table(table, recs, fields):
+    """Check that the columns of a table contain the values in the records."""
+    assert table['TermID'] == [r.termid for r in recs]
+    assert table['enrichment'] == [r.ntpval.enrichment for r in recs]
+    assert table['stu_num'] == [r.ntpval.study_cnt for r in recs]
+    assert table['stu_tot'] == [r.ntpval.study_tot for r in recs]
+    assert table['pop_ratio'] == [r.ntpval.pop_ratio for r in recs]
+    assert table['pval_uncorr'] == [r.ntpval.pval_uncorr for r in recs]
+    for fld in fields:
+        assert table[fld] == [getattr(r.multitests, fld) for r in recs]
+    assert table['stu_items'] == [sorted(r.stu_items) for r in recs]
+
+
+if __name__ == '__main__':
+    test_wr_parquet()
+    test_wr_parquet_jobs()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Test that results written a batch at a time match results written by ReportResults."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import io
+import sys
+import gzip
+import shutil
+import tempfile
+import subprocess
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_results import wr_results_tsv
+from enrichmentanalysis.wr_results import wr_results_csv
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+
+def test_wr_results():
+    """Test that results written a batch at a time match results written by ReportResults."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    kws = {'methods':['holm', 'fdr_bh', 'sm_fdr_by']}
+    for columnar in [False, True]:
+        objres = EnrichmentRun(pop_ids, assc, columnar=columnar, **kws).run_study(
+            stu_ids, 'exgo', log=None)
+        for max_pval, pval_field in [(None, None), (0.05, None), (0.05, 'fdr_bh')]:
+            objrpt = ReportResults(objres.get_results_cond(max_pval, pval_field))
+            objrpt.wrtsv('test_wr_results_a.tsv')
+            objrpt.wrcsv('test_wr_results_a.csv')
+            # A small batchsize writes the rows in many batches
+            kws_wr = {'batchsize':100}
+            wr_results_tsv('test_wr_results_b.tsv', objres, max_pval, pval_field, **kws_wr)
+            wr_results_csv('test_wr_results_b.csv', objres, max_pval, pval_field, **kws_wr)
+            wr_results_tsv('test_wr_results_b.tsv.gz', objres, max_pval, pval_field)
+            txt = _read('test_wr_results_a.tsv')
+            assert txt == _read('test_wr_results_b.tsv')
+            assert _read('test_wr_results_a.csv') == _read('test_wr_results_b.csv')
+            with gzip.open('test_wr_results_b.tsv.gz', 'rt') as ifstrm:
+                assert ifstrm.read() == txt
+            assert _get_stdout(objres, max_pval, pval_field) == txt
+    # No results under the p-value: no file is written
+    assert wr_results_tsv('test_wr_results_c.tsv', objres, 0.0, None) == 0
+    assert not os.path.exists('test_wr_results_c.tsv')
+
+def test_wr_results_stdout():
+    """Test that run_enrichment.py writes only the table to stdout when writing to '-'."""
+    dir_tmp = tempfile.mkdtemp()
+    try:
+        for opt, fout in [('--tsv', 'exgo.tsv'), ('--csv', 'exgo.csv')]:
+            opts = ['--pval=0.01', '--pvalcalc=fisher_logfactorial']
+            txt = _run_bin(['{O}=-'.format(O=opt)] + opts, dir_tmp).stdout
+            proc = _run_bin(['{O}={F}'.format(O=opt, F=fout)] + opts, dir_tmp)
+            assert txt == _read(os.path.join(dir_tmp, fout)), txt
+            assert 'WROTE' in proc.stdout
+        # No results under the p-value: The message is written to stderr
+        proc = _run_bin(['--tsv=-', '--pval=0.0'], dir_tmp)
+        assert proc.stdout == ''
+        assert 'NOT WRITING -' in proc.stderr
+    finally:
+        shutil.rmtree(dir_tmp)
+
+def _run_bin(opts, cwd):
+    """Run run_enrichment.py on the exgo data. Return the completed process."""
+    args = [sys.executable, os.path.join(REPO, 'src/bin/run_enrichment.py')]
+    args += [os.path.join(REPO, 'data/exgo', f) for f in ['study', 'population', 'association']]
+    # Ties are in set iteration order, so all runs use the same string hashes
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO, 'src'), PYTHONHASHSEED='0')
+    return subprocess.run(args + opts, cwd=cwd, env=env, check=True, universal_newlines=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def _get_stdout(objres, max_pval, pval_field):
+    """Return the text written to stdout."""
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        wr_results_tsv('-', objres, max_pval, pval_field)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+def _read(fin):
+    """Return the text in a file."""
+    with open(fin) as ifstrm:
+        return ifstrm.read()
+
+
+if __name__ == '__main__':
+    test_wr_results()
+    test_wr_results_stdout()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.
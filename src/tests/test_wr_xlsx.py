@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Test writing xlsx files in constant memory and splitting rows across worksheets."""
+
+__copyright__ = "Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved."
+__author__ = "DV Klopfenstein"
+
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from enrichmentanalysis.file_utils import read_ids
+from enrichmentanalysis.file_utils import read_associations
+from enrichmentanalysis.enrich_run import EnrichmentRun
+from enrichmentanalysis.report_results import ReportResults
+from enrichmentanalysis.wr_results import wr_results_xlsx
+from enrichmentanalysis.wr_tbl import wr_xlsx_sections
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def test_wr_xlsx():
+    """Test writing xlsx files in constant memory and splitting rows across worksheets."""
+    pop_ids = read_ids(os.path.join(REPO, 'data/exgo/population'))['ids']
+    assc = read_associations(os.path.join(REPO, 'data/exgo/association'))
+    stu_ids = read_ids(os.path.join(REPO, 'data/exgo/study'))['ids']
+    for columnar in [False, True]:
+        objres = EnrichmentRun(pop_ids, assc, columnar=columnar).run_study(
+            stu_ids, 'exgo', log=None)
+        objrpt = ReportResults(objres.get_results_cond(None, None))
+        objrpt.wrxlsx('test_wr_xlsx_a.xlsx', constant_memory=False)
+        sheets_a = _read_xlsx('test_wr_xlsx_a.xlsx')
+        assert len(sheets_a) == 1
+        hdr = sheets_a[0][0]
+        assert hdr[:2] == ['enrichment', 'TermID'] and len(sheets_a[0]) == len(objres.results) + 1
+        # Rows written in constant memory from an iterator of records
+        wr_results_xlsx('test_wr_xlsx_b.xlsx', objres)
+        assert _read_xlsx('test_wr_xlsx_b.xlsx') == sheets_a
+        # Rows continue on new worksheets, each starting with the headers
+        wr_results_xlsx('test_wr_xlsx_c.xlsx', objres, max_rows=1000)
+        sheets_c = _read_xlsx('test_wr_xlsx_c.xlsx')
+        assert len(sheets_c) == 4
+        assert all(s[0] == hdr for s in sheets_c)
+        assert all(len(s) == 1000 for s in sheets_c[:-1])
+        assert [r for s in sheets_c for r in s[1:]] == sheets_a[0][1:]
+    # Sections which do not fit continue on a new worksheet
+    nts = objrpt.get_nts()
+    wr_xlsx_sections('test_wr_xlsx_d.xlsx', [('A', nts[:600]), ('B', nts[600:1200])],
+                     max_rows=1000, constant_memory=True)
+    sheets_d = _read_xlsx('test_wr_xlsx_d.xlsx')
+    assert len(sheets_d) == 2
+    assert [r for s in sheets_d for r in s if r[0] not in ('A', 'B', 'enrichment')] == \
+           sheets_a[0][1:1201]
+
+def _read_xlsx(fin_xlsx):
+    """Return the cell text in each worksheet, as lists of rows."""
+    with zipfile.ZipFile(fin_xlsx) as zfile:
+        names = zfile.namelist()
+        strs = []
+        if 'xl/sharedStrings.xml' in names:
+            root = ET.fromstring(zfile.read('xl/sharedStrings.xml'))
+            strs = [''.join(t.text or '' for t in si.iter(NS + 't')) for si in root]
+        fins = sorted((n for n in names if n.startswith('xl/worksheets/sheet')),
+                      key=lambda n: int(n[19:-4]))
+        return [_read_sheet(ET.fromstring(zfile.read(n)), strs) for n in fins]
+
+def _read_sheet(root, strs):
+    """Return the text of the non-empty cells in each row of a worksheet."""
+    rows = []
+    for row in root.iter(NS + 'row'):
+        vals = []
+        for cell in row.iter(NS + 'c'):
+            if cell.get('t') == 's':
+                vals.append(strs[int(cell.find(NS + 'v').text)])
+            elif cell.get('t') == 'inlineStr':
+                vals.append(''.join(t.text or '' for t in cell.iter(NS + 't')))
+            elif cell.find(NS + 'v') is not None:
+                vals.append(cell.find(NS + 'v').text)
+        rows.append(vals)
+    return rows
+
+
+if __name__ == '__main__':
+    test_wr_xlsx()
+
+# Copyright (C) 2018-2019, DV Klopfenstein. All rights reserved.